@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# coding: utf-8
+r'''
+ Non-interactive post-processing of many VASP calculation directories
+
+ Each analysis takes the directory and the options, writes its data
+ files into the directory and returns a dict of summary values. The
+ directories are processed in a process pool, the errors are captured
+ per directory and reported in the summary table.
+'''
+import os
+import glob
+import traceback
+import numpy as np
+from multiprocessing import Pool
+from maptool.util.utils import write_col_data
+from maptool.core.selection import parse_selection, element_groups, layer_groups
+from maptool.code.vasp.output_cache import load_vasprun
+from maptool.code.vasp.vasprun import sum_pdos
+from maptool.core.optics import optical_spectra, spectra_table, kramers_kronig_error
+from maptool.core.aimd import msd, block_diffusion, arrhenius_fit
+from maptool.code.vasp.trajectory import read_trajectory
+
+SUMMARY_FILE = 'batch_summary.dat'
+
+
+def _spin_suffix(vsr):
+    return ['_Up', '_Down'] if vsr.is_spin else ['']
+
+
+def batch_tdos(path, options):
+    """
+    Write TDOS.dat and IDOS.dat, energies relative to the Fermi level
+    """
+    vsr = load_vasprun(os.path.join(path, 'vasprun.xml'), parse_tdos=True,
+                       final_structure=False, use_cache=options.get('use_cache', True))
+    energies = vsr.tdos_energies - vsr.efermi
+    nspin = len(_spin_suffix(vsr))
+    for (name, data) in [('TDOS', vsr.tdos), ('IDOS', vsr.idos)]:
+        head_line = "#%12s" % 'Energy(ev)' + "".join(["%12s" % (name + suffix) for suffix in
+                                                      _spin_suffix(vsr)])
+        write_col_data(os.path.join(path, name + '.dat'),
+                       np.vstack((energies, data[:nspin])).T, head_line)
+    return {'efermi': vsr.efermi, 'ispin': vsr.parameters.get('ISPIN', 1)}
+
+
+def batch_gap(path, options):
+    """
+    Band gap from the eigenvalues and the occupations
+    """
+    vsr = load_vasprun(os.path.join(path, 'vasprun.xml'), parse_eigen=True,
+                       final_structure=False, use_cache=options.get('use_cache', True))
+    (gap, cbm, vbm, is_direct) = vsr.eigenvalue_band_properties()
+    return {'gap': gap, 'vbm': vbm, 'cbm': cbm, 'direct': is_direct}
+
+
+def pdos_groups(struct, spec):
+    """
+    Atom groups of the projected DOS
+
+    Args:
+        struct (Structure)
+        spec (str): 'element', 'layer', 'layer c 0.5' (direction and
+                    tolerance in Angstrom), or selection strings of
+                    `atom_selection` separated by ';'
+
+    Returns:
+        (list of str, list of list of int): labels and atom index
+    """
+    toks = spec.split()
+    if toks[0] == 'element':
+        return element_groups(struct)
+    elif toks[0] == 'layer':
+        axis = 'abc'.index(toks[1]) if len(toks) > 1 else 2
+        tol = float(toks[2]) if len(toks) > 2 else 0.5
+        return layer_groups(struct, axis=axis, tol=tol)
+    selections = [ii.strip() for ii in spec.split(';') if ii.strip()]
+    labels = ['G' + str(ii + 1) for ii in range(len(selections))]
+    return labels, [parse_selection(ii, struct) for ii in selections]
+
+
+def batch_pdos(path, options):
+    """
+    Write PDOS_<group>[_Up|_Down].dat for all the groups of
+    options['pdos_groups'], see `pdos_groups`
+    """
+    filename = os.path.join(path, 'vasprun.xml')
+    use_cache = options.get('use_cache', True)
+    struct = load_vasprun(filename, final_structure=False, use_cache=use_cache).initial_structure
+    (labels, groups) = pdos_groups(struct, options.get('pdos_groups', 'element'))
+    atom_index = sorted(set([atom for group in groups for atom in group]))
+    if len(atom_index) == 0:
+        raise RuntimeError("No atoms selected")
+    vsr = load_vasprun(filename, parse_tdos=True, parse_pdos=True, pdos_atoms=atom_index,
+                       final_structure=False, use_cache=use_cache)
+    energies = vsr.tdos_energies - vsr.efermi
+    contrib = sum_pdos(vsr.pdos, vsr.pdos_atoms, groups)
+    head_line2 = "#%12s" % 'Energy(ev)' + "".join(["%12s" % orbital for orbital in vsr.pdos_orbitals])
+    for (igroup, group) in enumerate(groups):
+        head_line1 = '#Selected atom: ' + ' '.join([str(x + 1) for x in group]) + '\n'
+        for (ispin, suffix) in enumerate(_spin_suffix(vsr)):
+            write_col_data(os.path.join(path, "PDOS_" + labels[igroup] + suffix + ".dat"),
+                           np.vstack((energies, contrib[igroup, ispin])).T,
+                           head_line1 + head_line2)
+    return {'groups': len(groups)}
+
+
+def batch_optics(path, options):
+    """
+    Write all the optical spectra to OPTICS.dat, the summary contains
+    the static dielectric constant and the Kramers-Kronig deviation of
+    the diagonal components
+    """
+    vsr = load_vasprun(os.path.join(path, 'vasprun.xml'), parse_dielectric=True,
+                       final_structure=False, use_cache=options.get('use_cache', True))
+    if vsr.dielectric_real is None or vsr.dielectric_imag is None:
+        raise RuntimeError("No dielectric function in vasprun.xml")
+    (energy, real, imag) = vsr.dielectric
+    (data, labels) = spectra_table(energy, optical_spectra(energy, real, imag))
+    write_col_data(os.path.join(path, 'OPTICS.dat'), data,
+                   "#" + "".join(["%15s" % label for label in labels]), e_fmt=True)
+    error = kramers_kronig_error(energy, real, imag)
+    return {'eps0': np.mean(real[0, :3]), 'kk_error': np.max(error[:3])}
+
+
+def batch_diffusion(path, options):
+    """
+    Write the MSD of each element to MSD.dat, the summary contains the
+    temperature and the block averaged diffusion coefficients (cm^2/s).
+    The time between two frames is POTIM*NBLOCK of vasprun.xml unless
+    options['timestep'] (fs) is given, the temperature is TEBEG or
+    options['temperature']. options['start'] frames are skipped for the
+    equilibration.
+    """
+    parameters = {}
+    filename = os.path.join(path, 'vasprun.xml')
+    if os.path.isfile(filename):
+        parameters = load_vasprun(filename, final_structure=False,
+                                  use_cache=options.get('use_cache', True)).parameters
+    timestep = options.get('timestep') or \
+        parameters.get('POTIM', 1.0) * parameters.get('NBLOCK', 1)
+    traj = read_trajectory(os.path.join(path, options.get('trajectory', 'XDATCAR')),
+                           start=options.get('start', 0))
+    (data, _, elements) = msd(traj.positions, traj.lattices, traj.species)
+    head_line = "#%12s" % 'Time(fs)' + "".join(["%12s" % element for element in elements])
+    write_col_data(os.path.join(path, 'MSD.dat'),
+                   np.hstack((timestep * np.arange(len(data))[:, None], data)), head_line)
+    (values, errors, elements) = block_diffusion(traj.positions, traj.lattices, traj.species,
+                                                 timestep, nblocks=options.get('nblocks', 5))
+    ret = {'T': parameters.get('TEBEG', options.get('temperature', 0.0))}
+    for (element, value, error) in zip(elements, values, errors):
+        ret['D_' + element] = '%.3e' % value
+        ret['D_' + element + '_err'] = '%.1e' % error
+    return ret
+
+
+def diffusion_arrhenius(results):
+    """
+    Arrhenius fit of the diffusion coefficients of `run_batch` over the
+    temperatures of the directories
+
+    Returns:
+        dict: element -> (Ea (eV), D0 (cm^2/s), error of Ea), only the
+              elements with at least two temperatures
+    """
+    ret = {}
+    keys = sorted(set([key for result in results for key in result
+                       if key.startswith('diffusion:D_') and not key.endswith('_err')]))
+    for key in keys:
+        data = [(float(result['diffusion:T']), float(result[key])) for result in results
+                if key in result and float(result[key]) > 0]
+        if len(set([ii[0] for ii in data])) > 1:
+            ret[key[len('diffusion:D_'):]] = arrhenius_fit(*zip(*data))
+    return ret
+
+
+ANALYSES = {'tdos': batch_tdos,
+            'gap': batch_gap,
+            'pdos': batch_pdos,
+            'optics': batch_optics,
+            'diffusion': batch_diffusion}
+
+
+def _run_directory(args):
+    (path, analyses, options) = args
+    result = {'directory': path, 'status': 'ok', 'error': ''}
+    for name in analyses:
+        try:
+            ret = ANALYSES[name](path, options)
+            for key in ret:
+                result[name + ':' + key] = ret[key]
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] += '%s: %s; ' % (name, repr(e))
+            if options.get('traceback', False):
+                traceback.print_exc()
+    return result
+
+
+def expand_directories(patterns):
+    """
+    Directories matching a list of glob patterns, in sorted order
+    """
+    if isinstance(patterns, str):
+        patterns = patterns.split()
+    directories = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if os.path.isdir(path) and path not in directories:
+                directories.append(path)
+    return directories
+
+
+def run_batch(directories, analyses=['tdos', 'gap'], nproc=None, **options):
+    """
+    Run the analyses over the directories in a process pool
+
+    Args:
+        directories (list of str or str): directories or glob patterns
+        analyses (list of str): keys of ANALYSES
+        nproc (int): number of processes, the number of cpus by default
+        options: passed to the analyses, i.e. pdos_groups, use_cache,
+                 timestep
+
+    Returns:
+        list of dict: one summary per directory with the keys
+                      'directory', 'status', 'error' and
+                      '<analysis>:<quantity>'
+    """
+    for name in analyses:
+        if name not in ANALYSES:
+            raise RuntimeError("Unknown analysis: %s, supported: %s" %
+                               (name, ' '.join(sorted(ANALYSES.keys()))))
+    directories = expand_directories(directories)
+    tasks = [(path, analyses, options) for path in directories]
+    if nproc == 1 or len(tasks) <= 1:
+        return [_run_directory(task) for task in tasks]
+    pool = Pool(processes=nproc)
+    try:
+        return pool.map(_run_directory, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def format_summary(results):
+    """
+    Summary table of `run_batch`, one line per directory
+    """
+    keys = []
+    for result in results:
+        for key in result:
+            if key not in ['directory', 'status', 'error'] and key not in keys:
+                keys.append(key)
+    columns = ['directory', 'status'] + keys + ['error']
+    rows = []
+    for result in results:
+        row = []
+        for key in columns:
+            value = result.get(key, '-')
+            if isinstance(value, (float, np.floating)):
+                value = '%.4f' % value
+            row.append(str(value))
+        rows.append(row)
+    widths = [max([len(key)] + [len(row[i]) for row in rows]) for (i, key) in enumerate(columns)]
+    lines = ['#' + '  '.join([key.rjust(widths[i]) for (i, key) in enumerate(columns)])]
+    for row in rows:
+        lines.append(' ' + '  '.join([value.rjust(widths[i]) for (i, value) in enumerate(row)]))
+    return '\n'.join(lines) + '\n'
+
+
+def write_summary(results, filename=SUMMARY_FILE):
+    write_col_data(filename, format_summary(results), '', str_data=True)
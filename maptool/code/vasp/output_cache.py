@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# coding: utf-8
+r'''
+ Cache of the parsed VASP output files shared by the vaspout commands
+
+ The parsed data of `filename` is stored in `filename + CACHE_SUFFIX`,
+ the same sidecar directory as the volumetric cache. The directory
+ contains
+
+   meta.json  : version, kind, stamp of the source, names of the arrays
+                and the json serializable data
+   <key>.npy  : one file per numpy array, opened with mmap so that only
+                the requested arrays are read
+
+ The cache is rebuilt if the version, the kind or the stamp (path, size
+ and modification time) of the source does not match.
+'''
+import os
+import json
+import shutil
+import numpy as np
+from pymatgen.io.vasp import Outcar
+from maptool.code.vasp.volumetric import CACHE_SUFFIX, _source_stamp
+from maptool.code.vasp.vasprun import LazyVasprun, SECTION_ARRAYS
+from maptool.code.vasp.procar import ProcarData
+
+OUTPUT_CACHE_VERSION = 2
+
+
+def _read_meta(filename, kind):
+    meta_file = os.path.join(filename + CACHE_SUFFIX, 'meta.json')
+    if not os.path.isfile(meta_file):
+        return None
+    try:
+        with open(meta_file) as fp:
+            meta = json.load(fp)
+    except ValueError:
+        return None
+    if meta.get('version') != OUTPUT_CACHE_VERSION or \
+       meta.get('kind') != kind or \
+       meta.get('source') != _source_stamp(filename):
+        return None
+    return meta
+
+
+def read_output_cache(filename, kind, keys=None):
+    """
+    Read the cached data of a VASP output file.
+
+    Args:
+        filename (str): path of the output file
+        kind (str): name of the parser, e.g. 'vasprun', 'procar'
+        keys (list of str): names of the arrays to open, all the arrays
+                            if None, the missing ones are skipped
+
+    Returns:
+        (dict, dict): json data and read-only memory-mapped arrays, None
+                      if there is no valid cache
+    """
+    meta = _read_meta(filename, kind)
+    if meta is None:
+        return None
+    cache_dir = filename + CACHE_SUFFIX
+    names = meta['arrays'] if keys is None else [key for key in keys if key in meta['arrays']]
+    arrays = dict([(key, np.load(os.path.join(cache_dir, key + '.npy'), mmap_mode='r'))
+                   for key in names])
+    # the modification time of meta.json records the last usage
+    os.utime(os.path.join(cache_dir, 'meta.json'))
+    return meta['data'], arrays
+
+
+def write_output_cache(filename, kind, data, arrays, update=False):
+    """
+    Write the parsed data of a VASP output file to its cache.
+
+    Args:
+        filename (str): path of the output file
+        kind (str): name of the parser
+        data (dict): json serializable data, replaces the cached one
+        arrays (dict): numpy arrays
+        update (bool): add the arrays to a valid cache instead of
+                       building a new one
+    """
+    cache_dir = filename + CACHE_SUFFIX
+    meta = _read_meta(filename, kind) if update else None
+    if meta is None:
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.makedirs(cache_dir)
+        names = []
+    else:
+        names = meta['arrays']
+    for key in arrays:
+        # replaced and not overwritten, the old file may be mapped
+        tmp_file = os.path.join(cache_dir, key + '.tmp.npy')
+        np.save(tmp_file, arrays[key])
+        os.replace(tmp_file, os.path.join(cache_dir, key + '.npy'))
+    meta = {'version': OUTPUT_CACHE_VERSION,
+            'kind': kind,
+            'source': _source_stamp(filename),
+            'arrays': sorted(set(names) | set(arrays.keys())),
+            'data': data}
+    # meta.json is written last, an interrupted write leaves no valid cache
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    with open(meta_file + '.tmp', 'w') as fp:
+        json.dump(meta, fp, indent=4)
+    os.replace(meta_file + '.tmp', meta_file)
+
+
+def load_vasprun(filename='vasprun.xml',
+                 parse_tdos=False,
+                 parse_pdos=False,
+                 pdos_atoms=None,
+                 parse_eigen=False,
+                 parse_dielectric=False,
+                 final_structure=True,
+                 use_cache=True):
+    """
+    LazyVasprun through the cache. Only the arrays of the requested
+    sections are opened, the missing sections are parsed and added to
+    the cache, so the cache grows with the commands run in the
+    directory. The projected DOS is only cached when it is parsed for
+    all the atoms, a cached one is sliced to `pdos_atoms` without
+    reading the other atoms.
+
+    Args: see LazyVasprun
+
+    Returns:
+        LazyVasprun
+    """
+    kwargs = {'parse_tdos': parse_tdos,
+              'parse_pdos': parse_pdos,
+              'parse_eigen': parse_eigen,
+              'parse_dielectric': parse_dielectric,
+              'final_structure': final_structure}
+    if not use_cache:
+        return LazyVasprun(filename, pdos_atoms=pdos_atoms, **kwargs)
+
+    section_args = {'tdos': 'parse_tdos',
+                    'pdos': 'parse_pdos',
+                    'eigenvalues': 'parse_eigen',
+                    'dielectric': 'parse_dielectric'}
+    wanted = set(['parameters', 'atominfo', 'kpoints'])
+    wanted |= set([key for key in section_args if kwargs[section_args[key]]])
+    wanted.add('finalpos' if final_structure else 'initialpos')
+    partial_pdos = parse_pdos and pdos_atoms is not None
+
+    meta = _read_meta(filename, 'vasprun')
+    data = {} if meta is None else meta['data']
+    missing = wanted - set(data.get('sections', []))
+    parsed = None
+    if len(missing) > 0:
+        args = dict([(section_args[key], key in missing) for key in section_args])
+        parsed = LazyVasprun(filename, pdos_atoms=pdos_atoms if partial_pdos else None,
+                             final_structure='finalpos' in missing, **args)
+        (new_data, arrays) = parsed.as_arrays()
+        sections = set(new_data.pop('sections'))
+        if partial_pdos:
+            # the projected DOS of some atoms is not cached
+            sections.discard('pdos')
+            arrays.pop('pdos', None)
+            new_data.pop('pdos_atoms')
+        data = dict(data)
+        data.update([(key, value) for (key, value) in new_data.items() if value is not None])
+        data['sections'] = sorted(sections | set(data.get('sections', [])))
+        write_output_cache(filename, 'vasprun', data, arrays, update=True)
+
+    keys = [key for section in wanted for key in SECTION_ARRAYS.get(section, [])]
+    (data, arrays) = read_output_cache(filename, 'vasprun', keys)
+    vsr = LazyVasprun.from_arrays(filename, data, arrays)
+    vsr.sections = wanted
+    if partial_pdos:
+        if 'pdos' in missing:
+            (vsr.pdos, vsr.pdos_atoms) = (parsed.pdos, parsed.pdos_atoms)
+        elif vsr.pdos is not None:
+            # only the selected atoms are read from the mapped file
+            index = dict([(atom, i) for (i, atom) in enumerate(vsr.pdos_atoms)])
+            selected = sorted(set(pdos_atoms))
+            vsr.pdos = vsr.pdos[:, [index[atom] for atom in selected]]
+            vsr.pdos_atoms = selected
+    return vsr
+
+
+def load_procar(filename='PROCAR', ions=None, use_cache=True):
+    """
+    Projections in PROCAR through the cache. Only a full read is cached,
+    without a valid cache only the selected ions are read.
+
+    Args:
+        filename (str): path of PROCAR
+        ions (list of int): 0-based ion index, all ions if None
+        use_cache (bool): read and write the cache
+
+    Returns:
+        (numpy.ndarray, list of str): float32 projections with shape
+            (nspin, nkpoints, nbands, nions, norbitals), nions are the
+            sorted selected ions, and the orbital names
+    """
+    if use_cache:
+        ret = read_output_cache(filename, 'procar')
+        if ret is not None:
+            data = ret[1]['data']
+            if ions is not None:
+                # only the selected ions are read from the mapped file
+                data = data[:, :, :, sorted(set(ions))]
+            return data, ret[0]['orbitals']
+
+    procar = ProcarData(filename, ions=ions)
+    if use_cache and ions is None:
+        write_output_cache(filename, 'procar', {'orbitals': procar.orbitals},
+                           {'data': procar.data})
+    return procar.data, procar.orbitals
+
+
+def load_outcar(filename='OUTCAR', use_cache=True):
+    """
+    The dict of pymatgen's Outcar through the cache.
+
+    Args:
+        filename (str): path of OUTCAR
+        use_cache (bool): read and write the cache
+
+    Returns:
+        dict, Outcar.as_dict()
+    """
+    if use_cache:
+        ret = read_output_cache(filename, 'outcar', keys=[])
+        if ret is not None:
+            return ret[0]
+
+    data = json.loads(json.dumps(Outcar(filename).as_dict(), default=_json_default))
+    if use_cache:
+        write_output_cache(filename, 'outcar', data, {})
+    return data
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(repr(obj) + " is not JSON serializable")
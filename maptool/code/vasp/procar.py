@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# coding: utf-8
+r'''
+ Array based reader of PROCAR
+'''
+import re
+import warnings
+import itertools
+import numpy as np
+from monty.io import zopen
+
+_FLOAT = re.compile(r'-?\d+\.\d+')
+
+
+def _count_pattern(filename, pattern, chunk_size=1 << 24):
+    """
+    Count the occurrences of a byte string by a binary scan of the file.
+    """
+    count = 0
+    tail = b''
+    with zopen(filename, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buf = tail + chunk
+            count += buf.count(pattern)
+            # keep the end of the chunk in case a header is split, it
+            # can not contain a full header so it is not counted twice
+            tail = buf[-(len(pattern) - 1):]
+    return count
+
+
+def _count_spin(filename):
+    """
+    Count the headers '# of k-points', one per spin component.
+    """
+    return _count_pattern(filename, b'# of k-points')
+
+
+class ProcarData(object):
+    """
+    PROCAR reader with the projections in one dense array.
+
+    The file is read twice: the first pass gets the dimensions from the
+    header, the second one fills a preallocated array. Only the first
+    projection table of each band is read, the phase factors of
+    LORBIT=12 and the magnetization tables of non-collinear
+    calculations are skipped.
+
+    Args:
+        filename (str): Path to PROCAR, can be compressed
+        ions (list of int): 0-based ion index to be kept, all ions if None
+        dtype: numpy dtype of the projections
+
+    Attributes:
+        data (numpy.ndarray): (nspin, nkpoints, nbands, nions, norbitals),
+                              nions are the selected ions
+        orbitals (list of str): orbital names
+        ions (list of int): ion index of the 4th axis of data
+        kpoints (numpy.ndarray): (nkpoints, 3) fractional coordinates
+        weights (numpy.ndarray): (nkpoints,)
+        eigenvalues (numpy.ndarray): (nspin, nkpoints, nbands)
+        occupations (numpy.ndarray): (nspin, nkpoints, nbands)
+        nspin, nkpoints, nbands (int)
+        nions_total (int): number of ions in the file
+        has_phase (bool): whether the file contains phase factors
+    """
+
+    def __init__(self, filename, ions=None, dtype=np.float32):
+        self.filename = filename
+        self._read_header()
+        if ions is None:
+            self.ions = list(range(self.nions_total))
+        else:
+            self.ions = sorted(set(ions))
+        shape = (self.nspin, self.nkpoints, self.nbands)
+        self.data = np.zeros(shape + (len(self.ions), len(self.orbitals)), dtype=dtype)
+        self.eigenvalues = np.zeros(shape)
+        self.occupations = np.zeros(shape)
+        self.kpoints = np.zeros((self.nkpoints, 3))
+        self.weights = np.zeros(self.nkpoints)
+        self._read_data()
+
+    @property
+    def nions(self):
+        return len(self.ions)
+
+    def _read_header(self):
+        with zopen(self.filename, "rt") as f:
+            self.has_phase = 'phase' in f.readline()
+            toks = re.findall(r'\d+', f.readline())
+            (self.nkpoints, self.nbands, self.nions_total) = [int(x) for x in toks[:3]]
+            for line in f:
+                if line.startswith('ion'):
+                    self.orbitals = line.split()[1:-1]
+                    break
+        self.nspin = _count_spin(self.filename)
+
+    def _read_data(self):
+        nions = self.nions_total
+        ncol = len(self.orbitals) + 2
+        rows = np.array(self.ions, dtype=int)
+        columns = slice(1, ncol - 1)
+        ispin = -1
+        ik = -1
+        ib = -1
+        fresh = False
+        with zopen(self.filename, "rt") as f:
+            for line in f:
+                if line.startswith('# of k-points'):
+                    ispin += 1
+                    ik = -1
+                elif line.startswith(' k-point'):
+                    ik += 1
+                    ib = -1
+                    toks = _FLOAT.findall(line.split(':', 1)[1])
+                    self.kpoints[ik] = [float(x) for x in toks[:3]]
+                    self.weights[ik] = float(toks[3])
+                elif line.startswith('band'):
+                    ib += 1
+                    toks = line.split('#')
+                    self.eigenvalues[ispin, ik, ib] = float(toks[1].split()[1])
+                    self.occupations[ispin, ik, ib] = float(toks[2].split()[1])
+                    fresh = True
+                elif fresh and line.startswith('ion'):
+                    # the first table of the band, the following ones
+                    # (phase or magnetization) are skipped
+                    fresh = False
+                    lines = list(itertools.islice(f, nions))
+                    if len(rows) == nions:
+                        text = "".join(lines)
+                    else:
+                        text = "".join([lines[i] for i in rows])
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore', DeprecationWarning)
+                        values = np.fromstring(text, dtype=np.float64, sep=' ')
+                    self.data[ispin, ik, ib] = values.reshape(len(rows), ncol)[:, columns]
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# coding: utf-8
+r'''
+ Streaming readers of the ionic trajectory in XDATCAR and vasprun.xml
+
+ The frames are stored in one (nframes, natoms, 3) array of fractional
+ coordinates instead of a list of Structure objects. The number of frames
+ is counted by a binary scan first, so the array is allocated once, and
+ the frames outside of the requested slice are skipped without decoding
+ their coordinates.
+'''
+import itertools
+import numpy as np
+from xml.etree.ElementTree import iterparse
+from monty.io import zopen
+from pymatgen import Structure, Lattice
+from maptool.code.vasp.procar import _count_pattern
+from maptool.code.vasp.vasprun import _rows
+
+
+def _frame_range(nframes, start, stop, step):
+    return range(*slice(start, stop, step).indices(nframes))
+
+
+def _new_positions(shape, dtype, mmap_file):
+    if mmap_file is None:
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(mmap_file, mode='w+', dtype=dtype, shape=shape)
+
+
+def _scaled_lattice(lines):
+    scale = float(lines[0].split()[0])
+    lattice = np.array([[float(x) for x in line.split()[:3]] for line in lines[1:4]])
+    if scale < 0:
+        # a negative scale is the volume of the cell
+        scale = (-scale / abs(np.linalg.det(lattice)))**(1.0 / 3)
+    return lattice * scale
+
+
+class Trajectory(object):
+    """
+    Ionic trajectory in compact arrays.
+
+    Args:
+        positions (numpy.ndarray): (nframes, natoms, 3) fractional
+                                   coordinates, can be a memmap
+        lattices (numpy.ndarray): (nframes, 3, 3) lattice vectors of each
+                                  frame in Angstrom
+        species (list of str): symbol of each atom
+        frames (list of int): 0-based index of the frames in the file
+        constant_cell (bool): whether the cell is fixed in the file
+
+    Attributes:
+        positions, lattices, species, frames, constant_cell
+    """
+
+    def __init__(self, positions, lattices, species, frames, constant_cell=True):
+        self.positions = positions
+        self.lattices = lattices
+        self.species = list(species)
+        self.frames = list(frames)
+        self.constant_cell = constant_cell
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    @property
+    def nframes(self):
+        return self.positions.shape[0]
+
+    @property
+    def natoms(self):
+        return self.positions.shape[1]
+
+    @property
+    def volumes(self):
+        """
+        Volume of the cell of each frame
+        """
+        return np.abs(np.linalg.det(self.lattices))
+
+    def cartesian(self, frame):
+        """
+        Cartesian coordinates of one frame, (natoms, 3)
+        """
+        return np.dot(self.positions[frame].astype(np.float64), self.lattices[frame])
+
+    def get_structure(self, frame):
+        """
+        One frame as a pymatgen Structure
+        """
+        return Structure(Lattice(self.lattices[frame]), self.species,
+                         self.positions[frame].astype(np.float64))
+
+    @classmethod
+    def from_xdatcar(cls, filename='XDATCAR', start=0, stop=None, step=1,
+                     dtype=np.float32, mmap_file=None):
+        """
+        Read XDATCAR of VASP 5, both the fixed cell format with one
+        header and the variable cell format (ISIF=3 runs) with one header
+        per frame. An incomplete last frame is dropped.
+
+        Args:
+            filename (str): path of XDATCAR, can be compressed
+            start, stop, step (int): slice of the frames, as in python
+            dtype: numpy dtype of the positions
+            mmap_file (str): the positions are written to this .npy file
+                             and memory-mapped, in memory if None
+
+        Returns:
+            Trajectory
+        """
+        nframes = _count_pattern(filename, b'configuration')
+        selected = _frame_range(nframes, start, stop, step)
+        with zopen(filename, "rt") as f:
+            header = list(itertools.islice(f, 7))
+            species = []
+            for (symbol, count) in zip(header[5].split(), header[6].split()):
+                species.extend([symbol] * int(count))
+            natoms = len(species)
+            lattice = _scaled_lattice(header[1:5])
+            positions = _new_positions((len(selected), natoms, 3), dtype, mmap_file)
+            lattices = np.tile(lattice, (len(selected), 1, 1))
+            constant_cell = True
+            wanted = set(selected)
+            iframe = 0
+            isel = 0
+            line = f.readline()
+            while line and isel < len(selected):
+                if 'configuration' not in line:
+                    # variable cell, the header is repeated before each frame
+                    constant_cell = False
+                    header = [line] + list(itertools.islice(f, 6))
+                    if iframe in wanted:
+                        lattice = _scaled_lattice(header[1:5])
+                    line = f.readline()
+                    continue
+                lines = list(itertools.islice(f, natoms))
+                if len(lines) < natoms:
+                    break
+                if iframe in wanted:
+                    positions[isel] = np.array([ii.split()[:3] for ii in lines],
+                                               dtype=np.float64)
+                    lattices[isel] = lattice
+                    isel += 1
+                iframe += 1
+                line = f.readline()
+        if isel < len(selected):
+            positions = positions[:isel]
+            lattices = lattices[:isel]
+        return cls(positions, lattices, species, list(selected)[:isel], constant_cell)
+
+    @classmethod
+    def from_vasprun(cls, filename='vasprun.xml', start=0, stop=None, step=1,
+                     dtype=np.float32, mmap_file=None):
+        """
+        Read the structures of the ionic steps in vasprun.xml. The
+        coordinates of the skipped steps are not decoded.
+
+        Args: see `from_xdatcar`
+
+        Returns:
+            Trajectory
+        """
+        nframes = _count_pattern(filename, b'<calculation')
+        selected = _frame_range(nframes, start, stop, step)
+        wanted = set(selected)
+        species = []
+        positions = None
+        lattices = np.zeros((len(selected), 3, 3))
+        iframe = -1
+        isel = 0
+        texts = []
+        in_atoms = False
+        in_step = False
+        with zopen(filename, "rb") as f:
+            for event, elem in iterparse(f, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag == 'calculation':
+                        iframe += 1
+                        in_step = iframe in wanted
+                    elif tag == 'array':
+                        in_atoms = elem.attrib.get('name') == 'atoms'
+                    elif tag == 'varray':
+                        texts = []
+                    continue
+                if tag == 'rc' and in_atoms:
+                    species.append(elem[0].text.strip())
+                elif tag == 'atominfo':
+                    positions = _new_positions((len(selected), len(species), 3), dtype,
+                                               mmap_file)
+                elif tag == 'v' and in_step:
+                    texts.append(elem.text)
+                elif tag == 'varray' and in_step:
+                    name = elem.attrib.get('name')
+                    if name == 'basis':
+                        lattices[isel] = _rows(texts, 3)
+                    elif name == 'positions':
+                        positions[isel] = _rows(texts, 3)
+                elif tag == 'calculation' and in_step:
+                    isel += 1
+                    in_step = False
+                    if isel == len(selected):
+                        break
+                if tag != 'c':
+                    elem.clear()
+        if isel < len(selected):
+            positions = positions[:isel]
+            lattices = lattices[:isel]
+        constant_cell = bool(np.allclose(lattices, lattices[:1])) if isel > 0 else True
+        return cls(positions, lattices, species, list(selected)[:isel], constant_cell)
+
+
+def read_trajectory(filename, start=0, stop=None, step=1, dtype=np.float32, mmap_file=None):
+    """
+    Trajectory from XDATCAR or vasprun.xml, chosen by the file name
+
+    Args: see `Trajectory.from_xdatcar`
+    """
+    if 'xml' in filename:
+        return Trajectory.from_vasprun(filename, start, stop, step, dtype, mmap_file)
+    return Trajectory.from_xdatcar(filename, start, stop, step, dtype, mmap_file)
@@ -1,12 +1,10 @@
 #!/usr/bin/env python
 import os
 import sys
-import itertools
 import numpy as np
 from   numpy import linalg as LA
-from   copy import copy
 from   pymatgen import Structure
-from   pymatgen.io.vasp import VolumetricData,Poscar,Vasprun,Outcar,Locpot,Procar
+from   pymatgen.io.vasp import VolumetricData,Poscar,Outcar,Locpot
 from   pymatgen.electronic_structure.core import Spin
 from   monty.io import zopen, reverse_readfile
 from   pymatgen.electronic_structure.bandstructure import BandStructure, \
@@ -16,10 +14,22 @@ from   pymatgen.electronic_structure.dos import CompleteDos, Dos
 from   pymatgen.electronic_structure.plotter import DosPlotter,BSPlotter
 from   pymatgen.symmetry import analyzer
 from   maptool.util.constants  import H,C0,Avogadro
-from   maptool.core.selection  import atom_selection
+from   maptool.core.selection  import atom_selection, element_groups, layer_groups
 from   maptool.util.utils import procs, wait_sep,check_file, \
-                                  check_matplotlib,wait
+                                  check_matplotlib,wait,write_col_data
 from   maptool.io.data_io import DataIO
+from   maptool.code.vasp.volumetric import write_grid, read_volumetric, \
+                                         load_volumetric, clean_cache, \
+                                         parse_linear_expression, combine_volumetric, \
+                                         header_lattice
+from   maptool.code.vasp.output_cache import load_vasprun, load_procar, load_outcar
+from   maptool.code.vasp.vasprun import sum_pdos
+from   maptool.core.average import grid_average
+from   maptool.core.aimd import partial_rdf, msd, block_diffusion, \
+                                  velocity_autocorrelation, vibrational_dos
+from   maptool.code.vasp.trajectory import read_trajectory
+from   maptool.core.optics import optical_spectra, spectra_table, \
+                                     kramers_kronig_error, COMPONENTS
                             
 
 min_gap=0.001
@@ -31,9 +41,9 @@ def total_dos():
    check_file(filename)
    proc_str="Reading Data From "+ filename +" File ..."
    procs(proc_str,1,sp='-->>')
-   vsr=Vasprun(filename,parse_eigen=False)
-   tdos=vsr.tdos
-   idos=vsr.idos
+   vsr=load_vasprun(filename,parse_tdos=True,final_structure=False)
+   tdos=vsr.get_tdos()
+   idos=vsr.get_idos()
    E=tdos.energies-tdos.efermi
    if vsr.is_spin:
       proc_str="This Is a Spin-polarized Calculation."
@@ -107,96 +117,79 @@ def projected_dos():
    check_file(filename)
    proc_str="Reading Data From "+ filename +" File ..."
    procs(proc_str,step_count,sp='-->>')
-   vsr=Vasprun(filename)
-   nedos=vsr.parameters['NEDOS']
-   struct=vsr.final_structure
-   pdos=vsr.pdos
-
-   filename='PROCAR'
-   check_file(filename)
-   step_count+=1
-   proc_str="Reading Data From "+ filename +" File ..."
-   procs(proc_str,step_count,sp='-->>')
-   procar=Procar(filename)
-   nbands=procar.nbands
-   nions=procar.nions
-   norbitals=len(procar.orbitals)
-   nkpoints=procar.nkpoints
-
-   (atom_index,in_str)=atom_selection(struct)
+   struct=load_vasprun(filename,final_structure=False).initial_structure
 
-   if len(atom_index)==0:
-      print("No atoms selected!")
+   print("which atoms would like to project the DOS on ?")
+   print("1. selected atoms")
+   print("2. each element")
+   print("3. each layer")
+   wait_sep()
+   in_str=""
+   while in_str=="":
+         in_str=input().strip()
+   if in_str=='1':
+      (atom_index,in_str)=atom_selection(struct)
+      if len(atom_index)==0:
+         print("No atoms selected!")
+         return
+      labels=['']
+      groups=[atom_index]
+      in_strs=[in_str]
+   elif in_str=='2':
+      (labels,groups)=element_groups(struct)
+      in_strs=labels
+   elif in_str=='3':
+      print("input the layer direction (a, b or c) and the tolerance in Angstrom,")
+      print("i.e. c 0.5, press Enter to use it")
+      wait_sep()
+      in_str=input().strip().lower() or 'c 0.5'
+      try:
+         axis='abc'.index(in_str.split()[0])
+         tol=float(in_str.split()[1]) if len(in_str.split())>1 else 0.5
+      except ValueError:
+         print("Unknow layer direction!")
+         return
+      (labels,groups)=layer_groups(struct,axis=axis,tol=tol)
+      in_strs=["layer "+label+" along "+'abc'[axis] for label in labels]
+      proc_str="Found "+str(len(groups))+" Layers."
+      procs(proc_str,0,sp='-->>')
+   else:
+      print("Unknow option!")
       return
-#   print(atom_index)
+
+   atom_index=sorted(set([atom for group in groups for atom in group]))
+   vsr=load_vasprun(filename,parse_tdos=True,parse_pdos=True,pdos_atoms=atom_index,
+                    final_structure=False)
+   energies=vsr.tdos_energies-vsr.efermi
+   orbitals=vsr.pdos_orbitals
+   # (ngroups,nspin,norbitals,nedos) for all the groups at once
+   contrib=sum_pdos(vsr.pdos,vsr.pdos_atoms,groups)
 
    if vsr.is_spin:
       proc_str="This Is a Spin-polarized Calculation."
-      procs(proc_str,0,sp='-->>')
-
-      contrib=np.zeros((nedos,norbitals+1,2))
-      energies=vsr.tdos.energies-vsr.efermi
-      for ispin in [0,1]:
-          if ispin==0:
-              spin=Spin.up
-              s_name='Up'
-          else:
-              spin=Spin.down
-              s_name='Down'
-
-          contrib[:,0,ispin]=energies  
-          for i in atom_index:
-                for j in range(norbitals):
-                     contrib[:,j+1,ispin]=contrib[:,j+1,ispin]+pdos[i][Orbital(j)][spin]
-
-          step_count+=1
-          filename="PDOS_"+s_name+".dat"
-          proc_str="Writting Projected DOS Data to "+ filename +" File ..."
-          procs(proc_str,step_count,sp='-->>')
-          tmp1_str="#%%(key1)+12s"
-          tmp2_dic={'key1':'Energy(ev)'}
-          for i in range(norbitals):
-              tmp1_str+="%(key"+str(i+2)+")+12s"
-              tmp2_dic["key"+str(i+2)]=procar.orbitals[i]
-
-#          print(tmp1_str)
-          atom_index_str=[str(x+1) for x in atom_index]
-          head_line1="#String: "+in_str+'\n#Selected atom: ' +' '.join(atom_index_str)+'\n'
-          head_line2=tmp1_str % tmp2_dic
-          head_line=head_line1+head_line2
-          write_col_data(filename,contrib[:,:,ispin],head_line)
-
+      spins=[(0,'_Up'),(1,'_Down')]
    else:
       if vsr.parameters['LNONCOLLINEAR']:
          proc_str="This Is a Non-Collinear Calculation."
-         procs(proc_str,0,sp='-->>')
       else:
          proc_str="This Is a Non-Spin Calculation."
-         procs(proc_str,0,sp='-->>')
-
-      contrib=np.zeros((nedos,norbitals+1))
-      energies=vsr.tdos.energies-vsr.efermi
-      contrib[:,0]=energies
-      for i in atom_index:
-            for j in range(norbitals):
-                 contrib[:,j+1]=contrib[:,j+1]+pdos[i][Orbital(j)][Spin.up]
-
-      step_count+=1
-      filename="PDOS.dat"
-      proc_str="Writting Projected DOS Data to "+ filename +" File ..."
-      procs(proc_str,step_count,sp='-->>')
-      tmp1_str="#%(key1)+12s%(key2)+12s"
-      tmp2_dic={'key1':'K-Distance','key2':'Energy(ev)'}
-      for i in range(norbitals):
-          tmp1_str+="%(key"+str(i+3)+")+12s"
-          tmp2_dic["key"+str(i+3)]=procar.orbitals[i]
+      spins=[(0,'')]
+   procs(proc_str,0,sp='-->>')
 
-#      print(tmp1_str)
-      atom_index_str=[str(x+1) for x in atom_index]
-      head_line1="#String: "+in_str+'\n#Selected atom: ' +' '.join(atom_index_str)+'\n'
-      head_line2=tmp1_str % tmp2_dic
-      head_line=head_line1+head_line2
-      write_col_data(filename,contrib,head_line)
+   head_line2="#%12s"%'Energy(ev)'+"".join(["%12s"%orbital for orbital in orbitals])
+   for (igroup,group) in enumerate(groups):
+       atom_index_str=[str(x+1) for x in group]
+       head_line1="#String: "+in_strs[igroup]+'\n#Selected atom: ' +' '.join(atom_index_str)+'\n'
+       for (ispin,s_name) in spins:
+           step_count+=1
+           if labels[igroup]:
+              filename="PDOS_"+labels[igroup]+s_name+".dat"
+           else:
+              filename="PDOS"+s_name+".dat"
+           proc_str="Writting Projected DOS Data to "+ filename +" File ..."
+           procs(proc_str,step_count,sp='-->>')
+           data=np.vstack((energies,contrib[igroup,ispin])).T
+           write_col_data(filename,data,head_line1+head_line2)
 
 def band_structure():
     check_matplotlib()
@@ -206,27 +199,27 @@ def band_structure():
     check_file(filename)
     proc_str="Reading Data From "+ filename +" File ..."
     procs(proc_str,step_count,sp='-->>')
-    vsr=Vasprun(filename)
+    vsr=load_vasprun(filename,parse_tdos=True,parse_eigen=True)
 
     step_count+=1
     filename='KPOINTS'
     check_file(filename)
     proc_str="Reading Data From "+ filename +" File ..."
     procs(proc_str,step_count,sp='-->>')
-    bands = vsr.get_band_structure(filename, line_mode=True, efermi=vsr.efermi)
+    bands = vsr.get_band_structure(filename, efermi=vsr.efermi)
 
     step_count+=1
     filename='OUTCAR'
     check_file(filename)
     proc_str="Reading Data From "+ filename +" File ..."
     procs(proc_str,step_count,sp='-->>')
-    outcar=Outcar('OUTCAR')
-    mag=outcar.as_dict()['total_magnetization']
+    outcar=load_outcar('OUTCAR')
+    mag=outcar['total_magnetization']
 
     if vsr.is_spin:
        proc_str="This Is a Spin-polarized Calculation."
        procs(proc_str,0,sp='-->>')
-       tdos=vsr.tdos
+       tdos=vsr.get_tdos()
        SpinUp_gap=tdos.get_gap(spin=Spin.up) 
        cbm_vbm_up=tdos.get_cbm_vbm(spin=Spin.up)
        SpinDown_gap=tdos.get_gap(spin=Spin.down) 
@@ -333,25 +326,14 @@ def projected_band_structure():
    check_file(filename)
    proc_str="Reading Data From "+ filename +" File ..."
    procs(proc_str,step_count,sp='-->>')
-   vsr=Vasprun(filename)
-
-   filename='PROCAR'
-   check_file(filename)
-   step_count+=1
-   proc_str="Reading Data From "+ filename +" File ..."
-   procs(proc_str,step_count,sp='-->>')
-   procar=Procar(filename)
-   nbands=procar.nbands
-   nions=procar.nions
-   norbitals=len(procar.orbitals)
-   nkpoints=procar.nkpoints
+   vsr=load_vasprun(filename,parse_eigen=True)
 
    step_count+=1
    filename='KPOINTS'
    check_file(filename)
    proc_str="Reading Data From "+ filename +" File ..."
    procs(proc_str,step_count,sp='-->>')
-   bands = vsr.get_band_structure(filename, line_mode=True, efermi=vsr.efermi)
+   bands = vsr.get_band_structure(filename, efermi=vsr.efermi)
    struct=vsr.final_structure
    (atom_index,in_str)=atom_selection(struct)
    
@@ -360,25 +342,33 @@ def projected_band_structure():
       return
 #   print(atom_index)
 
+   filename='PROCAR'
+   check_file(filename)
+   step_count+=1
+   proc_str="Reading Data From "+ filename +" File ..."
+   procs(proc_str,step_count,sp='-->>')
+   # only the selected ions are kept
+   (proj,orbitals)=load_procar(filename,ions=atom_index)
+   nkpoints,nbands,_,norbitals=proj.shape[1:]
+   # (nspin,nbands,nkpoints,norbitals), the same order as the band energies
+   contrib=proj.sum(axis=3,dtype=np.float64).transpose(0,2,1,3)
+
    if vsr.is_spin:
       proc_str="This Is a Spin-polarized Calculation."
       procs(proc_str,0,sp='-->>')
       ISPIN=2
-      contrib=np.zeros((nkpoints,nbands,norbitals,2))
-      for i in atom_index:
-          contrib[:,:,:,0]=contrib[:,:,:,0]+procar.data[Spin.up][:,:,i,:]
-          contrib[:,:,:,1]=contrib[:,:,:,1]+procar.data[Spin.down][:,:,i,:]
-
       for ispin in range(2):
-          proj_band=contrib[:,:,:,ispin].reshape(nkpoints*nbands,norbitals)
+          proj_band=contrib[ispin].reshape(nkpoints*nbands,norbitals)
           step_count+=1
           if ispin==0:
               filename="PBAND_Up.dat"
+              spin=Spin.up
           else:
               filename="PBAND_Down.dat"
+              spin=Spin.down
           proc_str="Writting Projected Band Structure Data to "+ filename +" File ..."
           procs(proc_str,step_count,sp='-->>')
-          band_data=bands.bands[Spin.up]
+          band_data=bands.bands[spin]
           y_data=band_data.reshape(1,nbands*nkpoints)[0]-vsr.efermi #shift fermi level to 0
           x_data=np.array(bands.distance*nbands)
           data=np.vstack((x_data,y_data,proj_band.T)).T
@@ -386,7 +376,7 @@ def projected_band_structure():
           tmp2_dic={'key1':'K-Distance','key2':'Energy(ev)'}
           for i in range(norbitals):
               tmp1_str+="%(key"+str(i+3)+")+12s"
-              tmp2_dic["key"+str(i+3)]=procar.orbitals[i]
+              tmp2_dic["key"+str(i+3)]=orbitals[i]
 
 #          print(tmp1_str)
           atom_index_str=[str(x+1) for x in atom_index]
@@ -405,11 +395,7 @@ def projected_band_structure():
          procs(proc_str,0,sp='-->>')
          ISPIN=1
 
-      contrib=np.zeros((nkpoints,nbands,norbitals))
-      for i in atom_index:
-          contrib[:,:,:]=contrib[:,:,:]+procar.data[Spin.up][:,:,i,:]
- 
-      proj_band=contrib.reshape(nkpoints*nbands,norbitals)        
+      proj_band=contrib[0].reshape(nkpoints*nbands,norbitals)        
       step_count+=1
       filename="PBAND.dat"
       proc_str="Writting Projected Band Structure Data to "+ filename +" File ..."
@@ -422,7 +408,7 @@ def projected_band_structure():
       tmp2_dic={'key1':'K-Distance','key2':'Energy(ev)'}
       for i in range(norbitals):
           tmp1_str+="%(key"+str(i+3)+")+12s"
-          tmp2_dic["key"+str(i+3)]=procar.orbitals[i]
+          tmp2_dic["key"+str(i+3)]=orbitals[i]
 
 #      print(tmp1_str)
       atom_index_str=[str(x+1) for x in atom_index]
@@ -450,14 +436,14 @@ def select_one_band_structure():
    check_file(filename)
    proc_str="Reading Data From "+ filename +" File ..."
    procs(proc_str,step_count,sp='-->>')
-   vsr=Vasprun(filename)
+   vsr=load_vasprun(filename,parse_eigen=True)
 
    step_count+=1
    filename='KPOINTS'
    check_file(filename)
    proc_str="Reading Data From "+ filename +" File ..."
    procs(proc_str,step_count,sp='-->>')
-   bands = vsr.get_band_structure(filename, line_mode=True, efermi=vsr.efermi)
+   bands = vsr.get_band_structure(filename, efermi=vsr.efermi)
    nelect=vsr.parameters['NELECT']
    nbands=bands.nb_bands
    if vsr.is_spin:
@@ -526,9 +512,28 @@ class CHGCAR(VolumetricData):
         self._distance_matrix = {}
 
     @staticmethod
-    def from_file(filename):
-        (poscar, data, data_aug) = VolumetricData.parse_file(filename)
-        return CHGCAR(poscar, data, data_aug=data_aug)
+    def from_file(filename, dtype=np.float64, read_aug=False, scratch_dir=None,
+                  use_cache=True):
+        """
+        Read a CHG/CHGCAR file with the streaming reader. The parsed grids
+        are cached next to the file (see `load_volumetric`), unless the
+        augmentation occupancies or a scratch directory are requested.
+
+        Args:
+            filename (str): Path to a file
+            dtype: numpy dtype of the grid, np.float64 or np.float32
+            read_aug (bool): keep the augmentation occupancies
+            scratch_dir (str): directory for memory-mapped grids
+            use_cache (bool): read and write the binary cache
+        """
+        if read_aug or scratch_dir:
+            (header, data, data_aug) = read_volumetric(filename, dtype=dtype,
+                                                       read_aug=read_aug,
+                                                       scratch_dir=scratch_dir)
+        else:
+            (header, data, data_aug) = load_volumetric(filename, dtype=dtype,
+                                                       use_cache=use_cache)
+        return CHGCAR(Poscar.from_string(header), data, data_aug=data_aug)
 
     @property
     def net_magnetization(self):
@@ -542,24 +547,10 @@ class CHGCAR(VolumetricData):
 
         Args:
             file_name (str): Path to a file
+            data_type (str): key of the data to be written, i.e. 'total'
             vasp4_compatible (bool): True if the format is vasp4 compatible
         """
 
-        def _print_fortran_float(f):
-            """
-            Fortran codes print floats with a leading zero in scientific
-            notation. When writing CHGCAR files, we adopt this convention
-            to ensure written CHGCAR files are byte-to-byte identical to
-            their input files as far as possible.
-            :param f: float
-            :return: str
-            """
-            s = "{:.10E}".format(f)
-            if f > 0:
-                return "0."+s[0]+s[2:12]+'E'+"{:+03}".format(int(s[13:])+1)
-            else:
-                return "-."+s[1]+s[3:13]+'E'+"{:+03}".format(int(s[14:])+1)
-
         with zopen(file_name, "wt") as f:
             p = Poscar(self.structure)
 
@@ -580,25 +571,8 @@ class CHGCAR(VolumetricData):
                 lines += "%10.6f%10.6f%10.6f\n" % tuple(site.frac_coords)
             lines += " \n"
             f.write(lines)
-            a = self.dim
-
-            def write_spin(data_type):
-                lines = []
-                count = 0
-                f.write("   {}   {}   {}\n".format(a[0], a[1], a[2]))
-                for (k, j, i) in itertools.product(list(range(a[2])),
-                                                   list(range(a[1])),
-                                                   list(range(a[0]))):
-                    lines.append(_print_fortran_float(self.data[data_type][i, j, k]))
-                    count += 1
-                    if count % 5 == 0:
-                        f.write(" " + "".join(lines) + "\n")
-                        lines = []
-                    else:
-                        lines.append(" ")
-                f.write(" " + "".join(lines) + " \n")
-#                f.write("".join(self.data_aug.get(data_type, [])))
-            write_spin(data_type)
+            write_grid(f, self.data[data_type])
+#            f.write("".join(self.data_aug.get(data_type, [])))
 
 def spin_density():
    proc_str="Reading Spin Charge Density From CHG File ..."
@@ -618,25 +592,29 @@ def charge_density_diff():
    print("it means rho(A)-rho(B))")
    print("file_A file_B file_C")
    print("it means rho(A)-rho(B)-rho(C)")
+   print("or a linear combination like this")
+   print("file_A - file_B - 0.5*file_C")
    wait_sep()
    in_str=""
    while in_str=="":
          in_str=input().strip()
-   filenames=in_str.split()
-   len_file=len(filenames)
-   chg=[None]*len_file
-   if len_file>=2:
-      for i in range(len_file):
-          fchg=filenames[i]
-          proc_str="Reading Charge Density From "+fchg+" File ..."
-          procs(proc_str,i+1,sp='-->>')
-          chg[i] = CHGCAR.from_file(fchg)
-      diff_chg=copy(chg[0])
-      for j in range(len_file-1):
-          diff_chg-=chg[j+1]
+   if ' + ' in in_str or ' - ' in in_str or '*' in in_str:
+      try:
+         terms=parse_linear_expression(in_str)
+      except RuntimeError as e:
+         print(e)
+         return
+   else:
+      filenames=in_str.split()
+      terms=[(1.0,filenames[0])]+[(-1.0,x) for x in filenames[1:]]
+   if len(terms)>=2:
+      for coef,fchg in terms:
+          check_file(fchg)
+      proc_str="Reading Charge Density From "+' '.join([x[1] for x in terms])+" Files ..."
+      procs(proc_str,1,sp='-->>')
       proc_str="Writing Charge Density Difference to Diff.vasp  File ..."
-      procs(proc_str,i+2,sp='-->>')
-      diff_chg.write_file('Diff.vasp','total')
+      procs(proc_str,2,sp='-->>')
+      combine_volumetric(terms,'Diff.vasp')
    else:
       print("you must input at least 2 files") 
       #charge_density_diff()
@@ -655,6 +633,33 @@ def spin_density_component():
    procs(proc_str,3,sp='-->>')
    chg.write_file('Spindown.vasp','spindown')
 
+def volumetric_average(filename,hkl=(0,0,1),widths=[],is_chg=None):
+   """
+   Planar and macroscopic average of a CHG/CHGCAR or LOCPOT file,
+   without any keyboard input.
+
+   Args:
+       filename (str): Path to a file
+       hkl (tuple): Miller index of the averaging planes
+       widths (list): window widths (Angstrom) of the macroscopic average
+       is_chg (bool): whether the file is a charge density, which is then
+                      divided by the volume. Guessed from the file name
+                      if not given.
+
+   Returns:
+       numpy.ndarray with columns distance, planar average and
+       macroscopic average (if widths are given)
+   """
+   if is_chg is None:
+      is_chg='LOCPOT' not in os.path.basename(filename).upper()
+   (header,data,_)=load_volumetric(filename)
+   lattice=header_lattice(header)
+   if is_chg:
+      scale=1.0/abs(np.linalg.det(lattice))
+   else:
+      scale=1.0
+   return grid_average(data['total'],lattice,hkl=hkl,widths=widths,scale=scale)
+
 def chg_locp_average():
    chg=False
    print("which file would like to average: CHG or LOCPOT ?")
@@ -664,46 +669,53 @@ def chg_locp_average():
          in_str=input().strip()
    if in_str.lower()=='chg':
       filename='CHG'
-      check_file(filename)
-      grid_data = CHGCAR.from_file(filename)
-      head_line="#%(key1)+s %(key2)+s"%{'key1':'Distance/Ang','key2':'Average Charge/(e/Ang**3)'}
+      key2='Average Charge/(e/Ang**3)'
       chg=True
    elif in_str.lower()=='locpot':
       filename='LOCPOT'
-      check_file(filename)
-      grid_data = Locpot.from_file(filename)
-      head_line="#%(key1)+s %(key2)+s"%{'key1':'Distance/Ang','key2':'Average Potential/(eV)'}
+      key2='Average Potential/(eV)'
    else:
       print('unknown file file: '+in_str)
-      os._exit()
+      return
 
-   step_count=1
    check_file(filename)
-   proc_str="Reading Data From "+ filename +" File ..."
-   procs(proc_str,step_count,sp='-->>')
-   volume=grid_data.structure.volume 
-   print("which direction would like to average: x y or z ?")
+   print("which direction would like to average: x y z or Miller index h k l ?")
    wait_sep()
    in_str=""
    while in_str=="":
       in_str=input().strip().lower()
    if in_str=="x":
-      selected_dir=0
+      hkl=(1,0,0)
    elif in_str=='y':
-      selected_dir=1
+      hkl=(0,1,0)
    elif in_str=='z':
-      selected_dir=2
+      hkl=(0,0,1)
    else:
-       print("Unknow Direction!")
-       return
+      try:
+         hkl=tuple([int(x) for x in in_str.split()])
+         assert len(hkl)==3 and any(hkl)
+      except (ValueError,AssertionError):
+         print("Unknow Direction!")
+         return
+      in_str='_'.join([str(x) for x in hkl])
+
+   print("input the window width(s) of macroscopic average in Angstrom, i.e.")
+   print("3.2 or 3.2 2.8 for an interface, press Enter to skip it")
+   wait_sep()
+   try:
+      widths=[float(x) for x in input().split()]
+   except ValueError:
+      print("Unknow window width!")
+      return
 
-   axis_grid=grid_data.get_axis_grid(selected_dir)
-   if chg:
-      aver_grid=grid_data.get_average_along_axis(selected_dir)/volume
+   step_count=1
+   proc_str="Reading Data From "+ filename +" File ..."
+   procs(proc_str,step_count,sp='-->>')
+   data=volumetric_average(filename,hkl=hkl,widths=widths,is_chg=chg)
+   if len(widths)>0:
+      head_line="#%(key1)+s %(key2)+s %(key3)+s"%{'key1':'Distance/Ang','key2':key2,'key3':'Macroscopic'+key2}
    else:
-      aver_grid=grid_data.get_average_along_axis(selected_dir)
-
-   data=np.vstack((axis_grid,aver_grid)).T
+      head_line="#%(key1)+s %(key2)+s"%{'key1':'Distance/Ang','key2':key2}
 
    step_count+=1
    if chg:
@@ -715,6 +727,16 @@ def chg_locp_average():
    procs(proc_str,step_count,sp='-->>')
    write_col_data(filename,data,head_line)
    
+def clean_cached_data():
+   proc_str="Removing Cached Volumetric and Output Data in Current Directory ..."
+   procs(proc_str,1,sp='-->>')
+   removed=clean_cache('.')
+   for cache_dir in removed:
+       proc_str="Removed "+cache_dir
+       procs(proc_str,0,sp='-->>')
+   if len(removed)==0:
+      print("No cache found")
+
 def optics_analysis():
 
    filename='vasprun.xml'
@@ -722,70 +744,144 @@ def optics_analysis():
    check_file(filename)
    proc_str="Reading Data From "+ filename +" File ..."
    procs(proc_str,step_count,sp='-->>')
-   vsr=Vasprun(filename,parse_eigen=False)
-   try:
-     energy=np.array(vsr.dielectric[0])
-     freq=energy/H
-     real=np.array(vsr.dielectric[1])
-     imag=np.array(vsr.dielectric[2])
-   except:
-     print('extracing data failed ')
-     return
-
-   head_line="#%(key1)+12s%(key2)+12s%(key3)+12s%(key4)+12s%(key5)+12s%(key6)+12s%(key7)+12s"%\
-    {'key1':'Energy','key2':'xx','key3':'yy','key4':'zz','key5':'xy','key6':'yz','key7':'zx'}
-   step_count+=1
-   filename="AbsorbSpectrum.dat"
-   proc_str="Writing Data To "+ filename +" File ..."
-   procs(proc_str,step_count,sp='-->>')
-   Absorb=np.zeros((len(freq),6))
-   for i in range(6): 
-       Absorb[:,i]=1.4142*freq*(np.sqrt(-real[:,i]+np.sqrt(imag[:,i]*imag[:,i]+real[:,i]*real[:,i])))/(C0*100)
-   data=np.vstack((energy,Absorb.T)).T
-   write_col_data(filename,data,head_line,e_fmt=True)
+   vsr=load_vasprun(filename,parse_dielectric=True,final_structure=False)
+   if vsr.dielectric_real is None or vsr.dielectric_imag is None:
+      print('extracing data failed ')
+      return
+   (energy,real,imag)=vsr.dielectric
 
    step_count+=1
-   filename="RefractiveSpectrum.dat"
+   filename="OPTICS.dat"
    proc_str="Writing Data To "+ filename +" File ..."
    procs(proc_str,step_count,sp='-->>')
-   Refrac=np.zeros((len(freq),6))
-   for i in range(6): 
-       Refrac[:,i]=(np.sqrt(real[:,i]+np.sqrt(imag[:,i]*imag[:,i]+real[:,i]*real[:,i])))/1.4142
-   data=np.vstack((energy,Refrac.T)).T
+   spectra=optical_spectra(energy,real,imag)
+   (data,labels)=spectra_table(energy,spectra)
+   head_line="#"+"".join(["%15s"%label for label in labels])
    write_col_data(filename,data,head_line,e_fmt=True)
 
-   step_count+=1
-   filename="EnergyLossSpectrum.dat"
-   proc_str="Writing Data To "+ filename +" File ..."
-   procs(proc_str,step_count,sp='-->>')
-   EnergyLoss=np.zeros((len(freq),6))
-   for i in range(6): 
-       EnergyLoss[:,i]=imag[:,i]/(imag[:,i]*imag[:,i]+real[:,i]*real[:,i])
-   data=np.vstack((energy,EnergyLoss.T)).T
-   write_col_data(filename,data,head_line,e_fmt=True)
+   error=kramers_kronig_error(energy,real,imag)
+   proc_str="Kramers-Kronig deviation: "+" ".join(["%s %.3f"%(x,y) for (x,y) in zip(COMPONENTS,error)])
+   procs(proc_str,0,sp='-->>')
 
-   step_count+=1
-   filename="ExtictionSpectrum.dat"
-   proc_str="Writing Data To "+ filename +" File ..."
-   procs(proc_str,step_count,sp='-->>')
-   Extic=np.zeros((len(freq),6))
-   for i in range(6): 
-       Extic[:,i]=(np.sqrt(-real[:,i]+np.sqrt(imag[:,i]*imag[:,i]+real[:,i]*real[:,i])))/1.4142
-   data=np.vstack((energy,Extic.T)).T
-   write_col_data(filename,data,head_line,e_fmt=True)
+def read_md_trajectory():
+   print("input the trajectory file and the frames to be used: start stop step,")
+   print("i.e. XDATCAR 1000 : 2 for every second frame after the 1000th,")
+   print("press Enter for all frames of XDATCAR")
+   wait_sep()
+   toks=input().split() or ['XDATCAR']
+   filename=toks[0]
+   check_file(filename)
+   try:
+      frames=[None if x in [':','-'] else int(x) for x in toks[1:4]]
+   except ValueError:
+      print("Unknow frame range!")
+      return None
+   frames+=[None]*(3-len(frames))
+   proc_str="Reading Trajectory From "+ filename +" File ..."
+   procs(proc_str,1,sp='-->>')
+   traj=read_trajectory(filename,start=frames[0] or 0,stop=frames[1],step=frames[2] or 1)
+   proc_str="%d frames of %d atoms"%(traj.nframes,traj.natoms)
+   procs(proc_str,0,sp='-->>')
+   return traj
 
-   step_count+=1
-   filename="ReflectivitySpectrum.dat"
-   proc_str="Writing Data To "+ filename +" File ..."
-   procs(proc_str,step_count,sp='-->>')
-   Reflect=np.zeros((len(freq),6))
-   for i in range(6): 
-       Reflect[:,i]=((Refrac[:,i]-1)*(Refrac[:,i]-1)+Extic[:,i]*Extic[:,i])/((Refrac[:,i]+1)*(Refrac[:,i]+1)+Extic[:,i]*Extic[:,i])
-   data=np.vstack((energy,Reflect.T)).T
-   write_col_data(filename,data,head_line,e_fmt=True)
+def aimd_rdf(traj):
+   print("input the cutoff radius and the number of bins, i.e. 10 100")
+   wait_sep()
+   try:
+      toks=input().split()
+      rcut=float(toks[0]) if len(toks)>0 else 10.0
+      nbins=int(toks[1]) if len(toks)>1 else 100
+   except ValueError:
+      print("Unknow input!")
+      return
+   proc_str="Calculating All Partial RDFs ..."
+   procs(proc_str,2,sp='-->>')
+   (partials,radii,elements)=partial_rdf(traj.positions,traj.lattices,traj.species,
+                                         r=rcut,nbins=nbins,range=(0,rcut))
+   pairs=[(i,j) for i in range(len(elements)) for j in range(i,len(elements))]
+   filename="RDF.dat"
+   proc_str="Writting RDF To "+ filename +" File ..."
+   procs(proc_str,3,sp='-->>')
+   head_line="#%12s"%'r(Ang)'+"".join(["%12s"%(elements[i]+'-'+elements[j]) for (i,j) in pairs])
+   data=np.vstack([radii]+[partials[i,j] for (i,j) in pairs])
+   write_col_data(filename,data.T,head_line)
+
+def aimd_msd(traj):
+   print("input the time between two frames (POTIM*NBLOCK) in fs and the number of")
+   print("blocks for the error of the diffusion coefficient, i.e. 2.0 5")
+   wait_sep()
+   try:
+      toks=input().split()
+      timestep=float(toks[0])
+      nblocks=int(toks[1]) if len(toks)>1 else 5
+   except (ValueError,IndexError):
+      print("Unknow input!")
+      return
+   proc_str="Calculating Mean Square Displacement ..."
+   procs(proc_str,2,sp='-->>')
+   (data,atoms,elements)=msd(traj.positions,traj.lattices,traj.species)
+   time=timestep*np.arange(len(data))
+   filename="MSD.dat"
+   proc_str="Writting MSD To "+ filename +" File ..."
+   procs(proc_str,3,sp='-->>')
+   head_line="#%12s"%'Time(fs)'+"".join(["%12s"%element for element in elements])
+   write_col_data(filename,np.hstack((time[:,None],data)),head_line)
+   filename="MSD_atoms.dat"
+   proc_str="Writting MSD of Each Atom To "+ filename +" File ..."
+   procs(proc_str,4,sp='-->>')
+   head_line="#%12s"%'Time(fs)'+"".join(["%12s"%(element+str(i+1)) for (i,element) in enumerate(traj.species)])
+   write_col_data(filename,np.hstack((time[:,None],atoms)),head_line)
+   (values,errors,elements)=block_diffusion(traj.positions,traj.lattices,traj.species,
+                                            timestep,nblocks=nblocks)
+   for (element,value,error) in zip(elements,values,errors):
+      proc_str="Diffusion coefficient of %s: %.3e +/- %.1e cm^2/s"%(element,value,error)
+      procs(proc_str,0,sp='-->>')
+
+def aimd_vdos(traj):
+   print("input the time between two frames (POTIM*NBLOCK) in fs and the number of")
+   print("frames of one correlation segment, i.e. 1.0 2000")
+   wait_sep()
+   try:
+      toks=input().split()
+      timestep=float(toks[0])
+      segment=int(toks[1]) if len(toks)>1 else 2000
+   except (ValueError,IndexError):
+      print("Unknow input!")
+      return
+   proc_str="Calculating Velocity Autocorrelation Function ..."
+   procs(proc_str,2,sp='-->>')
+   (times,vacf,elements)=velocity_autocorrelation(traj.positions,traj.lattices,traj.species,
+                                                  timestep,segment=segment)
+   filename="VACF.dat"
+   proc_str="Writting VACF To "+ filename +" File ..."
+   procs(proc_str,3,sp='-->>')
+   head_line="#%12s%12s"%('Time(fs)','Total')+"".join(["%12s"%element for element in elements])
+   write_col_data(filename,np.hstack((times[:,None],vacf.sum(axis=1)[:,None],vacf)),head_line)
+   (freqs,dos)=vibrational_dos(times,vacf,nmodes=3*traj.natoms)
+   filename="VDOS.dat"
+   proc_str="Writting Vibrational DOS To "+ filename +" File ..."
+   procs(proc_str,4,sp='-->>')
+   head_line="#%12s%12s"%('Freq(THz)','Total')+"".join(["%12s"%element for element in elements])
+   write_col_data(filename,np.hstack((freqs[:,None],dos.sum(axis=1)[:,None],dos)),head_line)
 
 def aimd_analysis():
-   pass
+   traj=read_md_trajectory()
+   if traj is None:
+      return
+   print("which property would like to calculate ?")
+   print('{} >>> {}'.format('1 ','radial distribution function'))
+   print('{} >>> {}'.format('2 ','mean square displacement and diffusion coefficient'))
+   print('{} >>> {}'.format('3 ','velocity autocorrelation and vibrational DOS'))
+   wait_sep()
+   in_str=input().strip()
+   if in_str=="1":
+      aimd_rdf(traj)
+   elif in_str=="2":
+      aimd_msd(traj)
+   elif in_str=="3":
+      aimd_vdos(traj)
+   else:
+      print("unknown choice, check the input")
 
 #def elastic_analysis():
 #
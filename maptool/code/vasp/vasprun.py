@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+# coding: utf-8
+r'''
+ Lazy and selective parsing of vasprun.xml
+'''
+import warnings
+import numpy as np
+from xml.etree.ElementTree import iterparse
+from monty.io import zopen
+from pymatgen import Structure, Lattice
+from pymatgen.io.vasp import Kpoints
+from pymatgen.electronic_structure.core import Spin
+from pymatgen.electronic_structure.dos import Dos
+from pymatgen.electronic_structure.bandstructure import BandStructureSymmLine
+
+# comment of the dielectric function block used by pymatgen
+_DIELECTRIC_COMMENT = "INVERSE MACROSCOPIC DIELECTRIC TENSOR (including " \
+                      "local field effects in RPA (Hartree))"
+
+# attributes of LazyVasprun saved by as_arrays
+_ARRAY_KEYS = ['kpoints', 'kpoints_weights', 'tdos_energies', 'tdos', 'idos', 'pdos',
+               'eigenvalues', 'occupations', 'dielectric_energies', 'dielectric_real',
+               'dielectric_imag']
+_META_KEYS = ['parameters', 'atomic_symbols', 'efermi', 'pdos_orbitals', 'pdos_atoms']
+# arrays of as_arrays holding the data of each section
+SECTION_ARRAYS = {'kpoints': ['kpoints', 'kpoints_weights'],
+                  'tdos': ['tdos_energies', 'tdos', 'idos'],
+                  'pdos': ['pdos'],
+                  'eigenvalues': ['eigenvalues', 'occupations'],
+                  'dielectric': ['dielectric_energies', 'dielectric_real', 'dielectric_imag'],
+                  'initialpos': ['lattice_initialpos', 'positions_initialpos'],
+                  'finalpos': ['lattice_finalpos', 'positions_finalpos']}
+
+
+def _parse_param(elem):
+    text = elem.text.strip() if elem.text else ''
+    vtype = elem.attrib.get('type', 'float')
+    if vtype == 'logical':
+        return text.upper() in ['T', '.TRUE.', 'TRUE']
+    elif vtype == 'int':
+        return int(text)
+    elif vtype == 'string':
+        return text
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _rows(texts, ncol):
+    """
+    Decode the text of <r> or <v> rows into a (nrow, ncol) array.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        ret = np.fromstring(" ".join(texts), dtype=np.float64, sep=' ')
+    if ret.size != len(texts) * ncol:
+        ret = np.array(" ".join(texts).replace('*', ' nan ').split()[:len(texts) * ncol],
+                       dtype=np.float64)
+    return ret.reshape(len(texts), ncol)
+
+
+def sum_pdos(pdos, pdos_atoms, groups):
+    """
+    Sum the projected DOS over several groups of atoms in one pass.
+
+    Args:
+        pdos (numpy.ndarray): (nspin, natoms, norbitals, nedos)
+        pdos_atoms (list of int): atom index of the second axis of pdos
+        groups (list of list of int): atom index of each group, the
+                                      groups can overlap
+
+    Returns:
+        numpy.ndarray: (ngroups, nspin, norbitals, nedos)
+    """
+    column = dict([(atom, i) for (i, atom) in enumerate(pdos_atoms)])
+    weight = np.zeros((len(groups), pdos.shape[1]), dtype=pdos.dtype)
+    for (i, group) in enumerate(groups):
+        weight[i, [column[atom] for atom in set(group)]] = 1.0
+    return np.tensordot(weight, pdos, axes=([1], [1]))
+
+
+class LazyVasprun(object):
+    """
+    Selective vasprun.xml parser.
+
+    Only the requested sections are decoded, everything else is
+    discarded as it streams past, so the memory usage does not grow with
+    the number of ionic steps. The data of the ionic steps is taken from
+    the last one. If only the parameters and the initial structure are
+    requested, the parsing stops before the first ionic step.
+
+    Args:
+        filename (str): Path to vasprun.xml, can be compressed
+        parse_tdos (bool): total and integrated DOS
+        parse_pdos (bool): projected DOS
+        pdos_atoms (list of int): 0-based atom index whose projected DOS
+                                  is kept, all atoms if None
+        parse_eigen (bool): eigenvalues and occupations
+        parse_dielectric (bool): frequency dependent dielectric function
+        final_structure (bool): read the final structure, this requires
+                                scanning the whole file, otherwise the
+                                initial structure is read
+
+    Attributes:
+        parameters (dict): parameters in the <parameters> block
+        atomic_symbols (list of str)
+        efermi (float)
+        kpoints (numpy.ndarray): (nkpt, 3) fractional coordinates
+        kpoints_weights (numpy.ndarray): (nkpt,)
+        tdos_energies (numpy.ndarray): (nedos,)
+        tdos (numpy.ndarray): (nspin, nedos)
+        idos (numpy.ndarray): (nspin, nedos)
+        pdos (numpy.ndarray): (nspin, natoms, norbitals, nedos), natoms
+                              are the selected atoms in `pdos_atoms`
+        pdos_orbitals (list of str): orbital names of pdos
+        eigenvalues (numpy.ndarray): (nspin, nkpt, nband)
+        occupations (numpy.ndarray): (nspin, nkpt, nband)
+        dielectric_energies (numpy.ndarray): (nfreq,)
+        dielectric_real (numpy.ndarray): (nfreq, 6)
+        dielectric_imag (numpy.ndarray): (nfreq, 6)
+        sections (set of str): the requested sections
+    """
+
+    def __init__(self, filename,
+                 parse_tdos=False,
+                 parse_pdos=False,
+                 pdos_atoms=None,
+                 parse_eigen=False,
+                 parse_dielectric=False,
+                 final_structure=True):
+        self._reset(filename, pdos_atoms)
+        wanted = set(['parameters', 'atominfo', 'kpoints'])
+        wanted.add('finalpos' if final_structure else 'initialpos')
+        if parse_tdos:
+            wanted.add('tdos')
+        if parse_pdos:
+            wanted.add('pdos')
+        if parse_eigen:
+            wanted.add('eigenvalues')
+        if parse_dielectric:
+            wanted.add('dielectric')
+        if parse_tdos or parse_pdos or parse_eigen:
+            wanted.add('efermi')
+        self._parse(wanted)
+        self.sections = wanted
+        if 'finalpos' in wanted:
+            # the initial structure is read on the way
+            self.sections.add('initialpos')
+
+    def _reset(self, filename, pdos_atoms):
+        self.filename = filename
+        self.parameters = {}
+        self.atomic_symbols = []
+        self.efermi = None
+        self.kpoints = None
+        self.kpoints_weights = None
+        self.tdos_energies = None
+        self.tdos = None
+        self.idos = None
+        self.pdos = None
+        self.pdos_orbitals = None
+        self.pdos_atoms = pdos_atoms
+        self.eigenvalues = None
+        self.occupations = None
+        self.dielectric_energies = None
+        self.dielectric_real = None
+        self.dielectric_imag = None
+        self._lattice = {}
+        self._positions = {}
+        self.sections = set()
+
+    def as_arrays(self):
+        """
+        The parsed data as a json serializable dict and a dict of numpy
+        arrays, see `from_arrays`.
+        """
+        meta = dict([(key, getattr(self, key)) for key in _META_KEYS])
+        meta['sections'] = sorted(self.sections)
+        arrays = {}
+        for key in _ARRAY_KEYS:
+            if getattr(self, key) is not None:
+                arrays[key] = getattr(self, key)
+        for key in self._lattice:
+            arrays['lattice_' + key] = self._lattice[key]
+        for key in self._positions:
+            arrays['positions_' + key] = self._positions[key]
+        return meta, arrays
+
+    @classmethod
+    def from_arrays(cls, filename, meta, arrays):
+        """
+        Rebuild the object from the output of `as_arrays` without
+        parsing the file.
+        """
+        ret = cls.__new__(cls)
+        ret._reset(filename, None)
+        for key in _META_KEYS:
+            setattr(ret, key, meta.get(key))
+        ret.sections = set(meta.get('sections', []))
+        for key in arrays:
+            if key.startswith('lattice_'):
+                ret._lattice[key[len('lattice_'):]] = arrays[key]
+            elif key.startswith('positions_'):
+                ret._positions[key[len('positions_'):]] = arrays[key]
+            elif key in _ARRAY_KEYS:
+                setattr(ret, key, arrays[key])
+        return ret
+
+    @property
+    def is_spin(self):
+        return self.parameters.get('ISPIN', 1) == 2
+
+    @property
+    def nions(self):
+        return len(self.atomic_symbols)
+
+    def _structure(self, key):
+        if key in self._lattice and key in self._positions:
+            return Structure(Lattice(self._lattice[key]), self.atomic_symbols,
+                             self._positions[key])
+        return None
+
+    @property
+    def initial_structure(self):
+        """
+        The initial structure
+        """
+        return self._structure('initialpos')
+
+    @property
+    def final_structure(self):
+        """
+        The final structure, None if the file is parsed with
+        final_structure=False
+        """
+        return self._structure('finalpos')
+
+    @property
+    def structure(self):
+        """
+        The final structure if it is parsed, otherwise the initial one,
+        for the data independent of the atomic positions, i.e. the
+        species or the reciprocal lattice of a band calculation
+        """
+        ret = self.final_structure
+        return ret if ret is not None else self.initial_structure
+
+    @property
+    def dielectric(self):
+        """
+        (energies, real, imag) of the dielectric function, same layout as
+        pymatgen's Vasprun.dielectric
+        """
+        return (self.dielectric_energies, self.dielectric_real, self.dielectric_imag)
+
+    def _spin_dict(self, data):
+        ret = {Spin.up: data[0]}
+        if self.is_spin:
+            ret[Spin.down] = data[1]
+        return ret
+
+    def eigenvalue_band_properties(self, occu_tol=1e-8):
+        """
+        Band properties from the eigenvalues and occupations, same as
+        Vasprun.eigenvalue_band_properties of pymatgen.
+
+        Returns:
+            (float, float, float, bool): band gap, cbm, vbm and whether
+                                         the gap is direct
+        """
+        occupied = self.occupations > occu_tol
+        vbm = np.where(occupied, self.eigenvalues, -np.inf)
+        cbm = np.where(occupied, np.inf, self.eigenvalues)
+        # band edges of each k-point
+        vbm_k = vbm.max(axis=(0, 2))
+        cbm_k = cbm.min(axis=(0, 2))
+        (vbm, cbm) = (vbm_k.max(), cbm_k.min())
+        is_direct = bool(np.argmax(vbm_k) == np.argmin(cbm_k))
+        return max(cbm - vbm, 0.0), cbm, vbm, is_direct
+
+    def get_tdos(self):
+        """
+        Total DOS as a pymatgen Dos object
+        """
+        return Dos(self.efermi, self.tdos_energies, self._spin_dict(self.tdos))
+
+    def get_idos(self):
+        """
+        Integrated DOS as a pymatgen Dos object
+        """
+        return Dos(self.efermi, self.tdos_energies, self._spin_dict(self.idos))
+
+    def get_band_structure(self, kpoints_filename='KPOINTS', efermi=None):
+        """
+        Line mode band structure, mirrors Vasprun.get_band_structure of
+        pymatgen with line_mode=True.
+
+        Args:
+            kpoints_filename (str): KPOINTS file with the labels
+            efermi (float): Fermi level, the one in vasprun.xml by default
+        """
+        if efermi is None:
+            efermi = self.efermi
+        kpoint_file = Kpoints.from_file(kpoints_filename)
+        lattice_rec = Lattice(self.structure.lattice.reciprocal_lattice.matrix)
+        kpoints = self.kpoints
+        eigenvals = self._spin_dict(self.eigenvalues)
+
+        start = 0
+        zero_weight = np.where(self.kpoints_weights == 0.0)[0]
+        if self.parameters.get('LHFCALC', False) or len(zero_weight) > 0:
+            # hybrid band structure, only the zero weight k-points are kept
+            start = zero_weight[0] if len(zero_weight) > 0 else 0
+        labels_dict = {}
+        for i in range(start, len(kpoint_file.kpts)):
+            if kpoint_file.labels[i] is not None:
+                labels_dict[kpoint_file.labels[i]] = kpoint_file.kpts[i]
+        kpoints = kpoints[start:]
+        eigenvals = dict([(spin, val[start:].T) for (spin, val) in eigenvals.items()])
+        return BandStructureSymmLine(kpoints, eigenvals, lattice_rec, efermi,
+                                     labels_dict, structure=self.structure)
+
+    def _read_varray(self, name, texts, stack):
+        if 'kpoints' in stack:
+            if name == 'kpointlist':
+                self.kpoints = _rows(texts, 3)
+            elif name == 'weights':
+                self.kpoints_weights = _rows(texts, 1)[:, 0]
+        for key in ['initialpos', 'finalpos']:
+            if key in stack:
+                if name == 'basis':
+                    self._lattice[key] = _rows(texts, 3)
+                elif name == 'positions':
+                    self._positions[key] = _rows(texts, 3)
+
+    def _parse(self, wanted):
+        done = set()
+        stack = []
+        texts = []
+        fields = []
+        ions = []
+        ion = -1
+        nspin = 0
+        spin_owner = None
+        diel_valid = False
+        selected = None if self.pdos_atoms is None else set(self.pdos_atoms)
+        # the sections before the first ionic step
+        early_stop = wanted <= set(['parameters', 'atominfo', 'kpoints', 'initialpos'])
+        with zopen(self.filename, "rb") as f:
+            for event, elem in iterparse(f, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag in ['structure', 'array'] and 'name' in elem.attrib:
+                        stack.append(elem.attrib['name'])
+                    else:
+                        stack.append(tag)
+                    if tag == 'dielectricfunction':
+                        diel_valid = elem.attrib.get('comment', _DIELECTRIC_COMMENT) \
+                            == _DIELECTRIC_COMMENT
+                    elif tag in ['total', 'partial', 'eigenvalues', 'imag', 'real', 'varray']:
+                        texts = []
+                        fields = []
+                        ions = []
+                        ion = -1
+                        nspin = 0
+                        spin_owner = None
+                    elif tag == 'set':
+                        comment = elem.attrib.get('comment', '')
+                        if comment.startswith('ion'):
+                            ion = int(comment.split()[1]) - 1
+                            if selected is None or ion in selected:
+                                ions.append(ion)
+                        elif comment.startswith('spin'):
+                            if spin_owner is None:
+                                spin_owner = ion
+                            if ion == spin_owner:
+                                nspin += 1
+                    continue
+
+                key = stack.pop()
+                parent = stack[-1] if len(stack) > 0 else None
+                if tag == 'r' or tag == 'v':
+                    if parent == 'varray':
+                        texts.append(elem.text)
+                    elif 'dos' in stack:
+                        if 'total' in stack and 'tdos' in wanted:
+                            texts.append(elem.text)
+                        elif 'partial' in stack and 'pdos' in wanted and \
+                                len(ions) > 0 and ion == ions[-1]:
+                            texts.append(elem.text)
+                    elif 'eigenvalues' in stack and 'projected' not in stack:
+                        if 'eigenvalues' in wanted:
+                            texts.append(elem.text)
+                    elif 'dielectricfunction' in stack and diel_valid:
+                        texts.append(elem.text)
+                elif tag == 'field':
+                    fields.append(elem.text.strip())
+                elif tag == 'i':
+                    name = elem.attrib.get('name')
+                    if 'parameters' in stack:
+                        self.parameters[name] = _parse_param(elem)
+                    elif name == 'efermi' and parent == 'dos':
+                        self.efermi = float(elem.text)
+                        done.add('efermi')
+                elif tag == 'rc':
+                    if parent == 'set' and 'atoms' in stack:
+                        self.atomic_symbols.append(elem[0].text.strip())
+                elif tag == 'varray':
+                    self._read_varray(elem.attrib.get('name'), texts, stack)
+                elif tag == 'total' and 'dos' in stack and 'tdos' in wanted:
+                    data = _rows(texts, 3).reshape(nspin, -1, 3)
+                    self.tdos_energies = data[0, :, 0]
+                    self.tdos = data[:, :, 1]
+                    self.idos = data[:, :, 2]
+                    done.add('tdos')
+                elif tag == 'partial' and 'dos' in stack and 'pdos' in wanted:
+                    ncol = len(fields)
+                    data = _rows(texts, ncol).reshape(len(ions), nspin, -1, ncol)
+                    self.pdos = np.ascontiguousarray(data[:, :, :, 1:].transpose(1, 0, 3, 2))
+                    self.pdos_orbitals = fields[1:]
+                    self.pdos_atoms = ions
+                    done.add('pdos')
+                elif tag == 'eigenvalues' and 'projected' not in stack and \
+                        'eigenvalues' in wanted:
+                    data = _rows(texts, 2).reshape(nspin, len(self.kpoints), -1, 2)
+                    self.eigenvalues = data[:, :, :, 0]
+                    self.occupations = data[:, :, :, 1]
+                    done.add('eigenvalues')
+                elif tag in ['imag', 'real'] and diel_valid:
+                    data = _rows(texts, 7)
+                    self.dielectric_energies = data[:, 0]
+                    if tag == 'imag':
+                        self.dielectric_imag = data[:, 1:]
+                    else:
+                        self.dielectric_real = data[:, 1:]
+                        done.add('dielectric')
+                elif key in ['parameters', 'atominfo', 'kpoints', 'initialpos', 'finalpos']:
+                    done.add(key)
+
+                if tag != 'c':
+                    elem.clear()
+                if early_stop and wanted <= done:
+                    break
@@ -0,0 +1,589 @@
+#!/usr/bin/env python
+# coding: utf-8
+r'''
+ Fast input/output of VASP volumetric grids (CHG, CHGCAR, LOCPOT, ...)
+'''
+import os
+import re
+import itertools
+import json
+import shutil
+import warnings
+import numpy as np
+from monty.io import zopen
+
+# number of grid values written per line
+NPERLINE = 5
+# width of one Fortran formatted float, i.e. '-.12345678901E+01'
+FLOAT_WIDTH = 17
+# sidecar cache of parsed grids, i.e. CHG.mpt/
+CACHE_SUFFIX = '.mpt'
+CACHE_VERSION = 2
+# total size (bytes) of cached grids kept in one directory
+CACHE_MAX_SIZE = 16 * 1024**3
+
+
+def fortran_float(f):
+    """
+    Fortran codes print floats with a leading zero in scientific
+    notation. When writing CHGCAR files, we adopt this convention
+    to ensure written CHGCAR files are byte-to-byte identical to
+    their input files as far as possible.
+
+    Args:
+        f (float): value to be formatted
+
+    Returns:
+        str
+    """
+    s = "{:.10E}".format(f)
+    if s[0] != '-':
+        return "0."+s[0]+s[2:12]+'E'+"{:+03}".format(int(s[13:])+1)
+    else:
+        return "-."+s[1]+s[3:13]+'E'+"{:+03}".format(int(s[14:])+1)
+
+
+def _fortran_float_bytes(values):
+    """
+    Format a 1D array with the same convention as `fortran_float`,
+    all values at once.
+
+    Args:
+        values (numpy.ndarray): 1D float array
+
+    Returns:
+        numpy.ndarray of uint8 with shape (len(values), FLOAT_WIDTH), or
+        None if some value can not be handled by the fixed width path
+        (nan, inf or a three-digit exponent).
+    """
+    n = values.size
+    s = ("%.10E" * n) % tuple(np.abs(values).tolist())
+    raw = np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+    if raw.size != 16 * n:
+        return None
+    raw = raw.reshape(n, 16)
+    expo = (raw[:, 14].astype(np.int64) - 48) * 10 + (raw[:, 15] - 48)
+    expo = np.where(raw[:, 13] == ord('-'), -expo, expo) + 1
+    aexpo = np.abs(expo)
+    if n > 0 and aexpo.max() >= 100:
+        return None
+
+    ret = np.empty((n, FLOAT_WIDTH), dtype=np.uint8)
+    ret[:, 0] = np.where(np.signbit(values), ord('-'), ord('0'))
+    ret[:, 1] = ord('.')
+    ret[:, 2] = raw[:, 0]
+    ret[:, 3:13] = raw[:, 2:12]
+    ret[:, 13] = ord('E')
+    ret[:, 14] = np.where(expo < 0, ord('-'), ord('+'))
+    ret[:, 15] = 48 + aexpo // 10
+    ret[:, 16] = 48 + aexpo % 10
+    return ret
+
+
+def format_grid_lines(values):
+    """
+    Format values into full lines of `NPERLINE` fortran floats.
+
+    Args:
+        values (numpy.ndarray): 1D array, the size must be a multiple
+                                of NPERLINE
+
+    Returns:
+        str
+    """
+    assert values.size % NPERLINE == 0
+    nrow = values.size // NPERLINE
+    fmt = _fortran_float_bytes(values)
+    if fmt is None:
+        lines = [" " + " ".join([fortran_float(x) for x in row]) + "\n"
+                 for row in values.reshape(nrow, NPERLINE).tolist()]
+        return "".join(lines)
+    body = np.full((nrow, NPERLINE, FLOAT_WIDTH + 1), ord(' '), dtype=np.uint8)
+    body[:, :, :FLOAT_WIDTH] = fmt.reshape(nrow, NPERLINE, FLOAT_WIDTH)
+    body = body.reshape(nrow, NPERLINE * (FLOAT_WIDTH + 1))
+    body[:, -1] = ord('\n')
+    lead = np.full((nrow, 1), ord(' '), dtype=np.uint8)
+    return np.hstack((lead, body)).tobytes().decode('ascii')
+
+
+def write_grid_chunks(f, dim, chunks):
+    """
+    Write a 3D grid given as consecutive chunks of its Fortran ordered
+    (x fastest) values, five values per line.
+
+    Args:
+        f: file object opened in text mode
+        dim (list of int): grid dimension
+        chunks: iterable of 1D numpy.ndarray
+
+    Returns:
+        None
+    """
+    f.write("   {}   {}   {}\n".format(dim[0], dim[1], dim[2]))
+    tail = np.empty(0)
+    for block in chunks:
+        if tail.size > 0:
+            block = np.concatenate((tail, block))
+        nfull = block.size - block.size % NPERLINE
+        if nfull > 0:
+            f.write(format_grid_lines(block[:nfull]))
+        tail = block[nfull:]
+    f.write(" " + "".join([fortran_float(x) + " " for x in tail.tolist()]) + " \n")
+
+
+def write_grid(f, data, chunk_size=1048576):
+    """
+    Write a 3D grid to an opened file in Fortran order (x fastest),
+    five values per line. The grid is formatted and streamed in slabs
+    along z, so the memory usage is bounded by `chunk_size`.
+
+    Args:
+        f: file object opened in text mode
+        data (numpy.ndarray): 3D grid data
+        chunk_size (int): approximate number of values per slab
+
+    Returns:
+        None
+    """
+    a = data.shape
+    nslab = max(1, chunk_size // max(1, a[0] * a[1]))
+    write_grid_chunks(f, a, (np.ravel(data[:, :, k:k + nslab], order='F')
+                             for k in range(0, a[2], nslab)))
+
+
+def _parse_values(text, count):
+    """
+    Decode `count` floats from a block of text.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        ret = np.fromstring(text, dtype=np.float64, sep=' ')
+    if ret.size != count:
+        # VASP drops the 'E' for three-digit exponents, i.e. 0.12345-100
+        text = re.sub(r'(\d)([+-]\d{3})', r'\1E\2', text)
+        ret = np.array(text.split(), dtype=np.float64)
+    if ret.size != count:
+        raise RuntimeError('broken volumetric data block, expect %d values but get %d'
+                           % (count, ret.size))
+    return ret
+
+
+def _read_header(f):
+    """
+    Read the structure part of a volumetric file.
+
+    Returns:
+        (str, list of str): header in POSCAR format, and the grid
+                            dimension line after the header
+    """
+    lines = [f.readline() for ii in range(7)]
+    counts = lines[5].split()
+    if not all([x.isdigit() for x in counts]):
+        # vasp5 format, the species line is followed by the counts
+        counts = lines[6].split()
+        lines.append(f.readline())
+    natoms = sum([int(x) for x in counts])
+    if lines[-1].strip()[0] in 'sS':
+        # selective dynamics
+        lines.append(f.readline())
+    lines.extend([f.readline() for ii in range(natoms)])
+    dim_line = f.readline().split()
+    while len(dim_line) == 0:
+        dim_line = f.readline().split()
+    return "".join(lines), dim_line
+
+
+class _GridReader(object):
+    """
+    Decode the values of one grid block on demand. The file must be
+    positioned just after the grid dimension line.
+    """
+    def __init__(self, f, ngrid):
+        self.f = f
+        self.unread = ngrid
+        first = f.readline()
+        self.nperline = len(first.split())
+        self.buf = _parse_values(first, min(self.nperline, ngrid))
+        self.unread -= self.buf.size
+
+    def read(self, n):
+        """
+        Returns the next `n` values (less at the end of the block).
+        """
+        parts = [self.buf]
+        have = self.buf.size
+        while have < n and self.unread > 0:
+            nlines = -(-min(n - have, self.unread) // self.nperline)
+            lines = list(itertools.islice(self.f, nlines))
+            nvalue = min(nlines * self.nperline, self.unread)
+            if len(lines) < nlines:
+                raise RuntimeError('unexpected end of volumetric data')
+            parts.append(_parse_values("".join(lines), nvalue))
+            have += nvalue
+            self.unread -= nvalue
+        values = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        self.buf = values[n:]
+        return values[:n]
+
+
+def _skip_to_next_block(f, dim_line, aug=None):
+    """
+    Skip the augmentation occupancies and magnetic moments after a grid
+    block, the skipped augmentation lines are appended to `aug`.
+
+    Returns:
+        bool, whether another grid block follows
+    """
+    for line in f:
+        if line.split() == dim_line:
+            return True
+        if aug is not None and (len(aug) > 0 or 'augmentation' in line):
+            aug.append(line)
+    return False
+
+
+def _new_grid(dim, dtype, filename, iblock, scratch_dir):
+    if scratch_dir is None:
+        return np.empty(dim, dtype=dtype, order='F')
+    os.makedirs(scratch_dir, exist_ok=True)
+    fname = os.path.join(scratch_dir, '%s.%d.npy' % (os.path.basename(filename), iblock))
+    return np.lib.format.open_memmap(fname, mode='w+', dtype=dtype,
+                                     shape=tuple(dim), fortran_order=True)
+
+
+def read_volumetric(filename, dtype=np.float64, read_aug=False,
+                    scratch_dir=None, chunk_lines=65536):
+    """
+    Read a VASP volumetric file (CHG, CHGCAR, LOCPOT, ELFCAR, ...).
+
+    The header is parsed once, then every grid block is decoded
+    `chunk_lines` lines at a time straight into a preallocated array,
+    so only one copy of the grid is kept in memory. The augmentation
+    occupancies of CHGCAR are skipped unless `read_aug` is set.
+
+    Args:
+        filename (str): path of the volumetric file, can be compressed
+        dtype: numpy dtype of the grid, np.float64 or np.float32
+        read_aug (bool): keep the augmentation lines
+        scratch_dir (str): if given, grids are stored as memory-mapped
+                           .npy files in this directory
+        chunk_lines (int): number of lines decoded at a time
+
+    Returns:
+        (str, dict, dict): header in POSCAR format, the grid data with
+        keys 'total' and 'diff' ('diff_x', 'diff_y', 'diff_z' for the
+        non-collinear case), and the augmentation lines for every key.
+    """
+    grids = []
+    augs = []
+    with zopen(filename, "rt") as f:
+        header, dim_line = _read_header(f)
+        dim = [int(x) for x in dim_line]
+        ngrid = dim[0] * dim[1] * dim[2]
+        next_block = True
+        while next_block:
+            grid = _new_grid(dim, dtype, filename, len(grids), scratch_dir)
+            flat = grid.reshape(-1, order='F')
+            reader = _GridReader(f, ngrid)
+            count = 0
+            while count < ngrid:
+                values = reader.read(chunk_lines * reader.nperline)
+                flat[count:count + values.size] = values
+                count += values.size
+            grids.append(grid)
+            aug = [] if read_aug else None
+            next_block = _skip_to_next_block(f, dim_line, aug)
+            augs.append(aug)
+
+    if len(grids) == 4:
+        keys = ['total', 'diff_x', 'diff_y', 'diff_z']
+    else:
+        keys = ['total', 'diff'][:len(grids)]
+    data = dict(zip(keys, grids))
+    data_aug = dict(zip(keys, augs)) if read_aug else {}
+    return header, data, data_aug
+
+
+def _source_stamp(filename):
+    st = os.stat(filename)
+    return {'path': os.path.abspath(filename),
+            'size': st.st_size,
+            'mtime': st.st_mtime}
+
+
+def _estimate_blocks(filename, ngrid, line):
+    """
+    Number of grids in a volumetric file estimated from the size of its
+    text and the width of the first line of values, 4 (non-collinear)
+    for a compressed file
+    """
+    nvalues = len(line.split())
+    if nvalues == 0 or \
+       os.path.splitext(filename)[1].lower() in ['.gz', '.bz2', '.xz', '.z', '.lzma']:
+        return 4
+    block_text = float(len(line)) / nvalues * ngrid
+    return int(min(4, max(1, round(os.path.getsize(filename) / block_text))))
+
+
+def _cache_size(cache_dir):
+    return sum([os.path.getsize(os.path.join(cache_dir, ii))
+                for ii in os.listdir(cache_dir)])
+
+
+def _read_cache(filename, dtype):
+    cache_dir = filename + CACHE_SUFFIX
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    if not os.path.isfile(meta_file):
+        return None
+    with open(meta_file) as fp:
+        meta = json.load(fp)
+    if meta.get('version') != CACHE_VERSION or \
+       meta.get('kind') != 'volumetric' or \
+       meta.get('source') != _source_stamp(filename) or \
+       meta.get('dtype') != np.dtype(dtype).str:
+        return None
+    data = {}
+    for ii, key in enumerate(meta['keys']):
+        data[key] = np.load(os.path.join(cache_dir, '%s.%d.npy' % (os.path.basename(filename), ii)),
+                            mmap_mode='r')
+    # the modification time of meta.json records the last usage
+    os.utime(meta_file)
+    return meta['header'], data, {}
+
+
+def load_volumetric(filename, dtype=np.float64, use_cache=True,
+                    max_size=CACHE_MAX_SIZE):
+    """
+    Read a volumetric file through a sidecar cache.
+
+    The first call parses the text file with `read_volumetric` directly
+    into .npy files under `filename + CACHE_SUFFIX`, keyed on the path,
+    size and modification time of the source. Later calls open these
+    files with mmap instead of parsing again. A stale cache is rebuilt.
+
+    Args:
+        filename (str): path of the volumetric file
+        dtype: numpy dtype of the grid, np.float64 or np.float32
+        use_cache (bool): read and write the cache
+        max_size (int): size limit (bytes) of all the volumetric caches
+                        in the directory of `filename`, the least
+                        recently used ones are removed first, a file
+                        whose grids exceed it alone is not cached
+
+    Returns:
+        (str, dict, dict): same as `read_volumetric`
+    """
+    if not use_cache:
+        return read_volumetric(filename, dtype=dtype)
+    ret = _read_cache(filename, dtype)
+    if ret is not None:
+        return ret
+
+    clear_cache(filename)
+    cache_dir = filename + CACHE_SUFFIX
+    with zopen(filename, "rt") as f:
+        _, dim_line = _read_header(f)
+        line = f.readline()
+    ngrid = int(np.prod([int(x) for x in dim_line]))
+    # all the grids of a spin or non-collinear file are cached
+    cache_size = _estimate_blocks(filename, ngrid, line) * ngrid * np.dtype(dtype).itemsize
+    if cache_size > max_size:
+        return read_volumetric(filename, dtype=dtype)
+
+    header, data, data_aug = read_volumetric(filename, dtype=dtype,
+                                             scratch_dir=cache_dir)
+    for key in data:
+        data[key].flush()
+    meta = {'version': CACHE_VERSION,
+            'kind': 'volumetric',
+            'source': _source_stamp(filename),
+            'dtype': np.dtype(dtype).str,
+            'keys': list(data.keys()),
+            'header': header}
+    with open(os.path.join(cache_dir, 'meta.json'), 'w') as fp:
+        json.dump(meta, fp, indent=4)
+    clean_cache(os.path.dirname(os.path.abspath(filename)), max_size=max_size,
+                kind='volumetric', keep=[cache_dir])
+    return header, data, data_aug
+
+
+def clear_cache(filename):
+    """
+    Remove the cache of one volumetric file.
+
+    Args:
+        filename (str): path of the volumetric file
+
+    Returns:
+        bool, whether a cache is removed
+    """
+    cache_dir = filename + CACHE_SUFFIX
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+        return True
+    return False
+
+
+def _cache_kind(meta_file):
+    try:
+        with open(meta_file) as fp:
+            return json.load(fp).get('kind')
+    except ValueError:
+        return None
+
+
+def clean_cache(path='.', max_size=0, kind=None, keep=None):
+    """
+    Remove the caches in a directory, the least recently used first,
+    until the total size is not larger than `max_size`. With the default
+    `max_size`, all the caches are removed.
+
+    Args:
+        path (str): directory to be cleaned
+        max_size (int): size limit in bytes
+        kind (str): only the caches of this kind, i.e. 'volumetric' or
+                    'vasprun', are counted and removed, all if None
+        keep (list of str): cache directories counted but never removed
+
+    Returns:
+        list of str, the removed cache directories
+    """
+    keep = [os.path.abspath(ii) for ii in (keep or [])]
+    caches = []
+    for ii in os.listdir(path):
+        cache_dir = os.path.join(path, ii)
+        meta_file = os.path.join(cache_dir, 'meta.json')
+        if ii.endswith(CACHE_SUFFIX) and os.path.isfile(meta_file):
+            if kind is not None and _cache_kind(meta_file) != kind:
+                continue
+            caches.append((os.path.getmtime(meta_file), _cache_size(cache_dir), cache_dir))
+    caches.sort()
+    total = sum([ii[1] for ii in caches])
+    removed = []
+    for _, size, cache_dir in caches:
+        if total <= max_size:
+            break
+        if os.path.abspath(cache_dir) in keep:
+            continue
+        shutil.rmtree(cache_dir)
+        removed.append(cache_dir)
+        total -= size
+    return removed
+
+
+def parse_linear_expression(expr):
+    """
+    Parse a linear combination of volumetric files.
+
+    Example:
+    >>> parse_linear_expression('CHG_AB - CHG_A - 0.5*CHG_B')
+    [(1.0, 'CHG_AB'), (-1.0, 'CHG_A'), (-0.5, 'CHG_B')]
+
+    Args:
+        expr (str): terms are separated by ' + ' or ' - ', every term is
+                    a file name with an optional 'coefficient*' prefix
+
+    Returns:
+        list of (float, str)
+    """
+    expr = re.sub(r'\s*\*\s*', '*', expr.strip())
+    terms = []
+    sign = None
+    for token in expr.split():
+        if token in ['+', '-']:
+            if sign is not None:
+                raise RuntimeError('invalid expression: %s' % expr)
+            sign = 1.0 if token == '+' else -1.0
+            continue
+        if sign is None and len(terms) > 0:
+            raise RuntimeError('missing operator before %s in expression: %s' % (token, expr))
+        if '*' in token:
+            coef, name = token.split('*', 1)
+            try:
+                coef = float(coef)
+            except ValueError:
+                raise RuntimeError('invalid coefficient %s in expression: %s' % (coef, expr))
+        elif token[0] in '+-':
+            coef, name = float(token[0] + '1'), token[1:]
+        else:
+            coef, name = 1.0, token
+        terms.append(((1.0 if sign is None else sign) * coef, name))
+        sign = None
+    if len(terms) == 0 or sign is not None:
+        raise RuntimeError('invalid expression: %s' % expr)
+    return terms
+
+
+def header_lattice(header):
+    """
+    Lattice matrix (Angstrom) of a header returned by `read_volumetric`.
+    """
+    lines = header.split('\n')
+    scale = float(lines[1].split()[0])
+    latt = np.array([[float(x) for x in line.split()[:3]] for line in lines[2:5]])
+    if scale < 0:
+        return latt * (-scale / abs(np.linalg.det(latt)))**(1. / 3)
+    return latt * scale
+
+
+def combine_volumetric(terms, output, chunk_lines=65536):
+    """
+    Write the linear combination of the first grid block ('total') of
+    several volumetric files, i.e. rho(AB)-rho(A)-rho(B).
+
+    The files are checked for the same grid dimension and lattice, then
+    all of them are decoded block by block and the combination is
+    written immediately, so the memory usage is about one block per
+    input instead of full grids. The structure of the first term is
+    used in the output.
+
+    Args:
+        terms (list of (float, str)): coefficient and file name of every
+                                      term, see `parse_linear_expression`
+        output (str): name of the output file
+        chunk_lines (int): number of lines decoded at a time
+
+    Returns:
+        None
+    """
+    assert len(terms) > 0
+    files = []
+    try:
+        readers = []
+        for coef, fname in terms:
+            f = zopen(fname, "rt")
+            files.append(f)
+            header, dim_line = _read_header(f)
+            if len(readers) == 0:
+                header0, dim_line0, fname0 = header, dim_line, fname
+                dim = [int(x) for x in dim_line]
+                ngrid = dim[0] * dim[1] * dim[2]
+            elif dim_line != dim_line0:
+                raise RuntimeError('grid %s of %s does not match grid %s of %s'
+                                   % ('x'.join(dim_line), fname, 'x'.join(dim_line0), fname0))
+            elif not np.allclose(header_lattice(header), header_lattice(header0),
+                                 atol=1e-4):
+                raise RuntimeError('lattice of %s does not match lattice of %s' % (fname, fname0))
+            readers.append(_GridReader(f, ngrid))
+
+        nchunk = chunk_lines * NPERLINE
+
+        def _chunks():
+            count = 0
+            while count < ngrid:
+                ret = None
+                for (coef, _), reader in zip(terms, readers):
+                    values = reader.read(nchunk)
+                    if ret is None:
+                        ret = coef * values
+                    else:
+                        ret += coef * values
+                count += ret.size
+                yield ret
+
+        with zopen(output, "wt") as f:
+            f.write(header0 + " \n")
+            write_grid_chunks(f, dim, _chunks())
+    finally:
+        for f in files:
+            f.close()
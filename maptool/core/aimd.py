@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from typing import List, Tuple
+from nptyping import NDArray
+from scipy.spatial import cKDTree
+from pymatgen import Element
+from maptool import mlog
+from maptool.util.constants import KB, Joule2eV
+
+# distances below are the atom itself
+ZERO_TOL = 1e-8
+# Angstrom^2/fs to cm^2/s
+DIFFUSION_UNIT = 0.1
+# 1/fs to THz
+FREQUENCY_UNIT = 1000.0
+# shortest block of `block_diffusion`, a few lags in the fit window
+MIN_BLOCK_FRAMES = 10
+
+
+def _frame_lattices(lattices: NDArray, nframes: int) -> NDArray:
+    lattices = np.asarray(lattices, dtype=float)
+    if lattices.ndim == 2:
+        return np.broadcast_to(lattices, (nframes, 3, 3))
+    return lattices
+
+
+def _image_shifts(lattice: NDArray, r: float) -> NDArray:
+    '''
+    Lattice translations whose images can be closer than r to an atom in
+    the cell, (nimages, 3) in Cartesian coordinates
+    '''
+    # number of images along each axis from the spacing of the planes
+    recip = np.linalg.inv(lattice).T
+    nmax = np.ceil(r * np.linalg.norm(recip, axis=1)).astype(int)
+    grid = np.mgrid[-nmax[0]:nmax[0] + 1,
+                    -nmax[1]:nmax[1] + 1,
+                    -nmax[2]:nmax[2] + 1].reshape(3, -1).T
+    return np.dot(grid, lattice)
+
+
+def pair_distances(frac:    NDArray,
+                   lattice: NDArray,
+                   r:       float) -> Tuple[NDArray, NDArray, NDArray]:
+    '''
+    All the pairs of atoms closer than r including the periodic images,
+    by a KD-tree of the atoms in the cell and their images
+
+    @in
+      - frac, np.ndarray, (natoms, 3) fractional coordinates
+      - lattice, np.ndarray, (3, 3)
+      - r, float, cutoff radius
+    @out
+      - np.1darray, index of the center atoms
+      - np.1darray, index of the neighbors
+      - np.1darray, distances
+    '''
+    natoms = len(frac)
+    # wrapped into the cell, so the images cover the sphere around each atom
+    cart = np.dot(np.mod(frac, 1.0), lattice)
+    shifts = _image_shifts(lattice, r)
+    images = (cart[None, :, :] + shifts[:, None, :]).reshape(-1, 3)
+    pairs = cKDTree(cart).sparse_distance_matrix(cKDTree(images), r, output_type='ndarray')
+    pairs = pairs[pairs['v'] > ZERO_TOL]
+    return pairs['i'], pairs['j'] % natoms, pairs['v']
+
+
+def _rdf_frames(args) -> NDArray:
+    (positions, lattices, codes, nel, r, nbins, range) = args
+    width = (range[1] - range[0]) / nbins
+    hist = np.zeros(nel * nel * nbins)
+    for (frac, lattice) in zip(positions, lattices):
+        (centers, neighbors, dist) = pair_distances(frac, lattice, r)
+        valid = (dist >= range[0]) & (dist <= range[1])
+        ibin = np.minimum(((dist[valid] - range[0]) / width).astype(int), nbins - 1)
+        key = (codes[centers[valid]] * nel + codes[neighbors[valid]]) * nbins + ibin
+        # weighted by the volume for the density of each frame
+        hist += np.bincount(key, minlength=nel * nel * nbins) * abs(np.linalg.det(lattice))
+    return hist
+
+
+def partial_rdf(positions:                NDArray,
+                lattices:                 NDArray,
+                species:                List[str],
+                r:                        float = 10,
+                nbins:                      int = 80,
+                range:      Tuple[float, float] = (0, 10),
+                nproc:                      int = None) -> Tuple[NDArray, NDArray, List[str]]:
+    '''
+    All the partial radial distribution functions g_ab(r) of a
+    trajectory in one sweep
+
+    @in
+      - positions, np.ndarray, (nframes, natoms, 3) fractional coordinates
+      - lattices, np.ndarray, (3, 3) or (nframes, 3, 3)
+      - species, [str], symbol of each atom
+      - r, float, max radius
+      - nbins, int, number of bars in histogram
+      - range, (float, float), range of the histogram
+      - nproc, int, number of processes, the number of cpus by default
+    @out
+      - np.3darray, (nelements, nelements, nbins), g_ab(r)
+      - np.1darray, radii
+      - [str], elements in the order of the first appearance
+    '''
+    nframes = len(positions)
+    lattices = _frame_lattices(lattices, nframes)
+    elements = list(dict.fromkeys(species))
+    nel = len(elements)
+    codes = np.array([elements.index(ii) for ii in species])
+    counts = np.bincount(codes, minlength=nel)
+
+    # a few chunks per process for the load balance
+    nchunks = 1 if nproc == 1 else min(nframes, 4 * (nproc or cpu_count()))
+    tasks = []
+    for ii in np.array_split(np.arange(nframes), nchunks):
+        frames = slice(ii[0], ii[-1] + 1)
+        tasks.append((positions[frames], lattices[frames], codes, nel, r, nbins, range))
+    if nproc == 1 or len(tasks) <= 1:
+        hist = sum([_rdf_frames(task) for task in tasks])
+    else:
+        pool = Pool(processes=nproc)
+        try:
+            hist = sum(pool.map(_rdf_frames, tasks))
+        finally:
+            pool.close()
+            pool.join()
+
+    edges = np.linspace(range[0], range[1], nbins + 1)
+    shells = 4 * np.pi * (edges[1:]**3 - edges[:-1]**3) / 3
+    norm = shells[None, None, :] * counts[:, None, None] * counts[None, :, None] * nframes
+    rdf = hist.reshape(nel, nel, nbins) / norm
+    radii = 0.5 * (edges[1:] + edges[:-1])
+    return (rdf, radii, elements)
+
+
+def unwrap_positions(positions: NDArray,
+                     lattices:  NDArray) -> NDArray:
+    '''
+    Continuous Cartesian trajectory from the wrapped fractional
+    coordinates, the atoms are assumed to move less than half of the
+    cell between two frames
+
+    @in
+      - positions, np.ndarray, (nframes, natoms, 3) fractional coordinates
+      - lattices, np.ndarray, (3, 3) or (nframes, 3, 3)
+    @out
+      - np.ndarray, (nframes, natoms, 3) Cartesian coordinates (Angstrom)
+    '''
+    positions = np.asarray(positions, dtype=np.float64)
+    lattices = _frame_lattices(lattices, len(positions))
+    steps = np.diff(positions, axis=0)
+    steps -= np.round(steps)
+    # the displacement of each step in the cell of its end frame
+    cart = np.empty(positions.shape)
+    cart[0] = np.dot(positions[0], lattices[0])
+    cart[1:] = np.einsum('fni,fij->fnj', steps, lattices[1:])
+    return np.cumsum(cart, axis=0)
+
+
+def msd_fft(coords: NDArray) -> NDArray:
+    '''
+    Mean square displacement of each atom averaged over all time origins
+    by the FFT algorithm, O(N log N) in the number of frames
+
+      MSD(m) = 1/(N-m) sum_k |r(k+m) - r(k)|^2
+             = S1(m) - 2 S2(m)
+
+    S1 is from cumulative sums of |r(k)|^2 and S2 is the position
+    autocorrelation from the zero-padded FFT.
+
+    @in
+      - coords, np.ndarray, (nframes, natoms, 3) unwrapped coordinates
+    @out
+      - np.ndarray, (nframes, natoms), MSD for the lag 0 ... nframes-1
+    '''
+    coords = np.asarray(coords, dtype=np.float64)
+    nframes = coords.shape[0]
+    count = (nframes - np.arange(nframes))[:, None]
+
+    sq = np.sum(coords**2, axis=-1)
+    zero = np.zeros((1,) + sq.shape[1:])
+    head = np.concatenate((zero, np.cumsum(sq, axis=0)[:-1]))
+    tail = np.concatenate((zero, np.cumsum(sq[::-1], axis=0)[:-1]))
+    s1 = (2 * np.sum(sq, axis=0) - head - tail) / count
+
+    nfft = 2 * nframes
+    spec = np.fft.rfft(coords, n=nfft, axis=0)
+    s2 = np.fft.irfft(np.abs(spec)**2, n=nfft, axis=0)[:nframes]
+    s2 = np.sum(s2, axis=-1) / count
+    # the rounding errors of the FFT around 0
+    return np.maximum(s1 - 2 * s2, 0.0)
+
+
+def msd(positions:             NDArray,
+        lattices:              NDArray,
+        species:             List[str],
+        remove_drift:            bool = True) -> Tuple[NDArray, NDArray, List[str]]:
+    '''
+    Mean square displacement of each element and each atom
+
+    @in
+      - positions, np.ndarray, (nframes, natoms, 3) fractional coordinates
+      - lattices, np.ndarray, (3, 3) or (nframes, 3, 3)
+      - species, [str], symbol of each atom
+      - remove_drift, bool, subtract the drift of the center of the cell
+    @out
+      - np.2darray, (nframes, nelements), MSD of each element (Angstrom^2)
+      - np.2darray, (nframes, natoms), MSD of each atom
+      - [str], elements in the order of the first appearance
+    '''
+    coords = unwrap_positions(positions, lattices)
+    if remove_drift:
+        coords -= np.mean(coords - coords[:1], axis=1, keepdims=True)
+    atoms = msd_fft(coords)
+    elements = list(dict.fromkeys(species))
+    codes = np.array([elements.index(ii) for ii in species])
+    weight = np.zeros((len(species), len(elements)))
+    weight[np.arange(len(species)), codes] = 1.0 / np.bincount(codes)[codes]
+    return np.dot(atoms, weight), atoms, elements
+
+
+def diffusion_coefficient(msd_data: NDArray,
+                          timestep:   float,
+                          fit_range: Tuple[float, float] = (0.1, 0.5),
+                          dim:         int = 3) -> NDArray:
+    '''
+    Diffusion coefficient from the slope of the MSD, D = slope/(2 dim)
+
+    @in
+      - msd_data, np.ndarray, (nlags, ...) MSD (Angstrom^2)
+      - timestep, float, time between two frames (fs)
+      - fit_range, (float, float), fraction of the lags used in the linear
+        fit, the short time ballistic part and the noisy long lags are
+        excluded
+      - dim, int, dimension of the diffusion
+    @out
+      - np.ndarray, D in cm^2/s with the shape of msd_data[0]
+    '''
+    nlags = len(msd_data)
+    lags = np.arange(int(fit_range[0] * nlags), max(int(fit_range[1] * nlags), 2))
+    times = lags * timestep
+    data = np.asarray(msd_data)[lags].reshape(len(lags), -1)
+    slope = np.polyfit(times, data, 1)[0]
+    return (slope / (2 * dim) * DIFFUSION_UNIT).reshape(np.shape(msd_data)[1:])
+
+
+def block_diffusion(positions:              NDArray,
+                    lattices:               NDArray,
+                    species:              List[str],
+                    timestep:                 float,
+                    nblocks:                    int = 5,
+                    fit_range: Tuple[float, float] = (0.1, 0.5),
+                    remove_drift:              bool = True) -> Tuple[NDArray, NDArray, List[str]]:
+    '''
+    Block averaged diffusion coefficient of each element, the trajectory
+    is split into nblocks contiguous blocks which are analysed separately.
+    The number of blocks is reduced so that each block has at least
+    MIN_BLOCK_FRAMES frames.
+
+    @in
+      - positions, lattices, species, see `msd`
+      - timestep, float, time between two frames (fs)
+      - nblocks, int, number of blocks
+      - fit_range, (float, float), see `diffusion_coefficient`
+    @out
+      - np.1darray, mean D of each element (cm^2/s)
+      - np.1darray, standard error of the mean
+      - [str], elements
+    '''
+    nframes = len(positions)
+    if nframes < MIN_BLOCK_FRAMES:
+        raise ValueError('At least %d frames are needed for the diffusion coefficient, got %d'
+                         % (MIN_BLOCK_FRAMES, nframes))
+    if nframes // nblocks < MIN_BLOCK_FRAMES:
+        mlog.warning('%d frames are too short for %d blocks, use %d blocks'
+                     % (nframes, nblocks, nframes // MIN_BLOCK_FRAMES))
+        nblocks = nframes // MIN_BLOCK_FRAMES
+    lattices = _frame_lattices(lattices, nframes)
+    values = []
+    for ii in np.array_split(np.arange(nframes), nblocks):
+        frames = slice(ii[0], ii[-1] + 1)
+        (data, _, elements) = msd(positions[frames], lattices[frames], species, remove_drift)
+        values.append(diffusion_coefficient(data, timestep, fit_range))
+    values = np.array(values)
+    error = np.std(values, axis=0, ddof=1) / np.sqrt(nblocks) if nblocks > 1 else \
+        np.zeros(values.shape[1])
+    return np.mean(values, axis=0), error, elements
+
+
+def arrhenius_fit(temperatures: List[float],
+                  diffusivities: List[float]) -> Tuple[float, float, float]:
+    '''
+    Fit D = D0 exp(-Ea/(kB T)) to the diffusion coefficients of the runs
+    at several temperatures
+
+    @in
+      - temperatures, [float], (K)
+      - diffusivities, [float], (cm^2/s)
+    @out
+      - float, activation energy Ea (eV)
+      - float, prefactor D0 (cm^2/s)
+      - float, standard error of Ea (eV), 0 for two temperatures
+    '''
+    kb = KB * Joule2eV
+    x = 1.0 / (kb * np.asarray(temperatures, dtype=float))
+    y = np.log(np.asarray(diffusivities, dtype=float))
+    if len(x) > 2:
+        (coef, cov) = np.polyfit(x, y, 1, cov=True)
+        error = np.sqrt(cov[0, 0])
+    else:
+        coef = np.polyfit(x, y, 1)
+        error = 0.0
+    return -coef[0], np.exp(coef[1]), error
+
+
+def finite_velocities(positions: NDArray,
+                      lattices:  NDArray,
+                      timestep:    float) -> NDArray:
+    '''
+    Velocities from the displacements between consecutive frames, the
+    velocity i is at the middle of the frames i and i+1
+
+    @in
+      - positions, np.ndarray, (nframes, natoms, 3) fractional coordinates
+      - lattices, np.ndarray, (3, 3) or (nframes, 3, 3)
+      - timestep, float, time between two frames (fs)
+    @out
+      - np.ndarray, (nframes-1, natoms, 3) Cartesian velocities (Angstrom/fs)
+    '''
+    positions = np.asarray(positions, dtype=np.float64)
+    lattices = _frame_lattices(lattices, len(positions))
+    steps = np.diff(positions, axis=0)
+    steps -= np.round(steps)
+    return np.einsum('fni,fij->fnj', steps, lattices[1:]) / timestep
+
+
+def velocity_autocorrelation(positions:    NDArray,
+                             lattices:     NDArray,
+                             species:    List[str],
+                             timestep:       float,
+                             segment:          int = 2000,
+                             masses:          dict = None) -> Tuple[NDArray, NDArray, List[str]]:
+    '''
+    Mass weighted velocity autocorrelation function projected on the
+    elements, by the FFT of the velocities. The trajectory is processed in
+    contiguous segments of `segment` frames, only one segment is in memory
+    at a time (positions can be a memmap), and the correlation functions
+    of the segments are averaged. The last segment can be shorter, its
+    lags are weighted by their own number of velocity pairs, so that no
+    frame is dropped.
+
+      C_a(t) = sum_{i in a} m_i <v_i(0).v_i(t)> / sum_i m_i <v_i^2>
+
+    @in
+      - positions, np.ndarray, (nframes, natoms, 3) fractional coordinates
+      - lattices, np.ndarray, (3, 3) or (nframes, 3, 3)
+      - species, [str], symbol of each atom
+      - timestep, float, time between two frames (fs)
+      - segment, int, number of velocities in one segment, the longest
+        correlation time is segment*timestep
+      - masses, dict, element -> mass, from pymatgen by default, use
+        {element: 1.0} for the plain velocity autocorrelation
+    @out
+      - np.1darray, (nlags,) correlation time (fs)
+      - np.2darray, (nlags, nelements), C_a(t), the sum over the elements
+        is 1 at t=0
+      - [str], elements
+    '''
+    nvel = len(positions) - 1
+    assert nvel > 1, 'At least 3 frames are needed'
+    segment = min(segment, nvel)
+    lattices = _frame_lattices(lattices, len(positions))
+    elements = list(dict.fromkeys(species))
+    codes = np.array([elements.index(ii) for ii in species])
+    if masses is None:
+        masses = dict([(ii, float(Element(ii).atomic_mass)) for ii in elements])
+    weight = np.zeros((len(species), len(elements)))
+    weight[np.arange(len(species)), codes] = [masses[ii] for ii in species]
+
+    nfft = 2 * segment
+    power = np.zeros((nfft // 2 + 1, len(elements)))
+    # number of velocity pairs of each lag
+    counts = np.zeros(segment)
+    for start in range(0, nvel, segment):
+        stop = min(start + segment, nvel)
+        frames = slice(start, stop + 1)
+        vel = finite_velocities(positions[frames], lattices[frames], timestep)
+        spec = np.fft.rfft(vel, n=nfft, axis=0)
+        power += np.dot(np.sum(np.abs(spec)**2, axis=-1), weight)
+        counts[:stop - start] += stop - start - np.arange(stop - start)
+    corr = np.fft.irfft(power, n=nfft, axis=0)[:segment]
+    corr /= counts[:, None]
+    corr /= np.sum(corr[0])
+    return timestep * np.arange(segment), corr, elements
+
+
+def vibrational_dos(times: NDArray,
+                    vacf:  NDArray,
+                    nmodes:  int = 1) -> Tuple[NDArray, NDArray]:
+    '''
+    Vibrational density of states from the Fourier transform of the
+    velocity autocorrelation, with a Hann window to suppress the noise of
+    the long correlation times
+
+    @in
+      - times, np.1darray, correlation time (fs)
+      - vacf, np.ndarray, (nlags, ...) output of `velocity_autocorrelation`
+      - nmodes, int, normalization, i.e. 3*natoms, the total DOS is
+        integrated to nmodes over the frequencies
+    @out
+      - np.1darray, frequencies (THz)
+      - np.ndarray, (nfreq, ...) DOS (states/THz)
+    '''
+    nlags = len(times)
+    dt = times[1] - times[0]
+    window = np.hanning(2 * nlags)[nlags:]
+    data = np.asarray(vacf) * window.reshape((-1,) + (1,) * (np.ndim(vacf) - 1))
+    # even function of time, the transform of [C(0)...C(T), C(-T)...C(-dt)]
+    full = np.concatenate((data, data[:0:-1]), axis=0)
+    dos = np.fft.rfft(full, axis=0).real
+    freqs = np.fft.rfftfreq(len(full), d=dt) * FREQUENCY_UNIT
+    dos = np.maximum(dos, 0.0)
+    total = np.sum(dos.reshape(len(freqs), -1), axis=1)
+    df = freqs[1] - freqs[0]
+    return freqs, dos * nmodes / (np.sum(total) * df)
@@ -1,26 +1,35 @@
 #!/usr/bin/env python3
 # coding: utf-8
 
+import os
 import numpy as np
 from typing import List, Tuple
 from nptyping import NDArray
 from maptool import NAME
 from maptool.util.utils import (
     sepline,
+    wait_sep,
+    write_col_data,
     multi_structs
 )
 from maptool.io.read_structure import read_structures
+from maptool.core.aimd import partial_rdf
+from maptool.core.diffraction import gaussian_smearing
+from maptool.core.dedup import dedup_clusters, FINGERPRINT_TOL
+from maptool.core.fingerprint import (
+    element_pairs,
+    structure_fingerprints,
+    fingerprint_distances,
+    close_pairs
+)
+from maptool.core.similarity import FingerprintIndex
+from maptool.core.symmetry import batch_symmetry, write_symmetry_table
 from pymatgen import (
     Structure,
     Molecule
 )
-from pymatgen.symmetry.analyzer import (
-    PointGroupAnalyzer,
-    SpacegroupAnalyzer
-)
 from pymatgen.analysis.molecule_matcher import MoleculeMatcher
 from pymatgen.analysis.diffraction.xrd import XRDCalculator
-from pymatgen.analysis.structure_matcher import StructureMatcher
 from pymatgen.analysis.structure_prediction.volume_predictor import DLSVolumePredictor
 import matplotlib.pyplot as plt
 
@@ -28,31 +37,39 @@ import matplotlib.pyplot as plt
 def structure_symmetry():
     structs,fnames=read_structures()
     multi_structs(structs,fnames)
-    for struct,fname in zip(structs,fnames):
-        if isinstance(struct,Structure):
-            sa=SpacegroupAnalyzer(struct)
-            print("{:<20} : {}".format('File Name',fname))
+    results=batch_symmetry(structs,fnames,cells=False)
+    for data in results:
+        if data.status!='ok':
+            print("{:<20} : {}".format('File Name',data.fname))
+            print("{:<20} : {}".format('Error',data.error))
+            sepline()
+        elif data.periodic:
+            print("{:<20} : {}".format('File Name',data.fname))
             print("{:<20} : {:<15}".format('Structure Type','periodicity'))
-            print("{:<20} : {:<15}".format('Lattice Type',sa.get_lattice_type()))
-            print("{:<20} : {:<15d}".format('Space Group ID',sa.get_space_group_number()))
-            print("{:<20} : {:<15}".format('International Symbol',sa.get_space_group_symbol()))
-            print("{:<20} : {:15}".format('Hall Symbol',sa.get_hall()))
+            print("{:<20} : {:<15}".format('Lattice Type',data.lattice_type))
+            print("{:<20} : {:<15d}".format('Space Group ID',data.number))
+            print("{:<20} : {:<15}".format('International Symbol',data.international))
+            print("{:<20} : {:15}".format('Hall Symbol',data.hall))
             sepline()
-        if isinstance(struct,Molecule):
-            print("{:<20} : {}".format('File Name',fname))
-            pga=PointGroupAnalyzer(struct)
+        else:
+            print("{:<20} : {}".format('File Name',data.fname))
             print("{:<20} : {:<15}".format('Structure Type','non-periodicity'))
-            print("{:<20} : {:<15}".format('International Symbol',str(pga.get_pointgroup())))
+            print("{:<20} : {:<15}".format('International Symbol',data.pointgroup))
+    write_symmetry_table(results,NAME+'_symmetry.dat')
+    print('save the summary to '+NAME+'_symmetry.dat')
     return True
 
 
 def get_primitive_cell():
     structs,fnames=read_structures()
     multi_structs(structs,fnames)
-    for struct,fname in zip(structs,fnames):
+    for data in batch_symmetry(structs,fnames):
+        fname=data.fname
         sepline(ch='Primitive Cell',sp='-')
-        ast=SpacegroupAnalyzer(struct)
-        prim_st=ast.find_primitive()
+        if data.primitive is None:
+            print("{:<20} : {}".format(fname,data.error))
+            continue
+        prim_st=data.primitive
         print(prim_st)
         sepline()
         print('save to '+NAME+'_primitive_'+fname+'.vasp')
@@ -64,10 +81,13 @@ def get_primitive_cell():
 def get_conventional_cell():
     structs,fnames=read_structures()
     multi_structs(structs,fnames)
-    for struct,fname in zip(structs,fnames):
+    for data in batch_symmetry(structs,fnames):
+        fname=data.fname
         sepline(ch='conventional  cell',sp='-')
-        ast=SpacegroupAnalyzer(struct)
-        conv_st=ast.get_conventional_standard_structure()
+        if data.conventional is None:
+            print("{:<20} : {}".format(fname,data.error))
+            continue
+        conv_st=data.conventional
         print(conv_st)
         sepline()
         print('save to '+NAME+'_convention_'+fname+'.vasp')
@@ -77,94 +97,140 @@ def get_conventional_cell():
 
 
 def structure_finger_print():
-    return None
+    structs,fnames=read_structures()
+    multi_structs(structs,fnames)
+    print("input the cutoff radius and the number of bins, i.e. 6 60")
+    wait_sep()
+    try:
+        toks=input().split()
+        rcut=float(toks[0]) if len(toks)>0 else 6.0
+        nbins=int(toks[1]) if len(toks)>1 else 60
+    except ValueError:
+        print("Unknow input!")
+        return None
+    (fps,elements)=structure_fingerprints(structs,rcut=rcut,nbins=nbins)
+    pairs=element_pairs(elements)
+    radii=(np.arange(nbins)+0.5)*rcut/nbins
+    head_line="#%12s"%'r(Ang)'+"".join(["%12s"%(a+'-'+b) for (a,b) in pairs])
+    for fp,fname in zip(fps,fnames):
+        data=np.vstack([radii]+list(fp[:len(pairs)*nbins].reshape(-1,nbins)))
+        filename=NAME+'_fingerprint_'+fname+'.dat'
+        write_col_data(filename,data.T,head_line)
+        print('save to '+filename)
+    np.save(NAME+'_fingerprints.npy',fps)
+    print('save all the fingerprints to '+NAME+'_fingerprints.npy')
+    print("input the directory of a fingerprint index to add the structures to,")
+    print("a new index is created if it does not exist, or press enter to skip")
+    wait_sep()
+    path=input().strip()
+    if path:
+        index=FingerprintIndex.load(path) if os.path.isdir(path) else FingerprintIndex()
+        index.add_structures(structs,fnames)
+        index.save(path)
+        print('{} structures in the index {}'.format(len(index),path))
+    return True
 
 
-def structures_difference(distance_tolerance=0.1,rcut=30):
-    return None
+def structures_difference(distance_tolerance=0.1,rcut=6.0,nneighbors=10):
+    structs,fnames=read_structures()
+    multi_structs(structs,fnames)
+    (fps,_)=structure_fingerprints(structs,rcut=rcut)
+    filename=NAME+'_difference.dat'
+    head_line="#"+" ".join(fnames)
+    write_col_data(filename,fingerprint_distances(fps),head_line)
+    sepline(ch='similar structures',sp='-')
+    for (i,j,dist) in close_pairs(fps,distance_tolerance):
+        print("{:<20} {:<20} : {:.6f}".format(fnames[i],fnames[j],dist))
+    sepline()
+    print('save the distance matrix to '+filename)
+    print("input the directory of a fingerprint index to search the similar")
+    print("known structures, or press enter to skip")
+    wait_sep()
+    path=input().strip()
+    if path:
+        if not os.path.isdir(path):
+            print("No index in "+path)
+            return None
+        (dists,names)=FingerprintIndex.load(path).query_structures(structs,k=nneighbors)
+        for fname,dist,name in zip(fnames,dists,names):
+            sepline(ch=fname,sp='-')
+            for (_d,_n) in zip(dist,name):
+                print("{:<40} : {:.6f}".format(_n,_d))
+        sepline()
+    return True
 
 
-def distance(struct1,struct2,rcut,pbc=False,):
+def distance(struct1, struct2, rcut=6.0, pbc=True):
     '''
+    Cosine distance between the radial and angular fingerprints of two
+    structures, 0 for the same structure
+
+    @in
+      - struct1, struct2, Structure or Molecule
+      - rcut, float, cutoff radius of the radial fingerprint
+      - pbc, bool, the periodic images are ignored if False
+    @out
+      - float, in [0, 1]
     '''
-    return None
+    structs=[struct1,struct2]
+    if not pbc:
+        structs=[Molecule(st.species,st.cart_coords) for st in structs]
+    (fps,_)=structure_fingerprints(structs,rcut=rcut,nproc=1)
+    return float(fingerprint_distances(fps)[0,1])
 
 
 def rdf(structures: List[Structure],
         r:                    float = 10,
         nbins:                  int = 80,
         range:  Tuple[float, float] = (0, 10),
-        elem_pair:  Tuple[str, str] = ('', '')) -> Tuple[NDArray, NDArray]:
+        elem_pair:  Tuple[str, str] = ('', ''),
+        nproc:                  int = None) -> Tuple[NDArray, NDArray]:
     '''
     Calculate radial distribution function for given trajectory
 
     @in
-      - structures, [Structure], list of `Structure` or i.e. trajectory data
+      - structures, [Structure], list of `Structure` or i.e. trajectory data,
+        or an object with the `positions`, `lattices` and `species` arrays
+        of a trajectory, see maptool.code.vasp.trajectory
       - r, float, max raidus
       - nbins, int, number of bars in histogram
       - range, (float, float), plot range
       - elem_pair, (str, str), if the calculation of partial RDF is needed,
         pass this param. e.g. elem_pair = ('H', 'C'). Total RDF is returned if
         left empty.
+      - nproc, int, number of processes, see `partial_rdf`
 
     @out
       - (np.1darray, np.1darray), (rdf, radii) data.
     '''
-    def shell_volumes(edges: NDArray):
-        '''
-        Calculates the shells' volume for given radii
-        '''
-        edges = edges ** 3
-        return 4 * np.pi * (edges[1:] - edges[:-1]) / 3
-
-    def rdf_helper(s:          Structure,
-                   Aindices: NDArray[bool],
-                   Bindices: NDArray[bool]) -> NDArray:
-        '''
-        The helper function. return the histogram data for each structure
-        '''
-        (centers, points, _, dist) = s.get_neighbor_list(r)
-        validIndices = np.ones(dist.shape, dtype=bool)
-        for (i, (cidx, pidx)) in enumerate(zip(centers, points)):
-            validIndices[i] = Aindices[cidx] and Bindices[pidx]
-
-        hist, _ = np.histogram(dist[validIndices], bins=nbins, range=range)
-        return hist
-
     assert len(structures) > 0, 'Empty trajectory passed in'
     assert r > 0, 'Radius must be greater than 0'
     assert nbins > 0, 'nbin (number of bars of histogram) must be greater than 0'
     assert len(range) == 2 and\
         range[0] >= 0 and range[1] > 0 and\
         range[0] < range[1], 'Invalid range: range[0] and range[1] shoud in (0, ..] and range[0] < range[1]'
-    st = structures[0]
-    rho = st.num_sites / st.volume
-    nsteps = len(structures)
-    elem_array = np.array([s.species_string for s in st])
+    if hasattr(structures, 'positions'):
+        (positions, lattices, species) = (structures.positions, structures.lattices,
+                                          structures.species)
+    else:
+        positions = np.array([s.frac_coords for s in structures])
+        lattices = np.array([s.lattice.matrix for s in structures])
+        species = [s.species_string for s in structures[0]]
     if '' == elem_pair[0] and '' == elem_pair[1]:
-        Aindices = np.ones(elem_array.shape, dtype=bool)
-        Bindices = np.ones(elem_array.shape, dtype=bool)
+        pass
     elif '' in elem_pair:
         raise Exception(f'Invalid element pair: {elem_pair}')
-    elif elem_pair[0] not in elem_array or elem_pair[1] not in elem_array:
+    elif elem_pair[0] not in species or elem_pair[1] not in species:
         raise Exception(f'Input elements f{elem_pair} not included in this structure')
-    else:
-        Aindices = elem_array == elem_pair[0]  # boolean array in order to index A
-        Bindices = elem_array == elem_pair[1]  # boolean array in order to index B
-
-    hist, edges = np.histogram([0], bins=nbins, range=range)
-    hist *= 0
 
-    for (i, s) in enumerate(structures):
-        # print(f"Processing {i}")
-        hist += rdf_helper(s, Aindices, Bindices)
-
-    volumes = shell_volumes(edges)
-    nA = np.sum(Aindices)  # number of atoms belong to element A
-    nB = np.sum(Bindices)  # number of atoms belong to element B
-    rdf = hist * st.num_sites / (volumes * nA * nB * rho * nsteps)
-    radii = 0.5 * (edges[1:] + edges[:-1])
-    return (rdf, radii)
+    (partials, radii, elements) = partial_rdf(positions, lattices, species, r=r,
+                                              nbins=nbins, range=range, nproc=nproc)
+    if '' == elem_pair[0]:
+        # total RDF, the partials weighted by the concentrations
+        conc = np.array([species.count(ii) for ii in elements]) / len(species)
+        return (np.einsum('a,b,abk->k', conc, conc, partials), radii)
+    (ia, ib) = (elements.index(elem_pair[0]), elements.index(elem_pair[1]))
+    return (partials[ia, ib], radii)
 
 def xrd(structure:       Structure,
         two_theta_range: Tuple[int, int] = (0, 120),
@@ -182,7 +248,7 @@ def xrd(structure:       Structure,
       - sigma, float, gaussian smearing width
       - nsample, int, how many points in final plot
       - fig_name, str, name of the figure file to be written,
-        default is XRD.png
+        default is XRD.png, no figure is plotted if empty
       - peak_raw_fname, str, name of the raw data file containing 2Theta and
         intensity.
       - plot_dat_fname, str, name of the plot data file. That plot data was
@@ -193,43 +259,20 @@ def xrd(structure:       Structure,
       - plot_x, np.1darray, theta of final data in plotting
       - plot_y, np.1darray, intensity of final data in plotting
     '''
-    def _smearing(x, y,
-                  sigma=sigma,
-                  nsample=nsample) -> Tuple[NDArray, NDArray]:
-        '''
-        Apply smearing to discret delta functions to get a continuous array
-        @in
-          - x: x coordinates of peak
-          - y: peak heights
-        @out
-          - res_x
-          - res_y
-        '''
-        def _smearing_helper(x, x0, sigma=sigma):
-            return np.exp(-(x - x0)**2 / (2 * sigma**2))
-        assert x.shape == y.shape
-        npeaks = x.shape[0]
-        res_x = np.linspace(two_theta_range[0],
-                            two_theta_range[1], num=nsample)
-        smear_res = np.empty((npeaks, nsample))
-        for ipeak in range(npeaks):
-            smear_res[ipeak] = _smearing_helper(res_x, x[ipeak]) * y[ipeak]
-            pass
-        res_y = np.sum(smear_res, axis=(0))
-        return (res_x, res_y)
-
     c = XRDCalculator()
     p = c.get_pattern(structure,
                       two_theta_range=two_theta_range)
-    (x, y) = _smearing(p.x, p.y, sigma=sigma)
-    plt.figure()
-    plt.plot(x, y)
-    plt.vlines(p.x, ymin=-5, ymax=-1)
-    plt.ylim(-5, 110)
-    plt.xlabel(r"$2\theta$ ($^\circ$)")
-    plt.ylabel(r"Intensities (scaled)")
+    (x, y) = gaussian_smearing(p.x, p.y, two_theta_range=two_theta_range,
+                               sigma=sigma, nsample=nsample)
     if "" != fig_name:
+        plt.figure()
+        plt.plot(x, y)
+        plt.vlines(p.x, ymin=-5, ymax=-1)
+        plt.ylim(-5, 110)
+        plt.xlabel(r"$2\theta$ ($^\circ$)")
+        plt.ylabel(r"Intensities (scaled)")
         plt.savefig(fig_name, dpi=800, linewidth=0.01)
+        plt.close()
 
     if "" != peak_raw_fname:
         with open(peak_raw_fname, 'w') as f:
@@ -250,44 +293,74 @@ def xrd(structure:       Structure,
     return (p.x, p.y, x, y)
 
 
-def structure_dedup(structures: List[Structure],
-                    fnames:     List[str] = []) -> Tuple[List[Structure],
-                                                         List[str]]:
+def structure_dedup(structures:  List[Structure],
+                    fnames:      List[str] = [],
+                    fast:             bool = False,
+                    nproc:             int = None,
+                    return_clusters:  bool = False) -> Tuple[List[Structure],
+                                                            List[str]]:
     '''
-    Deduplicate the given structures via pymatgen.analysis.structure_matcher
+    Deduplicate the given structures via pymatgen.analysis.structure_matcher,
+    only the structures of the same composition are compared, see
+    `dedup_clusters`
     @in
       - structures, [Structure], given structures to be deduplicate
       - fnames, [str], file names corresponding to structures. If left empty,
         an empty list will be returned
+      - fast, bool, only compare the structures of the same space group
+        and within FINGERPRINT_TOL of the distance fingerprint, lossy:
+        some duplicates may be kept
+      - nproc, int, number of processes, the number of cpus by default
+      - return_clusters, bool, also return the clusters
     @out
       - [Structure], deduplicated structures
+      - [str], file names of the deduplicated structures
+      - [[int]], clusters of the index of the structures, the first one of
+        each cluster is the kept one, only if return_clusters
 
     '''
-    sm = StructureMatcher()
-
-    def _match(st_ref: Structure,
-               st_lst: List[Structure]):
-        for st in st_lst:
-            if sm.fit(st, st_ref, symmetric=True):
-                return True
-        return False
-
     assert len(fnames) == 0 or len(fnames) == len(structures),\
         'fname list should be empty or have same size with structures list'
 
     if len(structures) == 0 or len(structures) == 1:
-        return structures, fnames
+        clusters = [[i] for i in range(len(structures))]
+        clist, flist = structures, fnames
     else:
-        clist = []
-        ilist = []
-        for (i, st) in enumerate(structures):
-            if not _match(st, clist):
-                clist.append(st.copy())
-                ilist.append(i)
+        clusters = dedup_clusters(structures, spacegroup=fast,
+                                  fingerprint_tol=FINGERPRINT_TOL if fast else None,
+                                  nproc=nproc)
+        ilist = [cluster[0] for cluster in clusters]
+        clist = [structures[i].copy() for i in ilist]
         flist = []
         if len(fnames) != 0:
             flist = [fnames[i] for i in ilist]
-        return clist, flist
+    if return_clusters:
+        return clist, flist, clusters
+    return clist, flist
+
+
+def structure_deduplicate():
+    structs,fnames=read_structures()
+    multi_structs(structs,fnames)
+    print("input the mode of deduplication")
+    print('{} >>> {}'.format('1','compare with all the kept structures (default)'))
+    print('{} >>> {}'.format('2','fast, only the same space group and distance fingerprint,'))
+    print('{}     {}'.format(' ','some duplicates may be kept'))
+    wait_sep()
+    choice=input().strip()
+    if choice not in ['','1','2']:
+        print("Unknow input!")
+        return None
+    (_,flist,clusters)=structure_dedup(structs,fnames,fast=choice=='2',return_clusters=True)
+    filename=NAME+'_dedup.dat'
+    lines=[fnames[c[0]]+" : "+" ".join([fnames[i] for i in c[1:]])+"\n" for c in clusters]
+    write_col_data(filename,"".join(lines),"# kept structure : duplicated structures",str_data=True)
+    sepline(ch='kept structures',sp='-')
+    for fname in flist:
+        print(fname)
+    sepline()
+    print('{} of {} structures kept, save the clusters to {}'.format(len(flist),len(fnames),filename))
+    return True
 
 
 def volume_predict(structure: Structure) -> (
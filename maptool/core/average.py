@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import numpy as np
+from typing import List, Tuple
+from nptyping import NDArray
+
+
+def _dspacing(lattice: NDArray, hkl: NDArray) -> float:
+    recip = np.linalg.inv(np.asarray(lattice, dtype=float)).T
+    return 1.0 / np.linalg.norm(np.dot(hkl, recip))
+
+
+def planar_average(data: NDArray, axis: int = 2) -> NDArray:
+    '''
+    Average a 3D grid over the planes perpendicular to one grid axis
+
+    @in
+      - data, np.3darray, grid data
+      - axis, int, 0, 1 or 2
+    @out
+      - np.1darray, planar average with data.shape[axis] points
+    '''
+    assert axis in [0, 1, 2], 'axis must be 0, 1 or 2'
+    other = tuple([ii for ii in range(3) if ii != axis])
+    return np.mean(data, axis=other)
+
+
+def miller_planar_average(data:    NDArray,
+                          lattice: NDArray,
+                          hkl:     Tuple[int, int, int],
+                          nbins:   int = 0) -> Tuple[NDArray, NDArray]:
+    '''
+    Average a 3D grid over the lattice planes (hkl). Every grid point is
+    binned by its phase h*x + k*y + l*z (mod 1) in fractional coordinates,
+    so the average is taken along the normal of the planes, for any
+    lattice direction.
+
+    @in
+      - data, np.3darray, grid data
+      - lattice, np.2darray, 3x3 lattice matrix, one vector per row
+      - hkl, (int, int, int), Miller index of the planes
+      - nbins, int, number of points of the profile, the default value
+        keeps the grid resolution along the normal
+    @out
+      - distance, np.1darray, distance along the normal (Angstrom)
+      - average, np.1darray, the planar average
+    '''
+    hkl = np.array(hkl, dtype=int)
+    assert hkl.shape == (3,) and np.any(hkl != 0), 'invalid Miller index'
+    dim = np.array(data.shape)
+    dspacing = _dspacing(lattice, hkl)
+    if nbins <= 0:
+        nbins = int(np.max(np.abs(hkl) * dim))
+    distance = np.arange(nbins) * dspacing / nbins
+
+    nonzero = np.nonzero(hkl)[0]
+    if len(nonzero) == 1 and nbins == abs(hkl[nonzero[0]]) * dim[nonzero[0]] \
+       and abs(hkl[nonzero[0]]) == 1:
+        average = planar_average(data, nonzero[0])
+        if hkl[nonzero[0]] < 0:
+            average = np.roll(average[::-1], 1)
+        return distance, average
+
+    phase = [(hkl[ii] * np.arange(dim[ii]) / dim[ii]) for ii in range(3)]
+    phase = phase[0][:, None, None] + phase[1][None, :, None] + phase[2][None, None, :]
+    index = np.rint(phase * nbins).astype(np.int64) % nbins
+    total = np.bincount(index.ravel(), weights=data.ravel(), minlength=nbins)
+    count = np.bincount(index.ravel(), minlength=nbins)
+    filled = count > 0
+    average = np.zeros(nbins)
+    average[filled] = total[filled] / count[filled]
+    if not np.all(filled):
+        # empty bins for high index planes, use periodic interpolation
+        average[~filled] = np.interp(distance[~filled], distance[filled],
+                                     average[filled], period=dspacing)
+    return distance, average
+
+
+def macroscopic_average(profile: NDArray,
+                        length:  float,
+                        widths:  List[float]) -> NDArray:
+    '''
+    Macroscopic average of a periodic planar average profile, i.e. the
+    successive convolution with square windows of the given widths
+    (usually the interlayer distances of the two materials at an
+    interface). The convolution is done by FFT.
+
+    @in
+      - profile, np.1darray, planar average on a uniform periodic grid
+      - length, float, period of the profile (Angstrom)
+      - widths, [float], widths of the square windows (Angstrom)
+    @out
+      - np.1darray, macroscopic average on the same grid
+    '''
+    assert length > 0, 'length must be greater than 0'
+    npts = len(profile)
+    freq = np.fft.rfftfreq(npts, d=length / npts)
+    spectrum = np.fft.rfft(profile)
+    for width in widths:
+        assert width > 0, 'window width must be greater than 0'
+        spectrum *= np.sinc(freq * width)
+    return np.fft.irfft(spectrum, n=npts)
+
+
+def grid_average(data:    NDArray,
+                 lattice: NDArray,
+                 hkl:     Tuple[int, int, int] = (0, 0, 1),
+                 widths:  List[float] = [],
+                 nbins:   int = 0,
+                 scale:   float = 1.0) -> NDArray:
+    '''
+    Planar and macroscopic average of a 3D grid in one call
+
+    @in
+      - data, np.3darray, grid data
+      - lattice, np.2darray, 3x3 lattice matrix
+      - hkl, (int, int, int), Miller index of the averaging planes
+      - widths, [float], window widths of the macroscopic average, no
+        macroscopic average is done if left empty
+      - nbins, int, see `miller_planar_average`
+      - scale, float, the averages are multiplied by this factor, i.e.
+        1/volume for the CHG file
+    @out
+      - np.2darray, columns of distance, planar average and, if widths
+        are given, macroscopic average
+    '''
+    (distance, average) = miller_planar_average(data, lattice, hkl, nbins=nbins)
+    average = average * scale
+    columns = [distance, average]
+    if len(widths) > 0:
+        columns.append(macroscopic_average(average, _dspacing(lattice, hkl), widths))
+    return np.vstack(columns).T
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from typing import List, Tuple
+from nptyping import NDArray
+from pymatgen import Structure
+from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+from pymatgen.analysis.structure_matcher import StructureMatcher
+from maptool.core.aimd import pair_distances
+
+# number of neighbor shells in the distance fingerprint
+FINGERPRINT_SIZE = 8
+# fingerprint window of the fast mode, a heuristic that may miss matches
+FINGERPRINT_TOL = 0.5
+
+
+def distance_fingerprint(structure: Structure,
+                         nneighbors:      int = FINGERPRINT_SIZE) -> NDArray:
+    '''
+    Sorted distance fingerprint, the mean distance to the k-th nearest
+    neighbor over all the atoms, in the unit of (volume per atom)^(1/3).
+    It does not depend on the choice of the cell and the scale of the
+    volume.
+
+    @in
+      - structure, Structure
+      - nneighbors, int, length of the fingerprint
+    @out
+      - np.1darray, (nneighbors,)
+    '''
+    natoms = len(structure)
+    unit = (structure.volume / natoms)**(1.0 / 3)
+    lattice = np.array(structure.lattice.matrix)
+    frac = np.array(structure.frac_coords)
+    rcut = 2.0 * unit
+    while True:
+        (centers, _, dist) = pair_distances(frac, lattice, rcut)
+        counts = np.bincount(centers, minlength=natoms)
+        if np.min(counts) >= nneighbors:
+            break
+        rcut *= 1.5
+    order = np.lexsort((dist, centers))
+    start = np.cumsum(counts) - counts
+    index = start[:, None] + np.arange(nneighbors)[None, :]
+    return np.mean(dist[order][index], axis=0) / unit
+
+
+def structure_invariants(structure: Structure,
+                         symprec:       float = 0.1,
+                         spacegroup:     bool = True,
+                         fingerprint:    bool = True) -> Tuple[int, float, NDArray]:
+    '''
+    Cheap invariants of a structure used to bucket the candidates of
+    `StructureMatcher`
+
+    @in
+      - structure, Structure
+      - symprec, float, tolerance of the space group
+      - spacegroup, bool, calculate the space group number
+      - fingerprint, bool, calculate the distance fingerprint
+    @out
+      - int, space group number, 0 if not calculated or failed
+      - float, density (g/cm^3)
+      - np.1darray, distance fingerprint, None if not calculated
+    '''
+    number = 0
+    if spacegroup:
+        try:
+            number = SpacegroupAnalyzer(structure, symprec=symprec).get_space_group_number()
+        except Exception:
+            number = 0
+    fprint = distance_fingerprint(structure) if fingerprint else None
+    return (number, float(structure.density), fprint)
+
+
+def _invariants(args):
+    return structure_invariants(*args)
+
+
+def _match_bucket(args):
+    '''
+    Clusters of one bucket, each structure is compared with the
+    representatives in the order of the input, only the representatives
+    within the density and fingerprint windows are matched
+    '''
+    (structures, densities, fprints, matcher, density_tol, fingerprint_tol) = args
+    reps = []
+    clusters = []
+    for (i, st) in enumerate(structures):
+        for (irep, ref) in enumerate(reps):
+            if density_tol is not None and \
+                    abs(densities[i] - densities[ref]) > density_tol * densities[ref]:
+                continue
+            if fingerprint_tol is not None and \
+                    np.max(np.abs(fprints[i] - fprints[ref])) > fingerprint_tol:
+                continue
+            if matcher.fit(st, structures[ref], symmetric=True):
+                clusters[irep].append(i)
+                break
+        else:
+            reps.append(i)
+            clusters.append([i])
+    return clusters
+
+
+def _map(func, tasks, nproc):
+    if nproc == 1 or len(tasks) <= 1:
+        return [func(task) for task in tasks]
+    pool = Pool(processes=nproc)
+    try:
+        return pool.map(func, tasks, chunksize=max(1, len(tasks) // (4 * (nproc or cpu_count()))))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def dedup_clusters(structures:  List[Structure],
+                   matcher:    StructureMatcher = None,
+                   spacegroup:             bool = False,
+                   symprec:               float = 0.1,
+                   density_tol:           float = None,
+                   fingerprint_tol:       float = None,
+                   nproc:                   int = None) -> List[List[int]]:
+    '''
+    Cluster the duplicated structures. The structures are bucketed by the
+    composition (and the space group), `StructureMatcher.fit` is only
+    called within a bucket and for the pairs whose density and distance
+    fingerprint are within the tolerances, windows instead of bins so
+    that close structures are never split by a bin edge. The buckets are
+    processed in parallel.
+
+    With the defaults the clusters are the same as comparing each
+    structure with all the kept ones. The space group buckets and the
+    density and fingerprint windows are lossy speedups: they are not
+    bounded by the tolerances of the matcher, so matched structures may
+    be reported in different clusters.
+
+    @in
+      - structures, [Structure]
+      - matcher, StructureMatcher, the default one if None
+      - spacegroup, bool, bucket by the space group number, structures
+        matched within the tolerance of the matcher but with different
+        symmetry are kept apart
+      - symprec, float, tolerance of the space group
+      - density_tol, float, relative density window, only meaningful for
+        a matcher with scale=False, not used if None
+      - fingerprint_tol, float, window of the distance fingerprint in the
+        unit of (volume per atom)^(1/3) as the stol of StructureMatcher,
+        not used if None, i.e. FINGERPRINT_TOL
+      - nproc, int, number of processes, the number of cpus by default
+    @out
+      - [[int]], clusters of the index of the structures, the first one of
+        each cluster is the representative, clusters are sorted by their
+        representatives
+    '''
+    matcher = matcher or StructureMatcher()
+    tasks = [(st, symprec, spacegroup, fingerprint_tol is not None) for st in structures]
+    invariants = _map(_invariants, tasks, nproc)
+
+    buckets = {}
+    for (i, st) in enumerate(structures):
+        # the composition hash compared first by StructureMatcher.fit, the
+        # reduced formula for the default comparator
+        comp = matcher._comparator.get_hash(st.composition)
+        comp = getattr(comp, 'reduced_formula', comp)
+        buckets.setdefault((comp, invariants[i][0]), []).append(i)
+    members = sorted(buckets.values(), key=len, reverse=True)
+    tasks = [([structures[i] for i in index],
+              [invariants[i][1] for i in index],
+              [invariants[i][2] for i in index],
+              matcher, density_tol, fingerprint_tol) for index in members]
+    clusters = []
+    for (index, ret) in zip(members, _map(_match_bucket, tasks, nproc)):
+        clusters.extend([[index[i] for i in cluster] for cluster in ret])
+    return sorted(clusters)
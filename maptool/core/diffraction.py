@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from typing import List, Tuple
+from nptyping import NDArray
+from pymatgen import Structure
+from pymatgen.analysis.diffraction.core import AbstractDiffractionPatternCalculator
+from pymatgen.analysis.diffraction.xrd import WAVELENGTHS, ATOMIC_SCATTERING_PARAMS
+
+TWO_THETA_TOL = AbstractDiffractionPatternCalculator.TWO_THETA_TOL
+SCALED_INTENSITY_TOL = AbstractDiffractionPatternCalculator.SCALED_INTENSITY_TOL
+# the gaussians are evaluated within SMEARING_CUTOFF*sigma of the peaks
+SMEARING_CUTOFF = 10.0
+
+# per process caches, reused by the structures of the same lattice
+_HKL_CACHE = {}
+_FACTOR_CACHE = {}
+CACHE_MAX_LATTICES = 1024
+
+
+def _lattice_key(lattice: NDArray, wavelength: float, two_theta_range: Tuple[float, float]):
+    return (tuple(np.round(lattice, 8).ravel()), wavelength, tuple(two_theta_range))
+
+
+def reflections(lattice:                       NDArray,
+                wavelength:                      float,
+                two_theta_range: Tuple[float, float] = (0, 90)) -> Tuple[NDArray, NDArray]:
+    '''
+    Miller indices of the reflections within the two theta range, sorted
+    as in pymatgen's XRDCalculator, cached per lattice
+
+    @in
+      - lattice, np.2darray, (3, 3) lattice vectors
+      - wavelength, float, (Angstrom)
+      - two_theta_range, (float, float), (degree)
+    @out
+      - np.2darray, (nhkl, 3) int, Miller indices
+      - np.1darray, (nhkl,) |g_hkl| = 1/d_hkl
+    '''
+    key = _lattice_key(lattice, wavelength, two_theta_range)
+    if key in _HKL_CACHE:
+        return _HKL_CACHE[key]
+    (min_r, max_r) = [2 * np.sin(np.radians(t / 2)) / wavelength for t in two_theta_range]
+    recip = np.linalg.inv(lattice).T
+    # |h_i| = |g.a_i| <= max_r*|a_i|
+    nmax = np.floor(max_r * np.linalg.norm(lattice, axis=1)).astype(int)
+    hkl = np.mgrid[-nmax[0]:nmax[0] + 1,
+                   -nmax[1]:nmax[1] + 1,
+                   -nmax[2]:nmax[2] + 1].reshape(3, -1).T
+    g_hkl = np.linalg.norm(np.dot(hkl, recip), axis=1)
+    valid = (g_hkl > 0) & (g_hkl <= max_r) & (g_hkl >= min_r)
+    (hkl, g_hkl) = (hkl[valid], g_hkl[valid])
+    order = np.lexsort((-hkl[:, 2], -hkl[:, 1], -hkl[:, 0], g_hkl))
+    if len(_HKL_CACHE) >= CACHE_MAX_LATTICES:
+        _HKL_CACHE.clear()
+        _FACTOR_CACHE.clear()
+    _HKL_CACHE[key] = (hkl[order], g_hkl[order])
+    return _HKL_CACHE[key]
+
+
+def scattering_factors(symbol:     str,
+                       z:          int,
+                       s2:     NDArray,
+                       key=None) -> NDArray:
+    '''
+    Atomic scattering factor of one element, cached per lattice key
+
+    @in
+      - symbol, str, element
+      - z, int, atomic number
+      - s2, np.1darray, (sin(theta)/wavelength)^2
+      - key, hashable, key of s2 in the cache, not cached if None
+    @out
+      - np.1darray, f(s2)
+    '''
+    if key is not None and (key, symbol) in _FACTOR_CACHE:
+        return _FACTOR_CACHE[(key, symbol)]
+    try:
+        coeffs = np.array(ATOMIC_SCATTERING_PARAMS[symbol])
+    except KeyError:
+        raise ValueError("Unable to calculate XRD pattern as there is no scattering "
+                         "coefficients for %s." % symbol)
+    factors = z - 41.78214 * s2 * np.sum(coeffs[None, :, 0] *
+                                         np.exp(-coeffs[None, :, 1] * s2[:, None]), axis=1)
+    if key is not None:
+        _FACTOR_CACHE[(key, symbol)] = factors
+    return factors
+
+
+def xrd_peaks(structure:                 Structure,
+              two_theta_range: Tuple[float, float] = (0, 90),
+              wavelength:                      str = 'CuKa',
+              debye_waller_factors:           dict = {}) -> Tuple[NDArray, NDArray]:
+    '''
+    XRD peaks of a structure, the same model as pymatgen's XRDCalculator
+    (without symmetry refinement) with all the reflections at once
+
+    @in
+      - structure, Structure
+      - two_theta_range, (float, float), range of 2Theta (degree)
+      - wavelength, str or float, key of pymatgen's WAVELENGTHS or the
+        wavelength in Angstrom
+      - debye_waller_factors, dict, element -> B (Angstrom^2)
+    @out
+      - np.1darray, 2Theta of the peaks
+      - np.1darray, intensities scaled to the max of 100
+    '''
+    wavelength = WAVELENGTHS[wavelength] if isinstance(wavelength, str) else wavelength
+    lattice = np.array(structure.lattice.matrix)
+    key = _lattice_key(lattice, wavelength, two_theta_range)
+    (hkl, g_hkl) = reflections(lattice, wavelength, two_theta_range)
+    if len(hkl) == 0:
+        return np.zeros(0), np.zeros(0)
+
+    s2 = (g_hkl / 2)**2
+    symbols = []
+    zs = []
+    fcoords = []
+    occus = []
+    for site in structure:
+        for (sp, occu) in site.species.items():
+            symbols.append(sp.symbol)
+            zs.append(sp.Z)
+            fcoords.append(site.frac_coords)
+            occus.append(occu)
+    elements = list(dict.fromkeys(symbols))
+    codes = np.array([elements.index(ii) for ii in symbols])
+    factors = np.array([scattering_factors(el, zs[symbols.index(el)], s2, key)
+                        for el in elements]).T
+    dw = np.array([debye_waller_factors.get(el, 0) for el in elements])
+    factors = factors * np.exp(-dw[None, :] * s2[:, None])
+
+    # structure factors of all the reflections, (nhkl, natoms) phases
+    phases = np.exp(2j * np.pi * np.dot(hkl, np.array(fcoords).T))
+    f_hkl = np.sum(factors[:, codes] * np.array(occus)[None, :] * phases, axis=1)
+    i_hkl = (f_hkl * f_hkl.conjugate()).real
+    theta = np.arcsin(wavelength * g_hkl / 2)
+    lorentz = (1 + np.cos(2 * theta)**2) / (np.sin(theta)**2 * np.cos(theta))
+    two_theta = np.degrees(2 * theta)
+
+    # the reflections closer than TWO_THETA_TOL are one peak
+    start = np.concatenate(([True], np.diff(two_theta) >= TWO_THETA_TOL))
+    index = np.where(start)[0]
+    x = two_theta[index]
+    y = np.add.reduceat(i_hkl * lorentz, index)
+    valid = y / np.max(y) * 100 > SCALED_INTENSITY_TOL
+    (x, y) = (x[valid], y[valid])
+    return x, y / np.max(y) * 100
+
+
+def gaussian_smearing(x:                        NDArray,
+                      y:                        NDArray,
+                      two_theta_range: Tuple[float, float] = (0, 90),
+                      sigma:                     float = 0.05,
+                      nsample:                     int = 5000) -> Tuple[NDArray, NDArray]:
+    '''
+    Continuous pattern from the peaks by gaussian smearing, each gaussian
+    is only evaluated on the samples within SMEARING_CUTOFF*sigma
+
+    @in
+      - x, np.1darray, 2Theta of the peaks
+      - y, np.1darray, peak heights
+      - two_theta_range, (float, float), range of the samples
+      - sigma, float, gaussian smearing width
+      - nsample, int, number of samples
+    @out
+      - np.1darray, 2Theta of the samples
+      - np.1darray, intensities
+    '''
+    assert x.shape == y.shape
+    res_x = np.linspace(two_theta_range[0], two_theta_range[1], num=nsample)
+    lo = np.searchsorted(res_x, x - SMEARING_CUTOFF * sigma)
+    hi = np.searchsorted(res_x, x + SMEARING_CUTOFF * sigma, side='right')
+    counts = hi - lo
+    # sample index of each (peak, sample) pair, in the order of the peaks
+    peak = np.repeat(np.arange(len(x)), counts)
+    offset = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    sample = lo[peak] + offset
+    weights = np.exp(-(res_x[sample] - x[peak])**2 / (2 * sigma**2)) * y[peak]
+    res_y = np.bincount(sample, weights=weights, minlength=nsample)
+    return (res_x, res_y)
+
+
+def _xrd_pattern(args):
+    (structure, two_theta_range, wavelength, sigma, nsample) = args
+    (x, y) = xrd_peaks(structure, two_theta_range, wavelength)
+    return (x, y) + gaussian_smearing(x, y, two_theta_range, sigma, nsample)
+
+
+def xrd_patterns(structures:      List[Structure],
+                 two_theta_range: Tuple[float, float] = (0, 90),
+                 wavelength:                      str = 'CuKa',
+                 sigma:                         float = 0.05,
+                 nsample:                         int = 5000,
+                 nproc:                           int = None) -> List[Tuple[NDArray, ...]]:
+    '''
+    XRD patterns of many structures in a process pool
+
+    @in
+      - structures, [Structure]
+      - two_theta_range, (float, float), range of 2Theta
+      - wavelength, str or float, see `xrd_peaks`
+      - sigma, float, gaussian smearing width
+      - nsample, int, number of samples of the smeared pattern
+      - nproc, int, number of processes, the number of cpus by default
+    @out
+      - [(x, y, plot_x, plot_y)], peaks and smeared pattern of each structure
+    '''
+    tasks = [(st, two_theta_range, wavelength, sigma, nsample) for st in structures]
+    if nproc == 1 or len(tasks) <= 1:
+        return [_xrd_pattern(task) for task in tasks]
+    pool = Pool(processes=nproc)
+    try:
+        # large chunks, the caches of a process are reused within a chunk
+        chunksize = max(1, len(tasks) // (4 * (nproc or cpu_count())))
+        return pool.map(_xrd_pattern, tasks, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
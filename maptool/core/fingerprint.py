@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import numpy as np
+from typing import List, Tuple
+from nptyping import NDArray
+from scipy.spatial import cKDTree
+from scipy.special import erf
+from pymatgen import Structure
+from maptool.core.aimd import ZERO_TOL, _image_shifts
+from maptool.core.dedup import distance_fingerprint, _map
+
+FINGERPRINT_KINDS = ('radial', 'angular', 'sorted')
+
+
+def neighbor_vectors(cart:    NDArray,
+                     lattice: NDArray,
+                     r:         float) -> Tuple[NDArray, NDArray, NDArray, NDArray]:
+    '''
+    Neighbor list of the atoms with the bond vectors, including the
+    periodic images if the lattice is given
+
+    @in
+      - cart, np.2darray, (natoms, 3) Cartesian coordinates
+      - lattice, np.2darray, (3, 3), no periodic images if None
+      - r, float, cutoff radius
+    @out
+      - np.1darray, index of the center atoms, sorted
+      - np.1darray, index of the neighbors
+      - np.2darray, (npairs, 3) vectors from the centers to the neighbors
+      - np.1darray, distances
+    '''
+    natoms = len(cart)
+    if lattice is None:
+        images = cart
+    else:
+        frac = np.mod(np.linalg.solve(lattice.T, cart.T).T, 1.0)
+        cart = np.dot(frac, lattice)
+        shifts = _image_shifts(lattice, r)
+        images = (cart[None, :, :] + shifts[:, None, :]).reshape(-1, 3)
+    pairs = cKDTree(cart).sparse_distance_matrix(cKDTree(images), r, output_type='ndarray')
+    pairs = pairs[pairs['v'] > ZERO_TOL]
+    pairs = pairs[np.argsort(pairs['i'], kind='stable')]
+    vectors = images[pairs['j']] - cart[pairs['i']]
+    return pairs['i'], pairs['j'] % natoms, vectors, pairs['v']
+
+
+def _structure_arrays(structure):
+    lattice = np.array(structure.lattice.matrix) if hasattr(structure, 'lattice') else None
+    return np.array(structure.cart_coords), lattice
+
+
+def _smeared_bins(values: NDArray,
+                  lo:      float,
+                  width:   float,
+                  nbins:     int,
+                  sigma:   float) -> Tuple[NDArray, NDArray]:
+    '''
+    Gaussians of width sigma at the values integrated over the bins within
+    3*sigma, so the values on the bin edges are split smoothly
+
+    @out
+      - np.2darray, (nvalues, nwindow) bin index, -1 outside of the range
+      - np.2darray, (nvalues, nwindow) weights
+    '''
+    nwin = int(np.ceil(3 * sigma / width)) + 1
+    center = np.floor((values - lo) / width).astype(int)
+    ibin = center[:, None] + np.arange(-nwin, nwin + 1)[None, :]
+    edges = lo + ibin * width
+    x = (edges - values[:, None]) / (np.sqrt(2) * sigma)
+    weights = 0.5 * (erf(x + width / (np.sqrt(2) * sigma)) - erf(x))
+    ibin[(ibin < 0) | (ibin >= nbins)] = -1
+    return ibin, weights
+
+
+def element_pairs(elements: List[str]) -> List[Tuple[str, str]]:
+    '''
+    Unordered element pairs in the order of the fingerprint blocks
+    '''
+    return [(a, b) for (i, a) in enumerate(elements) for b in elements[i:]]
+
+
+def radial_fingerprint(structure:  Structure,
+                       elements:   List[str] = None,
+                       rcut:           float = 6.0,
+                       nbins:            int = 60,
+                       sigma:          float = 0.05) -> NDArray:
+    '''
+    Radial fingerprint of Oganov and Valle, F_AB(R) = g_AB(R) - 1 for each
+    element pair, smeared by gaussians and binned on (0, rcut).
+    Non-periodic structures (Molecule) have no density, their fingerprint
+    is the pair histogram divided by the shell area and N_A*N_B.
+
+    @in
+      - structure, Structure or Molecule
+      - elements, [str], elements of the blocks, the ones of the structure
+        if None, the same for all the structures to be compared
+      - rcut, float, cutoff radius
+      - nbins, int, number of bins of each block
+      - sigma, float, gaussian smearing width
+    @out
+      - np.1darray, (npairs*nbins,), blocks in the order of `element_pairs`
+    '''
+    species = [site.specie.symbol for site in structure]
+    elements = elements or sorted(set(species))
+    nel = len(elements)
+    codes = np.array([elements.index(ii) if ii in elements else -1 for ii in species])
+    (cart, lattice) = _structure_arrays(structure)
+    (centers, neighbors, _, dist) = neighbor_vectors(cart, lattice, rcut + 3 * sigma)
+
+    # index of the unordered pair (a, b), a <= b
+    pair_index = -np.ones((nel, nel), dtype=int)
+    pair_index[np.triu_indices(nel)] = np.arange(nel * (nel + 1) // 2)
+    (ca, cb) = (codes[centers], codes[neighbors])
+    valid = (ca >= 0) & (cb >= 0) & (ca <= cb)
+    width = rcut / nbins
+    (ibin, weights) = _smeared_bins(dist[valid], 0, width, nbins, sigma)
+    key = pair_index[ca[valid], cb[valid]][:, None] * nbins + ibin
+    inside = ibin >= 0
+    hist = np.bincount(key[inside], weights=weights[inside],
+                       minlength=nel * (nel + 1) // 2 * nbins).reshape(-1, nbins)
+
+    counts = np.bincount(codes[codes >= 0], minlength=nel)
+    (ia, ib) = np.triu_indices(nel)
+    norm = counts[ia] * counts[ib]
+    radii = (np.arange(nbins) + 0.5) * width
+    shell = 4 * np.pi * radii**2 * width
+    present = norm > 0
+    if lattice is None:
+        hist[present] /= norm[present, None] * shell[None, :]
+    else:
+        volume = abs(np.linalg.det(lattice))
+        hist[present] = hist[present] * volume / (norm[present, None] * shell[None, :]) - 1
+    return hist.ravel()
+
+
+def angular_fingerprint(structure: Structure,
+                        rcut:          float = 3.0,
+                        nbins:           int = 18,
+                        sigma:         float = 0.05) -> NDArray:
+    '''
+    Distribution of the bond angles, cos(theta) of all the triplets j-i-k
+    with both neighbors within rcut of the center i, smeared by gaussians
+    and normalized to 1
+
+    @in
+      - structure, Structure or Molecule
+      - rcut, float, cutoff radius of the bonds
+      - nbins, int, number of bins on [-1, 1]
+      - sigma, float, gaussian smearing width of cos(theta)
+    @out
+      - np.1darray, (nbins,)
+    '''
+    (cart, lattice) = _structure_arrays(structure)
+    (centers, _, vectors, dist) = neighbor_vectors(cart, lattice, rcut)
+    units = vectors / dist[:, None]
+    counts = np.bincount(centers, minlength=len(cart))
+    start = np.cumsum(counts) - counts
+    # all the pairs of bonds of the same center, each pair once
+    first = np.repeat(np.arange(len(centers)), counts[centers])
+    second = np.repeat(start[centers], counts[centers]) + \
+        np.arange(len(first)) - np.repeat(np.cumsum(counts[centers]) - counts[centers],
+                                          counts[centers])
+    valid = second > first
+    cosine = np.sum(units[first[valid]] * units[second[valid]], axis=1)
+    (ibin, weights) = _smeared_bins(np.clip(cosine, -1, 1), -1, 2.0 / nbins, nbins, sigma)
+    inside = ibin >= 0
+    hist = np.bincount(ibin[inside], weights=weights[inside], minlength=nbins)
+    total = np.sum(hist)
+    return hist / total if total > 0 else hist
+
+
+def structure_fingerprint(structure:      Structure,
+                          kinds:          List[str] = ('radial', 'angular'),
+                          elements:       List[str] = None,
+                          rcut:               float = 6.0,
+                          nbins:                int = 60,
+                          angle_rcut:         float = 3.0,
+                          angle_bins:           int = 18) -> NDArray:
+    '''
+    Fixed-length descriptor of a structure, the concatenation of the
+    fingerprints of FINGERPRINT_KINDS in the given order. 'sorted' is the
+    `distance_fingerprint` of the periodic structures.
+
+    @in
+      - structure, Structure or Molecule
+      - kinds, [str], kinds of the fingerprints
+      - elements, [str], see `radial_fingerprint`
+      - rcut, nbins, float, int, see `radial_fingerprint`
+      - angle_rcut, angle_bins, float, int, see `angular_fingerprint`
+    @out
+      - np.1darray
+    '''
+    parts = []
+    for kind in kinds:
+        if kind == 'radial':
+            parts.append(radial_fingerprint(structure, elements, rcut, nbins))
+        elif kind == 'angular':
+            parts.append(angular_fingerprint(structure, angle_rcut, angle_bins))
+        elif kind == 'sorted':
+            parts.append(distance_fingerprint(structure))
+        else:
+            raise ValueError("Unknown fingerprint: %s, supported: %s" %
+                             (kind, ' '.join(FINGERPRINT_KINDS)))
+    return np.concatenate(parts)
+
+
+def _fingerprint(args):
+    return structure_fingerprint(*args)
+
+
+def structure_fingerprints(structures: List[Structure],
+                           kinds:      List[str] = ('radial', 'angular'),
+                           elements:   List[str] = None,
+                           rcut:           float = 6.0,
+                           nbins:            int = 60,
+                           angle_rcut:     float = 3.0,
+                           angle_bins:       int = 18,
+                           nproc:            int = None) -> Tuple[NDArray, List[str]]:
+    '''
+    Fingerprints of many structures in a process pool, with the same
+    element blocks for all of them
+
+    @in
+      - structures, [Structure]
+      - kinds, elements, rcut, nbins, angle_rcut, angle_bins, see
+        `structure_fingerprint`, elements are the union of the structures
+        if None
+      - nproc, int, number of processes, the number of cpus by default
+    @out
+      - np.2darray, (nstructures, length of the fingerprint)
+      - [str], elements of the radial blocks
+    '''
+    if elements is None:
+        elements = sorted(set([site.specie.symbol for st in structures for site in st]))
+    tasks = [(st, kinds, elements, rcut, nbins, angle_rcut, angle_bins) for st in structures]
+    return np.array(_map(_fingerprint, tasks, nproc)), elements
+
+
+def _block_distance(a, b, metric):
+    if metric == 'cosine':
+        # rows are normalized, 0 for identical and 1 for opposite
+        return np.clip(0.5 * (1 - np.dot(a, b.T)), 0, 1)
+    d2 = np.sum(a**2, axis=1)[:, None] + np.sum(b**2, axis=1)[None, :] - 2 * np.dot(a, b.T)
+    return np.sqrt(np.maximum(d2, 0))
+
+
+def _prepare(fps, metric):
+    fps = np.asarray(fps, dtype=np.float64)
+    if metric == 'cosine':
+        norm = np.linalg.norm(fps, axis=1)
+        fps = fps / np.where(norm > ZERO_TOL, norm, 1)[:, None]
+    elif metric != 'euclidean':
+        raise ValueError("Unknown metric: %s, supported: cosine euclidean" % metric)
+    return fps
+
+
+def fingerprint_distances(fps:      NDArray,
+                          others:   NDArray = None,
+                          metric:       str = 'cosine',
+                          block_size:   int = 1024,
+                          out:          str = None) -> NDArray:
+    '''
+    Distance matrix between the fingerprints, computed block by block so
+    only block_size^2 temporaries are allocated, the matrix itself can be
+    a .npy memmap for large libraries
+
+    @in
+      - fps, np.2darray, (n, nfeatures) fingerprints
+      - others, np.2darray, (m, nfeatures), fps if None, then only the
+        upper blocks are computed
+      - metric, str, 'cosine', (1 - cos)/2 in [0, 1], or 'euclidean'
+      - block_size, int, number of rows of a block
+      - out, str, the matrix is written to this .npy file and memory-mapped,
+        in memory if None
+    @out
+      - np.2darray, (n, m) float32
+    '''
+    a = _prepare(fps, metric)
+    b = a if others is None else _prepare(others, metric)
+    shape = (len(a), len(b))
+    if out is None:
+        dist = np.zeros(shape, dtype=np.float32)
+    else:
+        dist = np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=shape)
+    for i in range(0, len(a), block_size):
+        for j in range(0, len(b), block_size):
+            if others is None and j < i:
+                dist[i:i + block_size, j:j + block_size] = \
+                    dist[j:j + block_size, i:i + block_size].T
+                continue
+            dist[i:i + block_size, j:j + block_size] = \
+                _block_distance(a[i:i + block_size], b[j:j + block_size], metric)
+    if others is None:
+        np.fill_diagonal(dist, 0)
+    return dist
+
+
+def close_pairs(fps:         NDArray,
+                tolerance:     float = 0.1,
+                metric:          str = 'cosine',
+                block_size:      int = 1024) -> List[Tuple[int, int, float]]:
+    '''
+    Pairs of fingerprints closer than the tolerance, blocked as
+    `fingerprint_distances` without keeping the matrix
+
+    @in
+      - fps, np.2darray, (n, nfeatures)
+      - tolerance, float, distance tolerance
+      - metric, block_size, see `fingerprint_distances`
+    @out
+      - [(int, int, float)], (i, j, distance) with i < j, sorted
+    '''
+    a = _prepare(fps, metric)
+    pairs = []
+    for i in range(0, len(a), block_size):
+        for j in range(i, len(a), block_size):
+            dist = _block_distance(a[i:i + block_size], a[j:j + block_size], metric)
+            (ii, jj) = np.nonzero(dist <= tolerance)
+            for (p, q) in zip(ii, jj):
+                if i + p < j + q:
+                    pairs.append((i + p, j + q, float(dist[p, q])))
+    return sorted(pairs)
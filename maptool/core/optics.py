@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import numpy as np
+from typing import Dict, List, Tuple
+from nptyping import NDArray
+from maptool.util.constants import H, C0
+
+COMPONENTS = ['xx', 'yy', 'zz', 'xy', 'yz', 'zx']
+SPECTRA = ['absorption', 'refractive', 'extinction', 'reflectivity', 'energy_loss']
+
+
+def optical_spectra(energy: NDArray,
+                    real:   NDArray,
+                    imag:   NDArray) -> Dict[str, NDArray]:
+    '''
+    Optical spectra of all the tensor components from the dielectric
+    function in one pass
+
+    @in
+      - energy, np.1darray, photon energy (eV)
+      - real, np.ndarray, real part of the dielectric function with the
+        energy along the first axis, i.e. (nfreq, 6)
+      - imag, np.ndarray, imaginary part, same shape as real
+    @out
+      - dict of np.ndarray with the shape of real:
+        absorption, absorption coefficient (cm^-1), 2*omega*k/c
+        refractive, refractive index n
+        extinction, extinction coefficient k
+        reflectivity, normal incidence reflectivity
+        energy_loss, energy loss function imag/|eps|^2
+    '''
+    real = np.asarray(real, dtype=float)
+    imag = np.asarray(imag, dtype=float)
+    modulus = np.hypot(real, imag)
+    refractive = np.sqrt(0.5 * (modulus + real))
+    # clipped for the rounding errors when imag is 0
+    extinction = np.sqrt(np.maximum(0.5 * (modulus - real), 0.0))
+    omega = 2 * np.pi * np.asarray(energy, dtype=float) / H
+    omega = omega.reshape((-1,) + (1,) * (real.ndim - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        energy_loss = np.where(modulus > 0, imag / modulus**2, 0.0)
+    return {'absorption': 2 * omega * extinction / (C0 * 100),
+            'refractive': refractive,
+            'extinction': extinction,
+            'reflectivity': ((refractive - 1)**2 + extinction**2) /
+                            ((refractive + 1)**2 + extinction**2),
+            'energy_loss': energy_loss}
+
+
+def kramers_kronig(energy: NDArray,
+                   imag:   NDArray,
+                   offset: NDArray = 1.0) -> NDArray:
+    '''
+    Real part of the dielectric function from the imaginary part by the
+    Kramers-Kronig relation, with the Maclaurin formula on a uniform
+    energy grid. The integral is truncated at the last energy, so the
+    result is only reliable well below it.
+
+    @in
+      - energy, np.1darray, uniform energy grid starting from 0 (eV)
+      - imag, np.ndarray, imaginary part with the energy along the first
+        axis
+      - offset, float or np.ndarray, high frequency limit of the real
+        part, 1 for the diagonal and 0 for the off-diagonal components
+    @out
+      - np.ndarray, real part with the shape of imag
+    '''
+    energy = np.asarray(energy, dtype=float)
+    imag = np.asarray(imag, dtype=float)
+    npts = len(energy)
+    step = (energy[-1] - energy[0]) / (npts - 1)
+    index = np.arange(npts)
+    # only the points with an odd distance are summed
+    odd = (index[:, None] - index[None, :]) % 2 == 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kernel = np.where(odd, energy[None, :] /
+                          (energy[None, :]**2 - energy[:, None]**2), 0.0)
+    shape = imag.shape
+    integral = np.dot(kernel, imag.reshape(npts, -1)).reshape(shape)
+    return offset + 4.0 / np.pi * step * integral
+
+
+def kramers_kronig_error(energy:   NDArray,
+                         real:     NDArray,
+                         imag:     NDArray,
+                         fraction: float = 0.5) -> NDArray:
+    '''
+    Consistency check of the dielectric function, relative RMS deviation
+    between the real part and the one from the Kramers-Kronig relation
+    below a fraction of the energy range
+
+    @in
+      - energy, np.1darray, uniform energy grid (eV)
+      - real, np.ndarray, (nfreq, 6)
+      - imag, np.ndarray, (nfreq, 6)
+      - fraction, float, only energies below fraction*max(energy) are
+        compared, the truncation error is large close to the cutoff
+    @out
+      - np.1darray, error of each component
+    '''
+    real = np.asarray(real, dtype=float)
+    offset = np.array([1.0, 1.0, 1.0, 0.0, 0.0, 0.0])[:real.shape[1]]
+    real_kk = kramers_kronig(energy, imag, offset)
+    mask = np.asarray(energy) <= fraction * np.max(energy)
+    diff = np.sqrt(np.mean((real_kk[mask] - real[mask])**2, axis=0))
+    scale = np.sqrt(np.mean(real[mask]**2, axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(scale > 0, diff / scale, 0.0)
+
+
+def spectra_table(energy:  NDArray,
+                  spectra: Dict[str, NDArray],
+                  names:   List[str] = SPECTRA) -> Tuple[NDArray, List[str]]:
+    '''
+    All the spectra as columns of one table
+
+    @in
+      - energy, np.1darray
+      - spectra, dict, output of `optical_spectra`
+      - names, [str], spectra to be written
+    @out
+      - np.2darray, energy followed by the components of each spectrum
+      - [str], column names, i.e. absorption_xx
+    '''
+    columns = [np.asarray(energy)[:, None]]
+    labels = ['energy']
+    for name in names:
+        data = spectra[name].reshape(len(energy), -1)
+        columns.append(data)
+        labels.extend([name + '_' + ii for ii in COMPONENTS[:data.shape[1]]])
+    return np.hstack(columns), labels
@@ -7,6 +7,13 @@ from maptool.util.utils import wait,wait_sep,warn_tip
 
 def atom_selection(struct):
     in_str=_atom_selection()
+    return parse_selection(in_str,struct),in_str
+
+def parse_selection(in_str,struct):
+    '''
+    atom index from a selection string in any of the formats of
+    `atom_selection`
+    '''
     if "|" in in_str.strip():
        atom_index_list=parse_range(in_str,struct)
     else:
@@ -17,7 +24,7 @@ def atom_selection(struct):
           atom_index_list=parse_sphere(in_str,struct)
        else:
           atom_index_list=parse_index(in_str)
-    return atom_index_list,in_str
+    return atom_index_list
 
 def _atom_selection():
     '''
@@ -107,6 +114,53 @@ def parse_range(in_str,struct):
            atom_index.append(i)
     return atom_index
 
+def element_groups(struct):
+    '''
+    atom index grouped by element, in the order of appearance
+
+    @out
+      - labels, [str], element symbols
+      - groups, [[int]], atom index of each element
+    '''
+    labels=[]
+    groups=[]
+    for i, site in enumerate(struct.sites):
+        label=site.specie.symbol
+        if label not in labels:
+           labels.append(label)
+           groups.append([])
+        groups[labels.index(label)].append(i)
+    return labels,groups
+
+def layer_groups(struct,axis=2,tol=0.5):
+    '''
+    atom index grouped by layers along one lattice vector, two atoms are
+    in the same layer if their distance along the normal of the layers
+    is smaller than tol, the periodic boundary is considered
+
+    @in
+      - struct, Structure
+      - axis, int, 0, 1 or 2 for the a, b and c lattice vector
+      - tol, float, tolerance in Angstrom
+    @out
+      - labels, [str], L1, L2, ... from bottom to top
+      - groups, [[int]], atom index of each layer
+    '''
+    lattice=struct.lattice.matrix
+    normal=np.cross(lattice[(axis+1)%3],lattice[(axis+2)%3])
+    height=abs(np.dot(lattice[axis],normal))/np.linalg.norm(normal)
+    frac=struct.frac_coords[:,axis]%1.0
+    order=np.argsort(frac,kind='mergesort')
+    gaps=np.diff(frac[order])*height
+    starts=[0]+list(np.where(gaps>=tol)[0]+1)
+    groups=[sorted(order[starts[i]:(starts[i+1] if i+1<len(starts) else len(order))].tolist())
+            for i in range(len(starts))]
+    if len(groups)>1 and (frac[order[0]]+1.0-frac[order[-1]])*height<tol:
+       # the top layer crosses the periodic boundary
+       groups[0]=sorted(groups.pop()+groups[0])
+    labels=['L'+str(i+1) for i in range(len(groups))]
+    return labels,groups
+
  
 if __name__=="__main__":
    ret=parse_index("1 2 4-8 10 12-30")
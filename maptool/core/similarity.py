@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import json
+import numpy as np
+from typing import List, Tuple
+from nptyping import NDArray
+from scipy.spatial import cKDTree
+from pymatgen import Structure
+from maptool.core.fingerprint import structure_fingerprints, _prepare
+
+# dimension of the projected fingerprints in the KD-tree
+INDEX_DIM = 16
+# the tree is rebuilt when the entries added after the last build exceed
+# this fraction of the index
+REBUILD_FRACTION = 0.1
+
+
+class FingerprintIndex(object):
+    '''
+    Nearest neighbor index over the fingerprints of a structure library,
+    the cosine distance of `fingerprint_distances`.
+
+    The normalized fingerprints are projected on their INDEX_DIM principal
+    components and searched in a KD-tree, the candidates are re-ranked by
+    the exact distance. The entries added after the last build are searched
+    by brute force until the tree is rebuilt. The index is a directory of
+    vectors.npy (memory-mapped when loaded), projection.npy, names.txt and
+    meta.json.
+
+    @in
+      - params, dict, arguments of `structure_fingerprints` used for the
+        structures of the library, the elements are fixed by the first
+        structures added if not given
+      - ndim, int, dimension of the projection
+    '''
+
+    def __init__(self, params: dict = None, ndim: int = INDEX_DIM):
+        self.params = dict(params or {})
+        self.ndim = ndim
+        self.vectors = None
+        self.names = []
+        self.nbuilt = 0
+        self.tree = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, fps: NDArray, names: List[str]):
+        '''
+        Add fingerprints computed with the same params. The fingerprints
+        of a loaded index are read into memory, the memmap is replaced by
+        the concatenated array.
+
+        @in
+          - fps, np.2darray, (n, nfeatures)
+          - names, [str], label of each entry
+        '''
+        fps = np.atleast_2d(_prepare(fps, 'cosine')).astype(np.float32)
+        assert len(fps) == len(names), 'one name per fingerprint'
+        if self.vectors is None:
+            self.vectors = fps
+        else:
+            self.vectors = np.concatenate((self.vectors, fps))
+        self.names.extend(names)
+        if len(self) - self.nbuilt > max(self.ndim, REBUILD_FRACTION * self.nbuilt):
+            self.build()
+
+    def add_structures(self,
+                       structures: List[Structure],
+                       names:      List[str],
+                       nproc:            int = None):
+        '''
+        Add structures, fingerprinted with the params of the index
+        '''
+        (fps, elements) = structure_fingerprints(structures, nproc=nproc, **self.params)
+        self.params.setdefault('elements', elements)
+        self.add(fps, names)
+
+    def build(self):
+        '''
+        Principal components and KD-tree of all the entries
+        '''
+        vectors = np.asarray(self.vectors, dtype=np.float64)
+        self.mean = np.mean(vectors, axis=0)
+        # principal axes from the (nfeatures, nfeatures) covariance
+        (_, axes) = np.linalg.eigh(np.cov(vectors - self.mean, rowvar=False))
+        self.basis = axes[:, ::-1][:, :self.ndim]
+        self._build_tree()
+
+    def _build_tree(self):
+        self.tree = cKDTree(np.dot(np.asarray(self.vectors, dtype=np.float64) - self.mean,
+                                   self.basis))
+        self.nbuilt = len(self)
+
+    def _exact(self, query, index):
+        return np.clip(0.5 * (1 - np.dot(np.asarray(self.vectors[index]), query)), 0, 1)
+
+    def query(self,
+              fps:           NDArray,
+              k:                 int = 10,
+              exact:            bool = False,
+              oversample:        int = 10) -> Tuple[NDArray, List[List[str]]]:
+        '''
+        The k most similar entries of each fingerprint
+
+        @in
+          - fps, np.2darray, (n, nfeatures) fingerprints of the queries
+          - k, int, number of neighbors
+          - exact, bool, brute force over all the entries
+          - oversample, int, k*oversample candidates from the tree
+        @out
+          - np.2darray, (n, k) distances, sorted
+          - [[str]], names of the neighbors
+        '''
+        queries = np.atleast_2d(_prepare(fps, 'cosine'))
+        k = min(k, len(self))
+        dists = np.zeros((len(queries), k))
+        names = []
+        for (iq, query) in enumerate(queries):
+            if exact or self.tree is None:
+                candidates = np.arange(len(self))
+            else:
+                nc = min(self.nbuilt, k * oversample)
+                (_, candidates) = self.tree.query(np.dot(query - self.mean, self.basis), nc)
+                candidates = np.concatenate((np.atleast_1d(candidates),
+                                             np.arange(self.nbuilt, len(self))))
+            dist = self._exact(query, candidates)
+            order = np.argsort(dist, kind='stable')[:k]
+            dists[iq] = dist[order]
+            names.append([self.names[i] for i in candidates[order]])
+        return dists, names
+
+    def query_structures(self,
+                         structures: List[Structure],
+                         k:                      int = 10,
+                         nproc:                  int = None) -> Tuple[NDArray, List[List[str]]]:
+        '''
+        The k most similar entries of each structure, see `query`
+        '''
+        (fps, _) = structure_fingerprints(structures, nproc=nproc, **self.params)
+        return self.query(fps, k)
+
+    def save(self, path: str):
+        '''
+        Write the index to the directory path
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        # the loaded vectors can be a memmap of the file itself
+        filename = os.path.join(path, 'vectors.npy')
+        with open(filename + '.tmp', 'wb') as f:
+            np.save(f, np.asarray(self.vectors))
+        os.replace(filename + '.tmp', filename)
+        # a stale projection would be paired with the new vectors
+        projection = os.path.join(path, 'projection.npy')
+        if self.tree is not None:
+            np.save(projection, np.vstack((self.mean[None, :], self.basis.T)))
+        elif os.path.isfile(projection):
+            os.remove(projection)
+        with open(os.path.join(path, 'names.txt'), 'w') as f:
+            f.write(''.join([name + '\n' for name in self.names]))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'params': self.params, 'ndim': self.ndim}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        '''
+        Read the index from the directory path, the tree is rebuilt with
+        the saved projection
+
+        @in
+          - path, str, directory written by `save`
+          - mmap, bool, memory-map the fingerprints
+        '''
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        index = cls(meta['params'], meta['ndim'])
+        index.vectors = np.load(os.path.join(path, 'vectors.npy'),
+                                mmap_mode='r' if mmap else None)
+        with open(os.path.join(path, 'names.txt')) as f:
+            index.names = [line.rstrip('\n') for line in f]
+        projection = os.path.join(path, 'projection.npy')
+        if os.path.isfile(projection):
+            data = np.load(projection)
+            (index.mean, index.basis) = (data[0], data[1:].T)
+            index._build_tree()
+        elif len(index) > 0:
+            index.build()
+        return index
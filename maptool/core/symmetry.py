@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import numpy as np
+from fractions import Fraction
+from typing import List
+from pymatgen import Structure, Molecule
+from pymatgen.symmetry.analyzer import PointGroupAnalyzer, SpacegroupAnalyzer
+from maptool.io.read_structure import read_structures_from_file
+from maptool.core.dedup import _map
+
+SYMMETRY_FILE = 'symmetry_summary.dat'
+
+# primitive vectors of the centered lattices in the fractional coordinates
+# of the standardized conventional cell of spglib
+CENTERING_MATRICES = {
+    'P': np.eye(3),
+    'A': np.array([[1, 0, 0], [0, 1 / 2, 1 / 2], [0, -1 / 2, 1 / 2]]),
+    'B': np.array([[1 / 2, 0, 1 / 2], [0, 1, 0], [-1 / 2, 0, 1 / 2]]),
+    'C': np.array([[1 / 2, 1 / 2, 0], [-1 / 2, 1 / 2, 0], [0, 0, 1]]),
+    'I': np.array([[-1 / 2, 1 / 2, 1 / 2], [1 / 2, -1 / 2, 1 / 2], [1 / 2, 1 / 2, -1 / 2]]),
+    'F': np.array([[0, 1 / 2, 1 / 2], [1 / 2, 0, 1 / 2], [1 / 2, 1 / 2, 0]]),
+    'R': np.array([[2 / 3, 1 / 3, 1 / 3], [-1 / 3, 1 / 3, 1 / 3], [-1 / 3, -2 / 3, 1 / 3]])}
+
+
+class DatasetAnalyzer(SpacegroupAnalyzer):
+    '''
+    SpacegroupAnalyzer calling spglib only once. The refined cell, the
+    primitive cell and the symmetry operations are taken from the symmetry
+    dataset of the constructor instead of the separate spglib calls, the
+    conventional standard structure follows.
+    '''
+
+    def _get_symmetry(self):
+        trans = []
+        for t in self._space_group_data['translations']:
+            trans.append([float(Fraction.from_float(c).limit_denominator(1000)) for c in t])
+        trans = np.array(trans)
+        trans[np.abs(trans) == 1] = 0
+        return self._space_group_data['rotations'], trans
+
+    def get_refined_structure(self):
+        ds = self._space_group_data
+        species = [self._unique_species[i - 1] for i in ds['std_types']]
+        return Structure(ds['std_lattice'], species, ds['std_positions']).get_sorted_structure()
+
+    def find_primitive(self):
+        ds = self._space_group_data
+        lattice = np.dot(CENTERING_MATRICES[ds['international'][0]], ds['std_lattice'])
+        frac = np.dot(np.dot(ds['std_positions'], ds['std_lattice']), np.linalg.inv(lattice))
+        # the atoms of the conventional cell related by the centering
+        # translations are the same atom of the primitive cell
+        keys = np.mod(np.round(frac, 5), 1.0)
+        first = np.sort(np.unique(keys, axis=0, return_index=True)[1])
+        species = [self._unique_species[i - 1] for i in np.array(ds['std_types'])[first]]
+        return Structure(lattice, species, frac[first],
+                         to_unit_cell=True).get_reduced_structure()
+
+
+class SymmetryData(object):
+    '''
+    Symmetry of one structure: the space group dataset and the cells for a
+    periodic structure, the point group for a molecule, the error if the
+    analysis failed.
+
+    Attributes:
+      - fname, formula, natoms, periodic
+      - number, international, hall, lattice_type, crystal_system
+      - pointgroup, str, molecules only
+      - primitive, conventional, Structure, None if not calculated
+      - status, error, str, 'ok' or 'failed' and the reason
+    '''
+
+    COLUMNS = ['fname', 'formula', 'natoms', 'number', 'international', 'hall',
+               'lattice_type', 'crystal_system', 'pointgroup', 'status', 'error']
+
+    def __init__(self, fname='', formula='', natoms=0, periodic=True):
+        self.fname = fname
+        self.formula = formula
+        self.natoms = natoms
+        self.periodic = periodic
+        self.number = 0
+        self.international = ''
+        self.hall = ''
+        self.lattice_type = ''
+        self.crystal_system = ''
+        self.pointgroup = ''
+        self.primitive = None
+        self.conventional = None
+        self.status = 'ok'
+        self.error = ''
+
+    def as_dict(self):
+        return dict([(key, getattr(self, key)) for key in self.COLUMNS])
+
+
+def analyze_symmetry(structure,
+                     fname:             str = '',
+                     symprec:         float = 0.01,
+                     angle_tolerance: float = 5.0,
+                     cells:            bool = True) -> SymmetryData:
+    '''
+    Symmetry of one structure with one spglib call, see `DatasetAnalyzer`
+
+    @in
+      - structure, Structure or Molecule
+      - fname, str, label of the structure
+      - symprec, float, tolerance of spglib
+      - angle_tolerance, float, angle tolerance of spglib (degree)
+      - cells, bool, calculate the primitive and conventional cells
+    @out
+      - SymmetryData, the errors are captured in status and error
+    '''
+    data = SymmetryData(fname, structure.composition.reduced_formula, len(structure),
+                        isinstance(structure, Structure))
+    try:
+        if isinstance(structure, Molecule):
+            data.pointgroup = str(PointGroupAnalyzer(structure).get_pointgroup())
+            return data
+        sa = DatasetAnalyzer(structure, symprec=symprec, angle_tolerance=angle_tolerance)
+        if sa.get_symmetry_dataset() is None:
+            raise RuntimeError("spglib failed to find the symmetry")
+        data.number = sa.get_space_group_number()
+        data.international = sa.get_space_group_symbol()
+        data.hall = sa.get_hall()
+        data.lattice_type = sa.get_lattice_type()
+        data.crystal_system = sa.get_crystal_system()
+        if cells:
+            data.primitive = sa.find_primitive()
+            data.conventional = sa.get_conventional_standard_structure()
+    except Exception as e:
+        data.status = 'failed'
+        data.error = repr(e)
+    return data
+
+
+def _analyze(args):
+    return analyze_symmetry(*args)
+
+
+def _analyze_file(args):
+    (filename, symprec, angle_tolerance, cells) = args
+    structure = read_structures_from_file(filename)
+    if structure is None:
+        data = SymmetryData(filename)
+        (data.status, data.error) = ('failed', 'Parsing error')
+        return data
+    return analyze_symmetry(structure, filename, symprec, angle_tolerance, cells)
+
+
+def batch_symmetry(structures:    List[Structure],
+                   fnames:              List[str] = None,
+                   symprec:                 float = 0.01,
+                   angle_tolerance:         float = 5.0,
+                   cells:                    bool = True,
+                   nproc:                     int = None) -> List[SymmetryData]:
+    '''
+    Symmetry of many structures in a process pool, see `analyze_symmetry`
+
+    @in
+      - structures, [Structure or Molecule]
+      - fnames, [str], labels of the structures
+      - symprec, angle_tolerance, cells, see `analyze_symmetry`
+      - nproc, int, number of processes, the number of cpus by default
+    @out
+      - [SymmetryData]
+    '''
+    fnames = fnames or [''] * len(structures)
+    tasks = [(st, fname, symprec, angle_tolerance, cells)
+             for (st, fname) in zip(structures, fnames)]
+    return _map(_analyze, tasks, nproc)
+
+
+def batch_symmetry_files(filenames:  List[str],
+                         symprec:        float = 0.01,
+                         angle_tolerance: float = 5.0,
+                         cells:           bool = False,
+                         nproc:            int = None) -> List[SymmetryData]:
+    '''
+    Symmetry of many structure files, the files are also parsed in the
+    process pool, i.e. a directory of CIFs
+
+    @in
+      - filenames, [str]
+      - symprec, angle_tolerance, cells, nproc, see `batch_symmetry`
+    @out
+      - [SymmetryData], fname is the file name
+    '''
+    tasks = [(filename, symprec, angle_tolerance, cells) for filename in filenames]
+    return _map(_analyze_file, tasks, nproc)
+
+
+def format_symmetry_table(results: List[SymmetryData]) -> str:
+    '''
+    Summary table of the symmetry, one line per structure
+    '''
+    rows = [[str(result.as_dict()[key]) or '-' for key in SymmetryData.COLUMNS]
+            for result in results]
+    widths = [max([len(key)] + [len(row[i]) for row in rows])
+              for (i, key) in enumerate(SymmetryData.COLUMNS)]
+    lines = ['#' + '  '.join([key.rjust(widths[i])
+                              for (i, key) in enumerate(SymmetryData.COLUMNS)])]
+    for row in rows:
+        lines.append(' ' + '  '.join([value.rjust(widths[i]) for (i, value) in enumerate(row)]))
+    return '\n'.join(lines) + '\n'
+
+
+def write_symmetry_table(results: List[SymmetryData], filename: str = SYMMETRY_FILE):
+    with open(filename, 'w') as f:
+        f.write(format_symmetry_table(results))
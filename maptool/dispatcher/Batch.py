@@ -7,8 +7,13 @@ from maptool import mlog
 class Batch(object) :
     def __init__ (self,
                   context, 
-                  uuid_names = False) :
+                  uuid_names = False,
+                  status_provider = None) :
         self.context = context
+        # job id of the scheduler, cached after the submission
+        self.job_id = None
+        # shared source of the job states, see PBSStatusProvider
+        self.status_provider = status_provider
         if uuid_names:
             self.finish_tag_name = '%s_tag_finished' % self.context.job_uuid
             self.sub_script_name = '%s.sub' % self.context.job_uuid
@@ -20,6 +25,14 @@ class Batch(object) :
 
     def check_status(self) :
         raise RuntimeError('abstract method check_status should be implemented by derived class')        
+
+    @classmethod
+    def make_status_provider(cls, remote_profile = None) :
+        '''
+        shared status provider of all the jobs of a dispatcher, None if the
+        batch system checks each job by itself
+        '''
+        return None
         
     def default_resources(self, res) :
         raise RuntimeError('abstract method sub_script_head should be implemented by derived class')        
@@ -1,15 +1,27 @@
 import os,sys,time,random,json,glob
+import asyncio,threading
+from concurrent.futures import ThreadPoolExecutor
 from maptool.dispatcher.LocalContext import LocalSession
 from maptool.dispatcher.LocalContext import LocalContext
 from maptool.dispatcher.LazyLocalContext import LazyLocalContext
-from maptool.dispatcher.SSHContext import SSHSession
+from maptool.dispatcher.SSHContext import SSHSessionPool
 from maptool.dispatcher.SSHContext import SSHContext
+from maptool.dispatcher.SSHContext import TRANSFER_CONCURRENCY
 from maptool.dispatcher.PBS import PBS
 from maptool.dispatcher.Shell import Shell
 from maptool.dispatcher.JobStatus import JobStatus
 from maptool import mlog
 from hashlib import sha1
 
+# the status of a chunk is checked again after an interval growing by
+# MONITOR_BACKOFF from MONITOR_MIN_INTERVAL to MONITOR_MAX_INTERVAL (s)
+# while its status does not change
+MONITOR_MIN_INTERVAL = 5
+MONITOR_MAX_INTERVAL = 60
+MONITOR_BACKOFF = 1.5
+# max number of chunks checked or downloaded at the same time
+MONITOR_CONCURRENCY = 16
+
 def _split_tasks(tasks,
                  group_size):
     ntasks = len(tasks)
@@ -41,7 +53,7 @@ class Dispatcher(object):
             self.context = LazyLocalContext
             self.uuid_names = True
         elif context_type == 'ssh':
-            self.session = SSHSession(remote_profile)
+            self.session = SSHSessionPool(remote_profile)
             self.context = SSHContext
             self.uuid_names = False
         else :
@@ -65,6 +77,7 @@ class Dispatcher(object):
         else :
             raise RuntimeError('unknown batch ' + batch_type)
         self.jrname = job_record
+        self._record_lock = threading.Lock()
 
     def run_jobs(self,
                  resources,
@@ -78,7 +91,8 @@ class Dispatcher(object):
                  forward_task_deference = True,
                  mark_failure = False,
                  outlog = 'log',
-                 errlog = 'err') :
+                 errlog = 'err',
+                 max_concurrency = MONITOR_CONCURRENCY) :
         job_handler = self.submit_jobs(resources,
                                        command,
                                        work_path,
@@ -90,8 +104,7 @@ class Dispatcher(object):
                                        forward_task_deference,
                                        outlog,
                                        errlog)
-        while not self.all_finished(job_handler, mark_failure) :
-            time.sleep(60)
+        self.monitor_jobs(job_handler, mark_failure, max_concurrency = max_concurrency)
         # delete path map file when job finish
         # _pmap.delete()
 
@@ -118,59 +131,25 @@ class Dispatcher(object):
         task_hashes = [sha1(ii.encode('utf-8')).hexdigest() for ii in task_chunks_str]
         job_record = JobRecord(work_path, task_chunks, fname = self.jrname)
         nchunks = len(task_chunks)
+        # one status query for all the jobs instead of one per job
+        status_provider = self.batch.make_status_provider(self.remote_profile)
+        if status_provider is not None :
+            # the recovered jobs are asked together by the first query
+            status_provider.add_jobs([job_record.get_job_id(ii) for ii in task_hashes
+                                      if job_record.get_job_id(ii)])
         
-        job_list = []
-        for ii in range(nchunks) :            
-            cur_chunk = task_chunks[ii]
-            cur_hash = task_hashes[ii]
-            if not job_record.check_finished(cur_hash):                
-                # chunk is not finished
-                # check if chunk is submitted
-                submitted = job_record.check_submitted(cur_hash)
-                if not submitted:
-                    job_uuid = None
-                else :
-                    job_uuid = job_record.get_uuid(cur_hash)
-                    mlog.debug("load uuid %s for chunk %s" % (job_uuid, cur_hash))
-                # communication context, bach system
-                context = self.context(work_path, self.session, job_uuid)
-                batch = self.batch(context, uuid_names = self.uuid_names)
-                rjob = {'context':context, 'batch':batch}
-                # upload files
-                tag_upload = '%s_tag_upload' % rjob['context'].job_uuid
-                if not rjob['context'].check_file_exists(tag_upload):
-                    rjob['context'].upload('.',
-                                           forward_common_files)
-                    rjob['context'].upload(cur_chunk,
-                                           forward_task_files, 
-                                           dereference = forward_task_deference)
-                    rjob['context'].write_file(tag_upload, '')
-                    mlog.debug('uploaded files for %s' % task_chunks_str[ii])
-                # submit new or recover old submission
-                if not submitted:
-                    rjob['batch'].submit(cur_chunk, command, res = resources, outlog=outlog, errlog=errlog)
-                    job_uuid = rjob['context'].job_uuid
-                    mlog.debug('assigned uuid %s for %s ' % (job_uuid, task_chunks_str[ii]))
-                    mlog.info('new submission of %s for chunk %s' % (job_uuid, cur_hash))
-                else:
-                    rjob['batch'].submit(cur_chunk, command, res = resources, outlog=outlog, errlog=errlog, restart = True)
-                    mlog.info('restart from old submission %s for chunk %s' % (job_uuid, cur_hash))
-                # record job and its remote context
-                job_list.append(rjob)
-                ip = None
-                instance_id = None
-                if 'ali_auth' in self.remote_profile:
-                    ip = self.remote_profile['hostname']
-                    instance_id = self.remote_profile['instance_id']
-                job_record.record_remote_context(cur_hash,                                                 
-                                                 context.local_root, 
-                                                 context.remote_root, 
-                                                 job_uuid,
-                                                 ip,
-                                                 instance_id)
-            else :
-                # finished job, append a None to list
-                job_list.append(None)
+        # the chunks are uploaded and submitted by a pool of threads, each
+        # ssh context has a connection of the session pool
+        concurrency = self.remote_profile.get('transfer_concurrency', TRANSFER_CONCURRENCY)
+        if resources is not None and resources.get('submit_wait_time', 0) > 0:
+            # the submissions are meant to be spaced out
+            concurrency = 1
+        args = (work_path, job_record, status_provider, command, resources,
+                forward_common_files, forward_task_files, forward_task_deference,
+                outlog, errlog)
+        with ThreadPoolExecutor(max_workers = max(1, concurrency)) as executor:
+            job_list = list(executor.map(lambda ii: self._submit_chunk(task_chunks[ii], task_hashes[ii], *args),
+                                         range(nchunks)))
         job_record.dump()
         assert(len(job_list) == nchunks)
         job_handler = {
@@ -186,51 +165,207 @@ class Dispatcher(object):
         return job_handler
 
 
+    def _submit_chunk(self,
+                      cur_chunk,
+                      cur_hash,
+                      work_path,
+                      job_record,
+                      status_provider,
+                      command,
+                      resources,
+                      forward_common_files,
+                      forward_task_files,
+                      forward_task_deference,
+                      outlog,
+                      errlog) :
+        """
+        Upload the files of one chunk and submit it, or recover its old
+        submission. Returns the context and the batch of the chunk, None
+        if the chunk is finished.
+        """
+        with self._record_lock:
+            if job_record.check_finished(cur_hash):
+                # finished job, append a None to list
+                return None
+            # chunk is not finished
+            # check if chunk is submitted
+            submitted = job_record.check_submitted(cur_hash)
+            if not submitted:
+                job_uuid = None
+            else :
+                job_uuid = job_record.get_uuid(cur_hash)
+                mlog.debug("load uuid %s for chunk %s" % (job_uuid, cur_hash))
+            job_id = job_record.get_job_id(cur_hash)
+        chunk_str = '+'.join(cur_chunk)
+        # communication context, bach system
+        context = self.context(work_path, self.session, job_uuid)
+        batch = self.batch(context, uuid_names = self.uuid_names,
+                           status_provider = status_provider)
+        if submitted:
+            batch.job_id = job_id
+        rjob = {'context':context, 'batch':batch}
+        # upload files
+        tag_upload = '%s_tag_upload' % rjob['context'].job_uuid
+        if not rjob['context'].check_file_exists(tag_upload):
+            rjob['context'].upload_shared('.',
+                                          forward_common_files)
+            rjob['context'].upload(cur_chunk,
+                                   forward_task_files, 
+                                   dereference = forward_task_deference)
+            rjob['context'].write_file(tag_upload, '')
+            mlog.debug('uploaded files for %s' % chunk_str)
+        # submit new or recover old submission
+        if not submitted:
+            rjob['batch'].submit(cur_chunk, command, res = resources, outlog=outlog, errlog=errlog)
+            job_uuid = rjob['context'].job_uuid
+            mlog.debug('assigned uuid %s for %s ' % (job_uuid, chunk_str))
+            mlog.info('new submission of %s for chunk %s' % (job_uuid, cur_hash))
+        else:
+            rjob['batch'].submit(cur_chunk, command, res = resources, outlog=outlog, errlog=errlog, restart = True)
+            mlog.info('restart from old submission %s for chunk %s' % (job_uuid, cur_hash))
+        # record job and its remote context
+        ip = None
+        instance_id = None
+        if 'ali_auth' in self.remote_profile:
+            ip = self.remote_profile['hostname']
+            instance_id = self.remote_profile['instance_id']
+        with self._record_lock:
+            job_record.record_remote_context(cur_hash,                                                 
+                                             context.local_root, 
+                                             context.remote_root, 
+                                             job_uuid,
+                                             ip,
+                                             instance_id)
+            job_record.record_job_id(cur_hash, batch.job_id)
+        return rjob
+
+
     def all_finished(self, 
                      job_handler, 
                      mark_failure):
-        task_chunks = job_handler['task_chunks']
-        task_chunks_str = ['+'.join(ii) for ii in task_chunks]
-        task_hashes = [sha1(ii.encode('utf-8')).hexdigest() for ii in task_chunks_str]
-        job_list = job_handler['job_list']
         job_record = job_handler['job_record']
-        command = job_handler['command']
-        tag_failure_list = ['tag_failure_%d' % ii for ii in range(len(command))]
-        resources = job_handler['resources']
-        outlog = job_handler['outlog']
-        errlog = job_handler['errlog']
-        backward_task_files = job_handler['backward_task_files']
         mlog.debug('checking jobs')
-        nchunks = len(task_chunks)
-        for idx in range(nchunks) :
-            cur_hash = task_hashes[idx]
-            rjob = job_list[idx]
-            if not job_record.check_finished(cur_hash) :
-                # chunk not finished according to record
-                status = rjob['batch'].check_status()
-                job_uuid = rjob['context'].job_uuid
-                mlog.debug('checked job %s' % job_uuid)
-                if status == JobStatus.terminated :
-                    job_record.increase_nfail(cur_hash)
-                    if job_record.check_nfail(cur_hash) > 3:
-                        raise RuntimeError('Job %s failed for more than 3 times' % job_uuid)
-                    mlog.info('job %s terminated, submit again'% job_uuid)
-                    mlog.debug('try %s times for %s'% (job_record.check_nfail(cur_hash), job_uuid))
-                    rjob['batch'].submit(task_chunks[idx], command, res = resources, outlog=outlog, errlog=errlog,restart=True)
-                elif status == JobStatus.finished :
-                    mlog.info('job %s finished' % job_uuid)
-                    if mark_failure:
-                        rjob['context'].download(task_chunks[idx], tag_failure_list, check_exists = True, mark_failure = False)
-                        rjob['context'].download(task_chunks[idx], backward_task_files, check_exists = True)
-                    else:
-                        rjob['context'].download(task_chunks[idx], backward_task_files)
-                    rjob['context'].clean()
-                    job_record.record_finish(cur_hash)
-                    job_record.dump()
+        for idx in range(len(job_handler['task_chunks'])) :
+            self._update_chunk(job_handler, idx, mark_failure)
         job_record.dump()
         return job_record.check_all_finished()
 
 
+    def monitor_jobs(self,
+                     job_handler,
+                     mark_failure = False,
+                     max_concurrency = MONITOR_CONCURRENCY,
+                     min_interval = MONITOR_MIN_INTERVAL,
+                     max_interval = MONITOR_MAX_INTERVAL) :
+        """
+        Wait until all the chunks of job_handler are finished. Each chunk
+        is followed by a coroutine which checks its status, resubmits it
+        or downloads its results as soon as it finishes, the blocking
+        calls run in a pool of max_concurrency threads. The interval of a
+        chunk is reset to min_interval when its status changes and grows
+        to max_interval otherwise.
+        """
+        executor = ThreadPoolExecutor(max_workers = max_concurrency)
+        try:
+            asyncio.run(self._monitor(job_handler, mark_failure, executor,
+                                      min_interval, max_interval))
+        finally:
+            executor.shutdown(wait = True)
+        job_handler['job_record'].dump()
+
+
+    async def _monitor(self,
+                       job_handler,
+                       mark_failure,
+                       executor,
+                       min_interval,
+                       max_interval) :
+        nchunks = len(job_handler['task_chunks'])
+        watchers = [asyncio.ensure_future(self._watch_chunk(job_handler, idx, mark_failure, executor,
+                                                            min_interval, max_interval))
+                    for idx in range(nchunks)]
+        try:
+            await asyncio.gather(*watchers)
+        finally:
+            # a failed chunk stops the others
+            for watcher in watchers:
+                watcher.cancel()
+
+
+    async def _watch_chunk(self,
+                           job_handler,
+                           idx,
+                           mark_failure,
+                           executor,
+                           min_interval,
+                           max_interval) :
+        loop = asyncio.get_event_loop()
+        interval = min_interval
+        last_status = None
+        while True :
+            status = await loop.run_in_executor(executor, self._update_chunk,
+                                                job_handler, idx, mark_failure)
+            if status == JobStatus.finished :
+                return
+            if status != last_status or status == JobStatus.terminated :
+                interval = min_interval
+            else :
+                interval = min(interval * MONITOR_BACKOFF, max_interval)
+            last_status = status
+            # the jitter spreads the checks of the chunks submitted together
+            await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+
+
+    def _update_chunk(self,
+                      job_handler,
+                      idx,
+                      mark_failure) :
+        """
+        Check the status of one chunk, resubmit it if terminated, download
+        its results if finished. Returns the status.
+        """
+        task_chunk = job_handler['task_chunks'][idx]
+        cur_hash = sha1('+'.join(task_chunk).encode('utf-8')).hexdigest()
+        rjob = job_handler['job_list'][idx]
+        job_record = job_handler['job_record']
+        command = job_handler['command']
+        with self._record_lock:
+            if job_record.check_finished(cur_hash) :
+                return JobStatus.finished
+        # chunk not finished according to record
+        status = rjob['batch'].check_status()
+        job_uuid = rjob['context'].job_uuid
+        mlog.debug('checked job %s' % job_uuid)
+        if status == JobStatus.terminated :
+            with self._record_lock:
+                job_record.increase_nfail(cur_hash)
+                nfail = job_record.check_nfail(cur_hash)
+            if nfail > 3:
+                raise RuntimeError('Job %s failed for more than 3 times' % job_uuid)
+            mlog.info('job %s terminated, submit again'% job_uuid)
+            mlog.debug('try %s times for %s'% (nfail, job_uuid))
+            rjob['batch'].submit(task_chunk, command, res = job_handler['resources'],
+                                 outlog = job_handler['outlog'], errlog = job_handler['errlog'],
+                                 restart = True)
+            with self._record_lock:
+                job_record.record_job_id(cur_hash, rjob['batch'].job_id)
+                job_record.dump()
+        elif status == JobStatus.finished :
+            mlog.info('job %s finished' % job_uuid)
+            backward_task_files = job_handler['backward_task_files']
+            if mark_failure:
+                tag_failure_list = ['tag_failure_%d' % ii for ii in range(len(command))]
+                rjob['context'].download(task_chunk, tag_failure_list, check_exists = True, mark_failure = False)
+                rjob['context'].download(task_chunk, backward_task_files, check_exists = True)
+            else:
+                rjob['context'].download(task_chunk, backward_task_files)
+            rjob['context'].clean()
+            with self._record_lock:
+                job_record.record_finish(cur_hash)
+                job_record.dump()
+        return status
+
+
 class JobRecord(object):
     def __init__ (self, path, task_chunks, fname = 'job_record.json', ip=None):
         self.path = os.path.abspath(path)
@@ -259,6 +394,14 @@ class JobRecord(object):
         self.valid_hash(chunk_hash)
         return self.record[chunk_hash]['context'][2]
 
+    def record_job_id(self, chunk_hash, job_id):
+        self.valid_hash(chunk_hash)
+        self.record[chunk_hash]['job_id'] = job_id
+
+    def get_job_id(self, chunk_hash):
+        self.valid_hash(chunk_hash)
+        return self.record[chunk_hash].get('job_id')
+
     def check_finished(self, chunk_hash):
         self.valid_hash(chunk_hash)
         return self.record[chunk_hash]['finished']
@@ -300,6 +443,7 @@ class JobRecord(object):
                 'context': None,
                 'finished': False,
                 'fail_count': 0,
+                'job_id': None,
                 'task_chunk': jj,
             }
 
@@ -44,6 +44,13 @@ class LazyLocalContext(object) :
                dereference = True) :
         pass
 
+    def upload_shared(self,
+                      job_dirs,
+                      local_up_files,
+                      dereference = True) :
+        # the local files are not copied, nothing to share
+        self.upload(job_dirs, local_up_files, dereference = dereference)
+
     def download(self, 
                  job_dirs,
                  remote_down_files,
@@ -66,28 +73,21 @@ class LazyLocalContext(object) :
 
     def block_checkcall(self,
                         cmd) :
-        cwd = os.getcwd()
-        os.chdir(self.local_root)
-        proc = sp.Popen(cmd, shell=True, stdout = sp.PIPE, stderr = sp.PIPE)
+        proc = sp.Popen(cmd, shell=True, cwd = self.local_root, stdout = sp.PIPE, stderr = sp.PIPE)
         o, e = proc.communicate()
         stdout = SPRetObj(o)
         stderr = SPRetObj(e)
         code = proc.returncode
         if code != 0:
-            os.chdir(cwd)        
             raise RuntimeError("Get error code %d in locally calling %s with job: %s ", (code, cmd, self.job_uuid))
-        os.chdir(cwd)        
         return None, stdout, stderr
         
     def block_call(self, cmd) :
-        cwd = os.getcwd()
-        os.chdir(self.local_root)
-        proc = sp.Popen(cmd, shell=True, stdout = sp.PIPE, stderr = sp.PIPE)
+        proc = sp.Popen(cmd, shell=True, cwd = self.local_root, stdout = sp.PIPE, stderr = sp.PIPE)
         o, e = proc.communicate()
         stdout = SPRetObj(o)
         stderr = SPRetObj(e)
         code = proc.returncode
-        os.chdir(cwd)        
         return code, None, stdout, stderr
 
     def clean(self) :
@@ -104,12 +104,15 @@ class LazyLocalContext(object) :
 
     def check_file_exists(self, fname):
         return os.path.isfile(os.path.join(self.local_root, fname))
+
+    def check_files_exist(self, fnames):
+        return [self.check_file_exists(ii) for ii in fnames]
+
+    def read_files(self, fnames):
+        return [self.read_file(ii) if self.check_file_exists(ii) else None for ii in fnames]
         
     def call(self, cmd) :
-        cwd = os.getcwd()
-        os.chdir(self.local_root)
-        proc = sp.Popen(cmd, shell=True, stdout = sp.PIPE, stderr = sp.PIPE)
-        os.chdir(cwd)        
+        proc = sp.Popen(cmd, shell=True, cwd = self.local_root, stdout = sp.PIPE, stderr = sp.PIPE)
         return proc
 
     def kill(self, proc):
@@ -68,22 +68,25 @@ class LocalContext(object) :
                job_dirs,
                local_up_files,
                dereference = True) :
-        cwd = os.getcwd()
         for ii in job_dirs :
             local_job = os.path.join(self.local_root, ii)
             remote_job = os.path.join(self.remote_root, ii)
             os.makedirs(remote_job, exist_ok = True)
-            os.chdir(remote_job)
             for jj in local_up_files :
                 if not os.path.exists(os.path.join(local_job, jj)):
-                    os.chdir(cwd)
                     raise RuntimeError('cannot find upload file ' + os.path.join(local_job, jj))
                 if os.path.exists(os.path.join(remote_job, jj)) :
                     os.remove(os.path.join(remote_job, jj))
-                _check_file_path(jj)
+                _check_file_path(os.path.join(remote_job, jj))
                 os.symlink(os.path.join(local_job, jj),
                            os.path.join(remote_job, jj))
-        os.chdir(cwd)
+
+    def upload_shared(self,
+                      job_dirs,
+                      local_up_files,
+                      dereference = True) :
+        # the local files are not copied, nothing to share
+        self.upload(job_dirs, local_up_files, dereference = dereference)
 
     def download(self, 
                  job_dirs,
@@ -91,15 +94,12 @@ class LocalContext(object) :
                  check_exists = False,
                  mark_failure = True,
                  back_error=False) :
-        cwd = os.getcwd()
         for ii in job_dirs :
             local_job = os.path.join(self.local_root, ii)
             remote_job = os.path.join(self.remote_root, ii)
             flist = remote_down_files
             if back_error :
-                os.chdir(remote_job)
-                flist += glob('error*')                        
-                os.chdir(cwd)
+                flist = flist + [os.path.basename(ff) for ff in glob(os.path.join(remote_job, 'error*'))]
             for jj in flist :
                 rfile = os.path.join(remote_job, jj)
                 lfile = os.path.join(local_job, jj)
@@ -131,32 +131,24 @@ class LocalContext(object) :
                 else :
                     # no nothing in the case of linked files
                     pass
-        os.chdir(cwd)
 
     def block_checkcall(self,
                         cmd) :
-        cwd = os.getcwd()
-        os.chdir(self.remote_root)
-        proc = sp.Popen(cmd, shell=True, stdout = sp.PIPE, stderr = sp.PIPE)
+        proc = sp.Popen(cmd, shell=True, cwd = self.remote_root, stdout = sp.PIPE, stderr = sp.PIPE)
         o, e = proc.communicate()
         stdout = SPRetObj(o)
         stderr = SPRetObj(e)
         code = proc.returncode
         if code != 0:
-            os.chdir(cwd)        
             raise RuntimeError("Get error code %d in locally calling %s with job: %s ", (code, cmd, self.job_uuid))
-        os.chdir(cwd)        
         return None, stdout, stderr
         
     def block_call(self, cmd) :
-        cwd = os.getcwd()
-        os.chdir(self.remote_root)
-        proc = sp.Popen(cmd, shell=True, stdout = sp.PIPE, stderr = sp.PIPE)
+        proc = sp.Popen(cmd, shell=True, cwd = self.remote_root, stdout = sp.PIPE, stderr = sp.PIPE)
         o, e = proc.communicate()
         stdout = SPRetObj(o)
         stderr = SPRetObj(e)
         code = proc.returncode
-        os.chdir(cwd)        
         return code, None, stdout, stderr
 
     def clean(self) :
@@ -173,12 +165,15 @@ class LocalContext(object) :
 
     def check_file_exists(self, fname):
         return os.path.isfile(os.path.join(self.remote_root, fname))
+
+    def check_files_exist(self, fnames):
+        return [self.check_file_exists(ii) for ii in fnames]
+
+    def read_files(self, fnames):
+        return [self.read_file(ii) if self.check_file_exists(ii) else None for ii in fnames]
         
     def call(self, cmd) :
-        cwd = os.getcwd()
-        os.chdir(self.remote_root)
-        proc = sp.Popen(cmd, shell=True, stdout = sp.PIPE, stderr = sp.PIPE)
-        os.chdir(cwd)        
+        proc = sp.Popen(cmd, shell=True, cwd = self.remote_root, stdout = sp.PIPE, stderr = sp.PIPE)
         return proc
 
     def kill(self, proc):
@@ -1,17 +1,164 @@
-import os,getpass,time
+import os,re,getpass,time,threading
+from xml.etree import ElementTree
 from maptool.dispatcher.Batch import Batch
 from maptool.dispatcher.JobStatus import JobStatus
+from maptool import mlog
+
+# the job states from qstat are reused for STATUS_TTL seconds
+STATUS_TTL = 10
+# full status of the given jobs, XML on Torque, with the finished jobs on PBS Pro
+QSTAT_COMMAND = 'qstat -f -x'
+# number of job ids in one qstat call
+QSTAT_MAX_JOBS = 500
 
 def _default_item(resources, key, value) :
     if key not in resources :
         resources[key] = value
 
+def _short_id(job_id) :
+    # 123.server and 123.server.domain are the same job
+    return job_id.strip().split('.')[0]
+
+def parse_qstat(text) :
+    """
+    job states of the full output of qstat, the text format of
+    `qstat -f` or the XML format of `qstat -f -x` on Torque
+
+    Returns:
+        dict: short job id -> state letter
+    """
+    states = {}
+    if text.lstrip().startswith('<') :
+        # one document, or one per job id on some versions
+        text = re.sub(r'<\?xml[^>]*\?>', '', text)
+        root = ElementTree.fromstring('<qstat>' + text + '</qstat>')
+        for job in root.iter('Job') :
+            job_id = job.findtext('Job_Id')
+            state = job.findtext('job_state')
+            if job_id and state :
+                states[_short_id(job_id)] = state.strip()
+        return states
+    job_id = None
+    for line in text.splitlines() :
+        if line.startswith('Job Id:') :
+            job_id = _short_id(line.split(':', 1)[1])
+        elif job_id is not None and line.strip().startswith('job_state') :
+            states[job_id] = line.split('=', 1)[1].strip()
+    return states
+
+
+def _unknown_jobs_only(err_str) :
+    # qstat fails if any of the given jobs has left the scheduler
+    lines = [ii for ii in err_str.splitlines() if ii.strip()]
+    return all(['Unknown Job Id' in ii or 'Job has finished' in ii for ii in lines])
+
+
+class PBSStatusProvider(object) :
+    """
+    Job states of the jobs of a dispatcher from one qstat call (one per
+    QSTAT_MAX_JOBS jobs), shared by its PBS batches. Only the added jobs
+    are asked, a job no longer known to the scheduler is not asked again.
+    The states are refreshed at most once every ttl seconds whatever the
+    number of jobs, and after each submission.
+    """
+    def __init__ (self,
+                  command = QSTAT_COMMAND,
+                  ttl = STATUS_TTL) :
+        self.command = command
+        self.ttl = ttl
+        # short job id -> job id, the jobs still known to the scheduler
+        self.jobs = {}
+        self.gone = set()
+        self.states = {}
+        self.stamp = None
+        self.lock = threading.Lock()
+
+    def invalidate(self) :
+        with self.lock :
+            self.stamp = None
+
+    def add_jobs(self, job_ids) :
+        """
+        jobs asked from the next refresh on
+        """
+        with self.lock :
+            for job_id in job_ids :
+                self._add_job(job_id)
+
+    def _add_job(self, job_id) :
+        job_id = job_id.strip()
+        if _short_id(job_id) not in self.jobs :
+            self.jobs[_short_id(job_id)] = job_id
+            self.gone.discard(_short_id(job_id))
+            self.stamp = None
+
+    def refresh(self, context) :
+        job_ids = sorted(self.jobs.values())
+        states = {}
+        for ii in range(0, len(job_ids), QSTAT_MAX_JOBS) :
+            cmd = self.command + ' ' + ' '.join(job_ids[ii:ii+QSTAT_MAX_JOBS])
+            ret, stdin, stdout, stderr = context.block_call(cmd)
+            out_str = stdout.read().decode('utf-8')
+            err_str = stderr.read().decode('utf-8')
+            if ret != 0 and not _unknown_jobs_only(err_str) :
+                raise RuntimeError ("status command %s fails to execute. erro info: %s return code %d"
+                                    % (self.command, err_str, ret))
+            states.update(parse_qstat(out_str))
+        for short_id in list(self.jobs.keys()) :
+            if short_id not in states :
+                del self.jobs[short_id]
+                self.gone.add(short_id)
+        self.states = states
+        self.stamp = time.time()
+        mlog.debug('%d jobs in qstat' % len(self.states))
+
+    def job_state(self, job_id, context) :
+        """
+        state letter of the job, None if unknown to the scheduler
+        """
+        with self.lock :
+            if _short_id(job_id) not in self.gone :
+                self._add_job(job_id)
+            if self.stamp is None or time.time() - self.stamp > self.ttl :
+                self.refresh(context)
+            return self.states.get(_short_id(job_id))
+
+
 class PBS(Batch) :
 
+    @classmethod
+    def make_status_provider(cls, remote_profile = None) :
+        command = QSTAT_COMMAND
+        if remote_profile is not None :
+            command = remote_profile.get('qstat_command', QSTAT_COMMAND)
+        return PBSStatusProvider(command)
+
+    def _status_of_state(self, status_word) :
+        if      status_word in ["Q","H","W","T"] :
+            return JobStatus.waiting
+        elif    status_word in ["R"] :
+            return JobStatus.running
+        elif    status_word in ["C","E","K","F"] :
+            if self.check_finish_tag() :
+                return JobStatus.finished
+            else :
+                return JobStatus.terminated
+        else :
+            return JobStatus.unknown
+
     def check_status(self) :
         job_id = self._get_job_id()
         if job_id == "" :
             return JobStatus.unsubmitted
+        if self.status_provider is not None :
+            status_word = self.status_provider.job_state(job_id, self.context)
+            if status_word is None :
+                # no longer known to the scheduler
+                if self.check_finish_tag() :
+                    return JobStatus.finished
+                else :
+                    return JobStatus.terminated
+            return self._status_of_state(status_word)
         ret, stdin, stdout, stderr\
             = self.context.block_call ("qstat " + job_id)
         err_str = stderr.read().decode('utf-8')
@@ -27,17 +174,7 @@ class PBS(Batch) :
         status_line = stdout.read().decode('utf-8').split ('\n')[-2]
         status_word = status_line.split ()[-2]        
         # mlog.info (status_word)
-        if      status_word in ["Q","H"] :
-            return JobStatus.waiting
-        elif    status_word in ["R"] :
-            return JobStatus.running
-        elif    status_word in ["C","E","K"] :
-            if self.check_finish_tag() :
-                return JobStatus.finished
-            else :
-                return JobStatus.terminated
-        else :
-            return JobStatus.unknown
+        return self._status_of_state(status_word)
    
     def do_submit(self, 
                   job_dirs,
@@ -57,6 +194,10 @@ class PBS(Batch) :
         subret = (stdout.readlines())
         job_id = subret[0].split()[0]
         self.context.write_file(self.job_id_name, job_id)        
+        self.job_id = job_id
+        if self.status_provider is not None :
+            # the new job is not in the cached states
+            self.status_provider.add_jobs([job_id])
 
     def default_resources(self, res_) :
         """
@@ -130,8 +271,12 @@ class PBS(Batch) :
         return ret        
 
     def _get_job_id(self) :
-        if self.context.check_file_exists(self.job_id_name) :
-            return self.context.read_file(self.job_id_name)
-        else:
+        if self.job_id :
+            return self.job_id
+        # one round trip, None if the job is not submitted
+        job_id = self.context.read_files([self.job_id_name])[0]
+        if job_id is None :
             return ""
+        self.job_id = job_id
+        return self.job_id
 
@@ -1,10 +1,60 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import os, sys, paramiko, json, uuid, tarfile, time, stat, shutil
+import os, io, sys, paramiko, json, uuid, tarfile, time, stat, shutil, threading, shlex, hashlib
+from contextlib import contextmanager
 from glob import glob
 from maptool import mlog
 
+# the connection is probed with a packet at most once in ALIVE_INTERVAL
+# seconds, in between only the state of the transport is checked
+ALIVE_INTERVAL = 30
+# number of ssh connections of a session pool, 'transfer_concurrency' in
+# the remote profile, also the number of chunks transferred at once
+TRANSFER_CONCURRENCY = 4
+# attempts of a transfer interrupted by a dead connection
+TRANSFER_RETRY = 3
+# content addressed store of the files shared by the chunks, in the
+# session root, disabled by 'content_store': false in the remote profile
+STORE_DIR = '.store'
+
+# sha1 of the local files, keyed by path, size and modification time
+_digests = {}
+
+def file_digest(fname) :
+    """
+    sha1 of the content of a local file, each file is only read once as
+    long as it is not modified
+    """
+    st = os.stat(fname)
+    key = (os.path.realpath(fname), st.st_size, st.st_mtime_ns)
+    if key not in _digests :
+        sha = hashlib.sha1()
+        with open(fname, 'rb') as fp :
+            for block in iter(lambda: fp.read(1 << 20), b'') :
+                sha.update(block)
+        _digests[key] = sha.hexdigest()
+    return _digests[key]
+
+
+class CommandOutput (io.BytesIO) :
+    """
+    output of a finished remote command read in full, read() gives bytes
+    and readline() the decoded lines as the channel files of paramiko
+    """
+    def readline(self, size = -1) :
+        return super(CommandOutput, self).readline(size).decode('utf-8')
+
+    def readlines(self, hint = -1) :
+        return [ii.decode('utf-8') for ii in super(CommandOutput, self).readlines(hint)]
+
+    def __next__(self) :
+        line = self.readline()
+        if not line :
+            raise StopIteration
+        return line
+
+
 class SSHSession (object) :
     def __init__ (self, jdata) :
         self.remote_profile = jdata
@@ -18,6 +68,19 @@ class SSHSession (object) :
             self.remote_password = self.remote_profile['password']
         self.remote_workpath = self.remote_profile['work_path']
         self.ssh = None
+        # idle sftp clients, one is lent to each transfer, so that a long
+        # transfer does not block the commands and the other transfers
+        self.idle_sftp = []
+        # incremented when the clients of the old transport are dropped
+        self.generation = 0
+        self.last_alive = None
+        # digests known to be in the content store
+        self.stored = set()
+        # lock of the idle clients, only held to get or return a client
+        # and not during a transfer
+        self.lock = threading.RLock()
+        # short lock of the liveness probe and the reconnection
+        self.alive_lock = threading.Lock()
         self._setup_ssh(self.remote_host,
                         self.remote_port,
                         username=self.remote_uname,
@@ -26,34 +89,46 @@ class SSHSession (object) :
     def ensure_alive(self,
                      max_check = 10,
                      sleep_time = 10):
-        count = 1
-        while not self._check_alive():
-            if count == max_check:
-                raise RuntimeError('cannot connect ssh after %d failures at interval %d s' %
-                                   (max_check, sleep_time))
-            mlog.info('connection check failed, try to reconnect to ' + self.remote_host)
-            self._setup_ssh(self.remote_host,
-                            self.remote_port,
-                            username=self.remote_uname,
-                            password=self.remote_password)
-            count += 1
-            time.sleep(sleep)
+        with self.alive_lock :
+            count = 1
+            while not self._check_alive():
+                if count == max_check:
+                    raise RuntimeError('cannot connect ssh after %d failures at interval %d s' %
+                                       (max_check, sleep_time))
+                mlog.info('connection check failed, try to reconnect to ' + self.remote_host)
+                try :
+                    self._setup_ssh(self.remote_host,
+                                    self.remote_port,
+                                    username=self.remote_uname,
+                                    password=self.remote_password)
+                except (OSError, EOFError, paramiko.SSHException) as e :
+                    mlog.info('reconnection failed: %s' % e)
+                count += 1
+                time.sleep(sleep_time)
 
     def _check_alive(self):
         if self.ssh == None:
             return False
+        transport = self.ssh.get_transport()
+        if transport is None or not transport.is_active() :
+            return False
+        if self.last_alive is not None and time.time() - self.last_alive < ALIVE_INTERVAL :
+            return True
         try :
-            transport = self.ssh.get_transport()
             transport.send_ignore()
-            return True
-        except EOFError:
-            return False        
+        except (OSError, EOFError, paramiko.SSHException):
+            return False
+        self.last_alive = time.time()
+        return True
 
     def _setup_ssh(self,
                    hostname,
                    port, 
                    username = None,
                    password = None):
+        # the sftp channels die with the old transport
+        self._drop_sftp()
+        self.last_alive = None
         self.ssh = paramiko.SSHClient()        
         # ssh_client.load_system_host_keys()        
         self.ssh.set_missing_host_key_policy(paramiko.WarningPolicy)
@@ -65,13 +140,91 @@ class SSHSession (object) :
     def get_ssh_client(self) :
         return self.ssh
 
+    def _drop_sftp(self) :
+        with self.lock :
+            self.generation += 1
+            idle, self.idle_sftp = self.idle_sftp, []
+        for sftp in idle :
+            sftp.close()
+
+    @contextmanager
+    def sftp_client(self) :
+        """
+        an sftp client of the session checked alive, held by one thread
+        until the end of the block. The clients are long-lived, an idle
+        one is reused and a new channel is opened only if all of them
+        are busy. A paramiko client cannot be used by two threads at once.
+        """
+        self.ensure_alive()
+        with self.lock :
+            generation = self.generation
+            sftp = None
+            while len(self.idle_sftp) > 0 and sftp is None :
+                sftp = self.idle_sftp.pop()
+                if sftp.get_channel().closed :
+                    sftp = None
+            if sftp is None :
+                sftp = self.ssh.open_sftp()
+        broken = False
+        try :
+            yield sftp
+        except (EOFError, ConnectionError, paramiko.SSHException) :
+            broken = True
+            raise
+        finally :
+            with self.lock :
+                if not broken and generation == self.generation :
+                    self.idle_sftp.append(sftp)
+                    sftp = None
+            if sftp is not None :
+                sftp.close()
+
+    def reset(self) :
+        """
+        drop the sftp clients and probe the connection at the next use,
+        after a transfer failed on a dead channel
+        """
+        self._drop_sftp()
+        self.last_alive = None
+
     def get_session_root(self) :
         return self.remote_workpath
 
     def close(self) :
+        self._drop_sftp()
         self.ssh.close()
 
 
+class SSHSessionPool (object) :
+    """
+    Sessions with their own transports to the same remote, handed out
+    round robin to the contexts, so that the transfers of several chunks
+    do not share the stream of one connection. The first session is
+    opened at once, the others on their first use.
+    """
+    def __init__ (self, jdata) :
+        self.remote_profile = jdata
+        self.nsessions = max(1, jdata.get('transfer_concurrency', TRANSFER_CONCURRENCY))
+        self.sessions = [SSHSession(jdata)]
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def get_session(self) :
+        with self.lock :
+            idx = self.count % self.nsessions
+            self.count += 1
+            if idx == len(self.sessions) :
+                self.sessions.append(SSHSession(self.remote_profile))
+            return self.sessions[idx]
+
+    def get_session_root(self) :
+        return self.sessions[0].get_session_root()
+
+    def close(self) :
+        for ii in self.sessions :
+            ii.close()
+
+
 class SSHContext (object):
     def __init__ (self,
                   local_root,
@@ -84,14 +237,14 @@ class SSHContext (object):
            self.job_uuid=job_uuid
         else:
            self.job_uuid = str(uuid.uuid4())
+        if isinstance(ssh_session, SSHSessionPool) :
+            ssh_session = ssh_session.get_session()
         self.remote_root = os.path.join(ssh_session.get_session_root(), self.job_uuid)
         self.ssh_session = ssh_session
-        self.ssh_session.ensure_alive()
         try:
-           sftp = self.ssh_session.ssh.open_sftp() 
-           sftp.mkdir(self.remote_root)
-           sftp.close()
-        except: 
+           with self.ssh_session.sftp_client() as sftp :
+               sftp.mkdir(self.remote_root)
+        except IOError: 
            pass
     
     @property
@@ -109,14 +262,68 @@ class SSHContext (object):
                local_up_files,
                dereference = True) :
         self.ssh_session.ensure_alive()
-        cwd = os.getcwd()
-        os.chdir(self.local_root) 
         file_list = []
         for ii in job_dirs :
             for jj in local_up_files :
                 file_list.append(os.path.join(ii,jj))        
         self._put_files(file_list, dereference = dereference)
-        os.chdir(cwd)
+
+    def upload_shared(self,
+                      job_dirs,
+                      local_up_files,
+                      dereference = True) :
+        """
+        Upload files shared by many chunks, i.e. POTCAR. The files are
+        sent once to the content addressed store of the session root and
+        hard linked (symlinked on failure) from the job root, a file whose
+        sha1 is already in the store is not sent again. The stored files
+        are read-only so that a job cannot modify the copy of the others.
+        """
+        if not dereference or not self.ssh_session.remote_profile.get('content_store', True) :
+            return self.upload(job_dirs, local_up_files, dereference = dereference)
+        self.ssh_session.ensure_alive()
+        # path in the job root -> digest
+        files = {}
+        sources = {}
+        for ii in job_dirs :
+            for jj in local_up_files :
+                path = os.path.join(self.local_root, ii, jj)
+                if os.path.isdir(path) :
+                    paths = [os.path.join(root, ff) for root, dirs, fnames in os.walk(path, followlinks = True)
+                             for ff in fnames]
+                else :
+                    paths = [path]
+                for ff in paths :
+                    digest = file_digest(ff)
+                    files[os.path.relpath(ff, self.local_root)] = digest
+                    sources[digest] = ff
+        if len(files) == 0 :
+            return
+        store = os.path.join(self.ssh_session.get_session_root(), STORE_DIR)
+        # the manifest of the store is only asked for the unknown digests
+        unknown = sorted(set(files.values()) - self.ssh_session.stored)
+        exists = self.check_files_exist([os.path.join(store, ii) for ii in unknown])
+        missing = [ii for ii, ee in zip(unknown, exists) if not ee]
+        if len(missing) > 0 :
+            self._put_store(store, [(ii, sources[ii]) for ii in missing])
+            mlog.debug('stored %d files of %s' % (len(missing), self.job_uuid))
+        self.ssh_session.stored.update(unknown)
+        # link the job files to the store
+        dirs = sorted(set([os.path.dirname(ii) for ii in files]) - set(['']))
+        cmd = []
+        if len(dirs) > 0 :
+            cmd.append('mkdir -p ' + ' '.join([shlex.quote(ii) for ii in dirs]))
+        for fname, digest in sorted(files.items()) :
+            src = shlex.quote(os.path.join(store, digest))
+            dst = shlex.quote(fname)
+            # a dangling symlink fails the check
+            cmd.append('{ ln -f %s %s 2>/dev/null || ln -sf %s %s ; } && [ -e %s ]' % (src, dst, src, dst, dst))
+        try:
+            self.block_checkcall(' && '.join(cmd))
+        except RuntimeError:
+            # the store was changed behind the session, ask it again next time
+            self.ssh_session.stored.difference_update(files.values())
+            raise
 
     def download(self, 
                  job_dirs,
@@ -125,14 +332,16 @@ class SSHContext (object):
                  mark_failure = True,
                  back_error=False) :
         self.ssh_session.ensure_alive()
-        cwd = os.getcwd()
-        os.chdir(self.local_root) 
         file_list = []
+        if check_exists:
+            exists = self.check_files_exist([os.path.join(ii,jj)
+                                             for ii in job_dirs for jj in remote_down_files])
+            exists = dict(zip([(ii,jj) for ii in job_dirs for jj in remote_down_files], exists))
         for ii in job_dirs :
             for jj in remote_down_files :
                 file_name = os.path.join(ii,jj)                
                 if check_exists:
-                    if self.check_file_exists(file_name):
+                    if exists[(ii,jj)]:
                         file_list.append(file_name)
                     elif mark_failure :
                         with open(os.path.join(self.local_root, ii, 'tag_failure_download_%s' % jj), 'w') as fp: pass
@@ -141,17 +350,24 @@ class SSHContext (object):
                 else:
                     file_list.append(file_name)
             if back_error:
-               errors=glob(os.path.join(ii,'error*'))
-               file_list.extend(errors)
+               errors=glob(os.path.join(self.local_root,ii,'error*'))
+               file_list.extend([os.path.relpath(ff, self.local_root) for ff in errors])
         if len(file_list) > 0:
             self._get_files(file_list)
-        os.chdir(cwd)
         
-    def block_checkcall(self, 
-                        cmd) :
+    def _exec(self, cmd) :
         self.ssh_session.ensure_alive()
         stdin, stdout, stderr = self.ssh.exec_command(('cd %s ;' % self.remote_root) + cmd)
-        exit_status = stdout.channel.recv_exit_status() 
+        # the output is read before waiting for the exit status, the
+        # command blocks once its output fills the window of the channel
+        out = CommandOutput(stdout.read())
+        err = CommandOutput(stderr.read())
+        exit_status = stdout.channel.recv_exit_status()
+        return exit_status, stdin, out, err
+
+    def block_checkcall(self, 
+                        cmd) :
+        exit_status, stdin, stdout, stderr = self._exec(cmd)
         if exit_status != 0:
             raise RuntimeError("Get error code %d in calling %s through ssh with job: %s . message: %s" %
                                (exit_status, cmd, self.job_uuid, stderr.read().decode('utf-8')))
@@ -159,42 +375,68 @@ class SSHContext (object):
 
     def block_call(self, 
                    cmd) :
-        self.ssh_session.ensure_alive()
-        stdin, stdout, stderr = self.ssh.exec_command(('cd %s ;' % self.remote_root) + cmd)
-        exit_status = stdout.channel.recv_exit_status() 
-        return exit_status, stdin, stdout, stderr
+        return self._exec(cmd)
 
     def clean(self) :        
-        self.ssh_session.ensure_alive()
-        sftp = self.ssh.open_sftp()        
-        self._rmtree(sftp, self.remote_root)
-        sftp.close()
+        with self.ssh_session.sftp_client() as sftp :
+            self._rmtree(sftp, self.remote_root)
 
     def write_file(self, fname, write_str):
-        self.ssh_session.ensure_alive()
-        sftp = self.ssh.open_sftp()
-        with sftp.open(os.path.join(self.remote_root, fname), 'w') as fp :
-            fp.write(write_str)
-        sftp.close()
+        with self.ssh_session.sftp_client() as sftp :
+            with sftp.open(os.path.join(self.remote_root, fname), 'w') as fp :
+                fp.write(write_str)
 
     def read_file(self, fname):
-        self.ssh_session.ensure_alive()
-        sftp = self.ssh.open_sftp()
-        with sftp.open(os.path.join(self.remote_root, fname), 'r') as fp:
-            ret = fp.read().decode('utf-8')
-        sftp.close()
+        with self.ssh_session.sftp_client() as sftp :
+            with sftp.open(os.path.join(self.remote_root, fname), 'r') as fp:
+                ret = fp.read().decode('utf-8')
         return ret
 
     def check_file_exists(self, fname):
-        self.ssh_session.ensure_alive()
-        sftp = self.ssh.open_sftp()
-        try:
-            sftp.stat(os.path.join(self.remote_root, fname)) 
-            ret = True
-        except IOError:
-            ret = False
-        sftp.close()
+        with self.ssh_session.sftp_client() as sftp :
+            try:
+                sftp.stat(os.path.join(self.remote_root, fname)) 
+                ret = True
+            except IOError:
+                ret = False
         return ret        
+
+    def check_files_exist(self, fnames):
+        """
+        existence of many files in the job root with one remote command,
+        one round trip instead of one per file
+        """
+        if len(fnames) == 0 :
+            return []
+        cmd = 'for ff in %s ; do if [ -e "$ff" ] ; then echo 1 ; else echo 0 ; fi ; done' \
+              % ' '.join([shlex.quote(ii) for ii in fnames])
+        stdin, stdout, stderr = self.block_checkcall(cmd)
+        return [ii.strip() == '1' for ii in stdout.read().decode('utf-8').split()]
+
+    def read_files(self, fnames):
+        """
+        contents of many small files in the job root with one remote
+        command, None for a missing file
+        """
+        if len(fnames) == 0 :
+            return []
+        # a line with the size or -1 followed by the content of each file
+        cmd = 'for ff in %s ; do if [ -f "$ff" ] ; then wc -c < "$ff" ; cat "$ff" ; else echo -1 ; fi ; done' \
+              % ' '.join([shlex.quote(ii) for ii in fnames])
+        stdin, stdout, stderr = self.block_checkcall(cmd)
+        data = stdout.read()
+        ret = []
+        pos = 0
+        for ii in fnames :
+            end = data.index(b'\n', pos)
+            size = int(data[pos:end])
+            pos = end + 1
+            if size < 0 :
+                ret.append(None)
+            else :
+                ret.append(data[pos:pos+size].decode('utf-8'))
+                pos += size
+        return ret
         
     def call(self, cmd):
         stdin, stdout, stderr = self.ssh.exec_command(cmd)
@@ -230,33 +472,59 @@ class SSHContext (object):
         if verbose: mlog.info('removing %s%s' % ('    ' * level, remotepath))
         sftp.rmdir(remotepath)
 
+    def _transfer(self, func) :
+        """
+        func(sftp) with the sftp client of the session, again on a new
+        channel if the connection dies during the transfer
+        """
+        for ii in range(TRANSFER_RETRY) :
+            try:
+                with self.ssh_session.sftp_client() as sftp :
+                    return func(sftp)
+            except (EOFError, ConnectionError, paramiko.SSHException) as e:
+                if ii == TRANSFER_RETRY - 1 :
+                    raise
+                mlog.info('transfer of %s failed: %s, try again' % (self.job_uuid, e))
+                self.ssh_session.reset()
+
     def _put_files(self,
                    files,
                    dereference = True) :
         of = self.job_uuid + '.tgz'
-        # local tar
-        cwd = os.getcwd()
-        os.chdir(self.local_root)
-        if os.path.isfile(of) :
-            os.remove(of)
-        with tarfile.open(of, "w:gz", dereference = dereference) as tar:
+        # local tar, the paths are relative to local_root and not to the
+        # working directory shared by the threads
+        from_f = os.path.join(self.local_root, of)
+        if os.path.isfile(from_f) :
+            os.remove(from_f)
+        with tarfile.open(from_f, "w:gz", dereference = dereference) as tar:
             for ii in files :
-                tar.add(ii)
-        os.chdir(cwd)
+                tar.add(os.path.join(self.local_root, ii), arcname = ii)
         # trans
+        to_f = os.path.join(self.remote_root, of)
+        self._transfer(lambda sftp: sftp.put(from_f, to_f))
+        # remote extract and clean up
+        self.block_checkcall('tar xf %s && rm -f %s' % (of, of))
+        os.remove(from_f)
+
+    def _put_store(self, store, files) :
+        """
+        send the (digest, local file) to the store, the files are moved
+        in place once complete, so that a file linked by another chunk is
+        never partially written
+        """
+        of = self.job_uuid + '_store.tgz'
         from_f = os.path.join(self.local_root, of)
+        if os.path.isfile(from_f) :
+            os.remove(from_f)
+        with tarfile.open(from_f, "w:gz") as tar:
+            for digest, fname in files :
+                tar.add(fname, arcname = digest)
         to_f = os.path.join(self.remote_root, of)
-        sftp = self.ssh.open_sftp()
-        try:
-            sftp.put(from_f, to_f)
-        except:
-            print("from %s to %s error!"%(from_f,to_f))
-        # remote extract
-        self.block_checkcall('tar xf %s' % of)
-        # clean up
+        self._transfer(lambda sftp: sftp.put(from_f, to_f))
+        tmp = shlex.quote(os.path.join(store, 'tmp.' + self.job_uuid))
+        self.block_checkcall('mkdir -p %s && tar xzf %s -C %s && chmod a-w %s/* && mv -f %s/* %s/ && rmdir %s && rm -f %s'
+                             % (tmp, of, tmp, tmp, tmp, shlex.quote(store), tmp, of))
         os.remove(from_f)
-        sftp.remove(to_f)
-        sftp.close()
 
     def _get_files(self, 
                    files) :
@@ -271,15 +539,10 @@ class SSHContext (object):
         to_f = os.path.join(self.local_root, of)
         if os.path.isfile(to_f) :
             os.remove(to_f)
-        sftp = self.ssh.open_sftp()
-        sftp.get(from_f, to_f)
+        self._transfer(lambda sftp: sftp.get(from_f, to_f))
+        self._transfer(lambda sftp: sftp.remove(from_f))
         # extract
-        cwd = os.getcwd()
-        os.chdir(self.local_root)
-        with tarfile.open(of, "r:gz") as tar:
-            tar.extractall()
-        os.chdir(cwd)        
+        with tarfile.open(to_f, "r:gz") as tar:
+            tar.extractall(path = self.local_root)
         # cleanup
         os.remove(to_f)
-        sftp.remove(from_f)
-        sftp.close()
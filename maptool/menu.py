@@ -71,7 +71,8 @@ b2 >>> structure finger print
 b3 >>> structure difference
 b4 >>> get primitive cell
 b5 >>> get conventional cell
-b6 >>> get XRD pattern''')
+b6 >>> get XRD pattern
+b7 >>> structure deduplication''')
 
 def vasp_inout():
     sepline(ch=" vasp in/out tools ",sp='=')
@@ -19,6 +19,28 @@ def main():
 
     parser = OptionParser()
     parser.add_option("-i", "--info", dest="info", action="store_true")
+    group = OptionGroup(parser, "Batch post-processing of VASP calculations")
+    group.add_option("-b", "--batch", dest="batch", action="append",
+                     help="directory or glob pattern of the calculations, can be repeated")
+    group.add_option("-a", "--analysis", dest="analysis", default="tdos,gap",
+                     help="comma separated analyses: tdos, gap, pdos, optics, diffusion [default: %default]")
+    group.add_option("-n", "--nproc", dest="nproc", type="int",
+                     help="number of processes [default: number of cpus]")
+    group.add_option("--pdos-groups", dest="pdos_groups", default="element",
+                     help="element, layer [a|b|c tol] or selections separated by ';' [default: %default]")
+    group.add_option("--timestep", dest="timestep", type="float",
+                     help="time between two MD frames in fs [default: POTIM*NBLOCK]")
+    group.add_option("--nblocks", dest="nblocks", type="int", default=5,
+                     help="number of blocks of the diffusion coefficient [default: %default]")
+    group.add_option("--no-cache", dest="use_cache", action="store_false", default=True,
+                     help="do not read or write the cache of the parsed output")
+    parser.add_option_group(group)
+    group = OptionGroup(parser, "Batch symmetry analysis of structure files")
+    group.add_option("-s", "--symmetry", dest="symmetry", action="append",
+                     help="structure file or glob pattern, i.e. '*.cif', can be repeated")
+    group.add_option("--symprec", dest="symprec", type="float", default=0.01,
+                     help="tolerance of spglib [default: %default]")
+    parser.add_option_group(group)
     (options, args) = parser.parse_args()
 
     # shows info
@@ -26,6 +48,44 @@ def main():
        info()
        os._exit(0)
 
+    if options.batch:
+       from maptool.code.vasp.batch import run_batch, format_summary, write_summary, \
+                                          diffusion_arrhenius, SUMMARY_FILE
+       T1=time()
+       results=run_batch(options.batch,
+                         analyses=[x.strip() for x in options.analysis.split(',') if x.strip()],
+                         nproc=options.nproc,
+                         pdos_groups=options.pdos_groups,
+                         timestep=options.timestep,
+                         nblocks=options.nblocks,
+                         use_cache=options.use_cache)
+       print(format_summary(results))
+       write_summary(results)
+       for (element,(ea,d0,err)) in sorted(diffusion_arrhenius(results).items()):
+          print("Arrhenius fit of %s: Ea = %.3f +/- %.3f eV, D0 = %.3e cm^2/s"%(element,ea,err,d0))
+       nfailed=len([x for x in results if x['status']!='ok'])
+       T2=time()
+       print("%d directories, %d failed, summary in %s"%(len(results),nfailed,SUMMARY_FILE))
+       print("Total Time: %.3f (s) "%(T2-T1))
+       return
+
+    if options.symmetry:
+       from glob import glob
+       from maptool.core.symmetry import batch_symmetry_files, format_symmetry_table, \
+                                         write_symmetry_table, SYMMETRY_FILE
+       T1=time()
+       fnames=[]
+       for pattern in options.symmetry:
+          fnames.extend([x for x in sorted(glob(pattern)) if os.path.isfile(x) and x not in fnames])
+       results=batch_symmetry_files(fnames,symprec=options.symprec,nproc=options.nproc)
+       print(format_symmetry_table(results))
+       write_symmetry_table(results)
+       nfailed=len([x for x in results if x.status!='ok'])
+       T2=time()
+       print("%d structures, %d failed, summary in %s"%(len(results),nfailed,SYMMETRY_FILE))
+       print("Total Time: %.3f (s) "%(T2-T1))
+       return
+
     T1=time()
     head()
     menu()
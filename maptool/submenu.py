@@ -11,7 +11,8 @@ from  maptool.core.mpdb import    get_mp_banddos, get_mp_structure,\
                                   get_mp_phase_graph, get_mp_properties
 from  maptool.core.oqmd import  get_oqmd_structure
 from  maptool.core.analysis import  structure_symmetry,get_primitive_cell,\
-                                    get_conventional_cell
+                                    get_conventional_cell,structure_finger_print,\
+                                    structures_difference,structure_deduplicate
 from  maptool.code.vasp import   vaspinput,vaspout
 from  maptool.util.utils import wait,sepline,wait_sep,your_choice,warn_tip, \
                                 multi_structs
@@ -90,6 +91,8 @@ def select_function(choice):
        return get_conventional_cell()
     elif choice=="b6":
        return get_xrd()
+    elif choice=="b7":
+       return structure_deduplicate()
 
 # vasp in/out tools
     elif choice=="c1":
@@ -156,6 +159,7 @@ def select_function(choice):
        print('{} >>> {}'.format('11','optics analysis'))
        print('{} >>> {}'.format('12','mechanical analysis'))
        print('{} >>> {}'.format('13','ab initio molecular dynamics analysis'))
+       print('{} >>> {}'.format('14','clean cached data'))
        label .input3
        wait_sep()
        choice=wait()
@@ -186,7 +190,9 @@ def select_function(choice):
        elif choice=="12":
           return elastic_analysis()
        elif choice=="13":
-          return aimd_analysis()
+          return vaspout.aimd_analysis()
+       elif choice=="14":
+          return vaspout.clean_cached_data()
        else:
           print("unknown choice, check the input")
           goto .input3
@@ -56,6 +56,34 @@ def check_file(filename):
        print(filename+" file is not found")
        os._exit(0)
 
+def write_col_data(filename,data,head_line='',sep=0,e_fmt=False,str_data=False):
+    r'''
+    write column data to file
+
+    @in
+      - filename, str
+      - data, np.2darray, one column per quantity, or str if str_data
+      - head_line, str, written before the data
+      - sep, int, a blank line is inserted after every sep rows, i.e.
+        between the bands for gnuplot
+      - e_fmt, bool, use the scientific format
+      - str_data, bool, data is a string written as it is
+    '''
+    with open(filename,'w') as f:
+         if head_line:
+            f.write(head_line.rstrip('\n')+'\n')
+         if str_data:
+            f.write(data)
+            return
+         fmt='%15.6E' if e_fmt else '%12.6f'
+         data=np.atleast_2d(data)
+         if sep<=0:
+            sep=len(data)
+         for i in range(0,len(data),sep):
+             np.savetxt(f,data[i:i+sep],fmt=fmt,delimiter='')
+             if sep<len(data):
+                f.write('\n')
+
 def check_matplotlib():
     r'''
     loading the plot tool: matplot lib
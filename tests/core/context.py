@@ -5,6 +5,36 @@ from maptool.core.analysis import xrd
 from maptool.core.analysis import structure_dedup
 from maptool.core.analysis import volume_predict
 from maptool.core.oqmd import QMPYRester
+from maptool.core.average import (planar_average,
+                                  miller_planar_average,
+                                  macroscopic_average,
+                                  grid_average)
+from maptool.core.diffraction import xrd_peaks, xrd_patterns, gaussian_smearing
+from maptool.core.dedup import distance_fingerprint, dedup_clusters, FINGERPRINT_TOL
+from maptool.core.fingerprint import (radial_fingerprint,
+                                      angular_fingerprint,
+                                      structure_fingerprints,
+                                      fingerprint_distances,
+                                      close_pairs)
+from maptool.core.similarity import FingerprintIndex
+from maptool.core.symmetry import (batch_symmetry,
+                                   batch_symmetry_files,
+                                   format_symmetry_table)
+from maptool.core.aimd import (partial_rdf,
+                               unwrap_positions,
+                               msd_fft,
+                               msd,
+                               diffusion_coefficient,
+                               block_diffusion,
+                               arrhenius_fit,
+                               finite_velocities,
+                               velocity_autocorrelation,
+                               vibrational_dos)
+from maptool.code.vasp.trajectory import Trajectory
+from maptool.core.optics import (optical_spectra,
+                                 kramers_kronig,
+                                 kramers_kronig_error,
+                                 spectra_table)
 from maptool.io.read_structure import read_structures_from_file
 from maptool.io.read_structure import read_structures_from_files
 def setUpModule():
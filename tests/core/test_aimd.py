@@ -0,0 +1,155 @@
+import sys
+import os
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'core'
+from .context import setUpModule
+from .context import partial_rdf
+from .context import Trajectory
+from .context import unwrap_positions
+from .context import msd_fft
+from .context import msd
+from .context import diffusion_coefficient
+from .context import block_diffusion
+from .context import arrhenius_fit
+from .context import finite_velocities
+from .context import velocity_autocorrelation
+from .context import vibrational_dos
+
+
+class TestPartialRDF(unittest.TestCase):
+    def setUp(self):
+        self.traj = Trajectory.from_xdatcar('test_rdf_XDATCAR.txt')
+        self.ref_data = np.loadtxt('test_rdf_ref.txt')
+        self.threshold = 0.07
+
+    def test_correctness(self):
+        traj = self.traj
+        (partials, radii, elements) = partial_rdf(traj.positions, traj.lattices, traj.species,
+                                                  nbins=100, nproc=1)
+        self.assertEqual(elements, ['Se', 'V'])
+        self.assertEqual(partials.shape, (2, 2, 100))
+        self.assertTrue(np.allclose(partials[0, 1], partials[1, 0]))
+        test_data = np.asarray([radii, partials[0, 0], partials[0, 1], partials[1, 1]]).T
+        diff = np.sum(np.abs((test_data - self.ref_data).flatten()))
+        self.assertGreater(self.threshold, diff)
+
+    def test_parallel(self):
+        traj = self.traj
+        (serial, _, _) = partial_rdf(traj.positions, traj.lattices[0], traj.species, nproc=1)
+        (parallel, _, _) = partial_rdf(traj.positions, traj.lattices[0], traj.species, nproc=2)
+        self.assertTrue(np.allclose(serial, parallel))
+
+    def test_small_cell(self):
+        # simple cubic, the cutoff is larger than the cell
+        positions = np.zeros((1, 1, 3))
+        (g, radii, _) = partial_rdf(positions, np.eye(3) * 2.0, ['H'], r=4.5, nbins=9,
+                                    range=(0, 4.5), nproc=1)
+        edges = np.linspace(0, 4.5, 10)
+        shells = 4 * np.pi * (edges[1:]**3 - edges[:-1]**3) / 3
+        counts = np.round(g[0, 0] * shells / 8.0)
+        # 6 at 2, 12 at 2.83, 8 at 3.46, 6 at 4 and 24 at 4.47 Angstrom
+        self.assertEqual(list(counts), [0, 0, 0, 0, 6, 12, 8, 0, 30])
+
+class TestMSD(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # random walk with <dx^2> = 0.09 Angstrom^2 per fs in each direction
+        steps = rng.normal(scale=0.3, size=(1000, 200, 3))
+        self.coords = np.cumsum(steps, axis=0)
+        self.lattice = np.eye(3) * 10.0
+        self.positions = np.mod(self.coords / 10.0, 1.0)
+        self.species = ['A'] * 100 + ['B'] * 100
+
+    def test_fft(self):
+        coords = self.coords[:300, :10]
+        ref = np.array([np.mean(np.sum((coords[m:] - coords[:300 - m])**2, axis=-1), axis=0)
+                        for m in range(300)])
+        self.assertTrue(np.allclose(msd_fft(coords), ref))
+
+    def test_unwrap(self):
+        coords = unwrap_positions(self.positions, self.lattice)
+        self.assertTrue(np.allclose(coords - coords[0], self.coords - self.coords[0]))
+
+    def test_diffusion(self):
+        (data, atoms, elements) = msd(self.positions, self.lattice, self.species,
+                                      remove_drift=False)
+        self.assertEqual(elements, ['A', 'B'])
+        self.assertEqual(atoms.shape, (1000, 200))
+        self.assertTrue(np.allclose(data[:, 0], np.mean(atoms[:, :100], axis=1)))
+        diff = diffusion_coefficient(data, 1.0)
+        self.assertTrue(np.allclose(diff, 0.0045, rtol=0.25))
+        (values, errors, _) = block_diffusion(self.positions, self.lattice, self.species,
+                                              1.0, nblocks=4)
+        self.assertTrue(np.all(errors > 0))
+        self.assertTrue(np.allclose(values, 0.0045, rtol=0.25))
+
+    def test_short_blocks(self):
+        # 3 blocks of at least MIN_BLOCK_FRAMES frames instead of 5
+        (values, errors, _) = block_diffusion(self.positions[:35], self.lattice,
+                                              self.species, 1.0, nblocks=5)
+        self.assertEqual(values.shape, (2,))
+        self.assertTrue(np.all(np.isfinite(errors)))
+        with self.assertRaises(ValueError):
+            block_diffusion(self.positions[:4], self.lattice, self.species, 1.0)
+
+    def test_arrhenius(self):
+        kb = 8.617333e-5
+        temperatures = np.array([500, 700, 900, 1100])
+        (ea, d0, error) = arrhenius_fit(temperatures, 1e-3 * np.exp(-0.3 / (kb * temperatures)))
+        self.assertAlmostEqual(ea, 0.3, places=3)
+        self.assertAlmostEqual(d0, 1e-3, places=6)
+        self.assertAlmostEqual(error, 0.0)
+
+
+class TestVibration(unittest.TestCase):
+    def setUp(self):
+        # H atoms vibrate at 10 THz and O atoms at 25 THz, 1 fs per frame
+        rng = np.random.RandomState(1)
+        times = np.arange(4001)[:, None, None]
+        freqs = np.array([10, 10, 25, 25])[None, :, None] / 1000.0
+        phases = rng.uniform(0, 2 * np.pi, size=(1, 4, 3))
+        centers = np.array([1.0, 3.0, 5.0, 7.0])[None, :, None]
+        self.positions = (0.1 * np.cos(2 * np.pi * freqs * times + phases) + centers) / 10.0
+        self.lattice = np.eye(3) * 10.0
+        self.species = ['H', 'H', 'O', 'O']
+
+    def test_vacf(self):
+        vel = finite_velocities(self.positions, self.lattice, 1.0)
+        nvel = len(vel)
+        ref = np.array([np.sum(vel[m:] * vel[:nvel - m]) / (nvel - m) for m in range(50)])
+        (times, vacf, elements) = velocity_autocorrelation(self.positions, self.lattice,
+                                                           self.species, 1.0, segment=nvel,
+                                                           masses={'H': 1.0, 'O': 1.0})
+        self.assertEqual(elements, ['H', 'O'])
+        self.assertTrue(np.allclose(np.sum(vacf, axis=1)[:50], ref / ref[0]))
+        self.assertAlmostEqual(times[1], 1.0)
+
+    def test_partial_segment(self):
+        # 25 velocities in segments of 10, 10 and 5
+        positions = self.positions[:26]
+        vel = finite_velocities(positions, self.lattice, 1.0)
+        pairs = [(0, 10), (10, 20), (20, 25)]
+        ref = np.array([sum([np.sum(vel[a + m:b] * vel[a:b - m]) for (a, b) in pairs])
+                        / sum([max(b - a - m, 0) for (a, b) in pairs]) for m in range(10)])
+        (times, vacf, _) = velocity_autocorrelation(positions, self.lattice, self.species,
+                                                    1.0, segment=10,
+                                                    masses={'H': 1.0, 'O': 1.0})
+        self.assertEqual(len(times), 10)
+        self.assertTrue(np.allclose(np.sum(vacf, axis=1), ref / ref[0]))
+
+    def test_vdos(self):
+        for segment in [4000, 1000]:
+            (times, vacf, _) = velocity_autocorrelation(self.positions, self.lattice,
+                                                        self.species, 1.0, segment=segment)
+            self.assertEqual(len(times), segment)
+            (freqs, dos) = vibrational_dos(times, vacf, nmodes=12)
+            self.assertAlmostEqual(freqs[np.argmax(dos[:, 0])], 10.0, places=1)
+            self.assertAlmostEqual(freqs[np.argmax(dos[:, 1])], 25.0, places=1)
+            self.assertAlmostEqual(np.sum(dos) * (freqs[1] - freqs[0]), 12.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
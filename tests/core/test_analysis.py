@@ -13,9 +13,12 @@ __package__ = 'core'
 from .context import setUpModule
 from .context import rdf
 from .context import xrd
+from .context import xrd_patterns
+from .context import gaussian_smearing
 from .context import read_structures_from_file
 from .context import read_structures_from_files
 from .context import structure_dedup
+from .context import distance_fingerprint, dedup_clusters, FINGERPRINT_TOL
 from .context import volume_predict
 
 
@@ -81,6 +84,30 @@ class TestXRD(unittest.TestCase):
         self.assertGreater(self.threshold, dx)
         self.assertGreater(self.threshold, dy)
 
+    def test_batch(self):
+        ref_x = np.array([23.87772225, 33.20090362, 41.30842371, 47.66134518, 48.87943686,
+                          53.99026029, 60.36971884, 69.69468145, 70.66098376, 74.84482499,
+                          76.72042976, 79.41008189, 84.36505928, 86.18940575, 89.73252148])
+        ref_y = np.array([ 26.37956616,  23.38287778, 100.        ,  33.07137738,
+                           15.34673083,  12.66836049,   9.22679448,  10.48823235,
+                           20.14637563,   5.0998731 ,   1.19833501,   4.41542523,
+                           25.28893637,  12.07839603,  11.17785816])
+        patterns = xrd_patterns([self.structure] * 3, two_theta_range=(0, 90), nproc=2)
+        self.assertEqual(len(patterns), 3)
+        for (x, y, plot_x, plot_y) in patterns:
+            self.assertGreater(self.threshold, np.sum(np.abs(x - ref_x)))
+            self.assertGreater(self.threshold, np.sum(np.abs(y - ref_y)))
+            self.assertEqual(plot_y.shape, (5000,))
+
+    def test_smearing(self):
+        x = np.array([10.0, 10.2, 50.0])
+        y = np.array([100.0, 20.0, 50.0])
+        (plot_x, plot_y) = gaussian_smearing(x, y, two_theta_range=(0, 90), sigma=0.1,
+                                             nsample=901)
+        dense = np.sum(np.exp(-(plot_x[None, :] - x[:, None])**2 / (2 * 0.1**2)) * y[:, None],
+                       axis=0)
+        self.assertTrue(np.allclose(plot_y, dense, atol=1e-15))
+
     def test_write_file(self):
         fig_name = 'XRD.png'
         peak_raw_fname = 'XRD_peak.txt'
@@ -157,6 +184,42 @@ class TestStructureDeduplicate(unittest.TestCase):
                      'poscars_POSCAR_22487']
         self.assertEqual(flist_ref, flist)
 
+    def test_clusters(self):
+        _, flist = structure_dedup(self.structures, self.fnames)
+        clusters = dedup_clusters(self.structures, spacegroup=False,
+                                  fingerprint_tol=None, nproc=2)
+        self.assertEqual([self.fnames[c[0]] for c in clusters], flist)
+        self.assertEqual(sorted(sum(clusters, [])), list(range(len(self.structures))))
+        # the defaults are lossless, the same clusters in serial
+        self.assertEqual(dedup_clusters(self.structures, nproc=1), clusters)
+        # the lossy windows only remove comparisons, never add a match
+        fast = dedup_clusters(self.structures, spacegroup=True,
+                              fingerprint_tol=FINGERPRINT_TOL, nproc=1)
+        self.assertGreaterEqual(len(fast), len(clusters))
+        self.assertEqual(sorted(sum(fast, [])), list(range(len(self.structures))))
+
+    def test_fast(self):
+        st = self.structures[0]
+        supercell = st.copy()
+        supercell.make_supercell([2, 1, 1])
+        supercell.scale_lattice(st.volume * 2.5)
+        slist, flist, clusters = structure_dedup([st, supercell], ['a', 'b'],
+                                                 fast=True, return_clusters=True)
+        self.assertEqual(clusters, [[0, 1]])
+        self.assertEqual(flist, ['a'])
+        self.assertEqual(len(slist), 1)
+        _, flist, clusters = structure_dedup(self.structures, self.fnames,
+                                             return_clusters=True)
+        self.assertEqual([self.fnames[c[0]] for c in clusters], flist)
+
+    def test_fingerprint(self):
+        st = self.structures[0]
+        fprint = distance_fingerprint(st)
+        supercell = st.copy()
+        supercell.make_supercell([2, 1, 1])
+        supercell.scale_lattice(st.volume * 2.5)
+        self.assertTrue(np.allclose(distance_fingerprint(supercell), fprint))
+
 
 class TestVolumePrediction(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,54 @@
+import sys
+import os
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'core'
+from .context import setUpModule
+from .context import planar_average
+from .context import miller_planar_average
+from .context import macroscopic_average
+from .context import grid_average
+
+
+class TestPlanarAverage(unittest.TestCase):
+    def setUp(self):
+        self.data = np.random.RandomState(2020).normal(size=(6, 7, 8))
+        self.lattice = np.diag([3.0, 4.0, 10.0])
+
+    def test_axis(self):
+        ref = self.data.mean(axis=(0, 1))
+        self.assertTrue(np.allclose(planar_average(self.data, 2), ref))
+        distance, average = miller_planar_average(self.data, self.lattice, (0, 0, 1))
+        self.assertTrue(np.allclose(average, ref))
+        self.assertTrue(np.allclose(distance, np.arange(8) * 10.0 / 8))
+
+    def test_general_path(self):
+        # (0 0 -1) goes through the binning path and must agree with z
+        ref = self.data.mean(axis=(0, 1))[(-np.arange(8)) % 8]
+        _, average = miller_planar_average(self.data, self.lattice, (0, 0, -1))
+        self.assertTrue(np.allclose(average, ref))
+        distance, average = miller_planar_average(self.data, self.lattice, (1, 1, 0))
+        self.assertAlmostEqual(distance[1] * len(distance), 2.4)
+        _, average = miller_planar_average(np.ones((6, 7, 8)), self.lattice, (1, 1, 0))
+        self.assertTrue(np.allclose(average, 1.0))
+
+
+class TestMacroscopicAverage(unittest.TestCase):
+    def test_periodic(self):
+        length = 10.0
+        z = np.arange(200) * length / 200
+        profile = np.sin(2 * np.pi * z / 2.5) + 3.0
+        ret = macroscopic_average(profile, length, [2.5])
+        self.assertTrue(np.allclose(ret, 3.0))
+
+    def test_columns(self):
+        data = np.random.RandomState(2020).normal(size=(6, 7, 8))
+        ret = grid_average(data, np.diag([3.0, 4.0, 10.0]), widths=[2.0], scale=0.5)
+        self.assertEqual(ret.shape, (8, 3))
+        self.assertTrue(np.allclose(ret[:, 1], 0.5 * data.mean(axis=(0, 1))))
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,65 @@
+import sys
+import os
+import unittest
+import numpy as np
+from scipy.spatial.distance import cdist
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'core'
+from .context import setUpModule
+from .context import Trajectory
+from .context import radial_fingerprint
+from .context import angular_fingerprint
+from .context import structure_fingerprints
+from .context import fingerprint_distances
+from .context import close_pairs
+
+
+class TestFingerprint(unittest.TestCase):
+    def setUp(self):
+        traj = Trajectory.from_xdatcar('test_rdf_XDATCAR.txt', stop=4)
+        self.structures = [traj.get_structure(i) for i in range(len(traj))]
+
+    def test_supercell(self):
+        st = self.structures[0]
+        supercell = st.copy()
+        supercell.make_supercell([2, 1, 1])
+        (fps, elements) = structure_fingerprints([st, supercell], nproc=1)
+        self.assertEqual(elements, ['Se', 'V'])
+        self.assertEqual(fps.shape, (2, 3 * 60 + 18))
+        self.assertTrue(np.allclose(fps[0], fps[1]))
+
+    def test_blocks(self):
+        st = self.structures[0]
+        fp = radial_fingerprint(st, ['Se', 'V', 'O'], rcut=6.0, nbins=30)
+        self.assertEqual(fp.shape, (6 * 30,))
+        # blocks of a missing element are empty
+        self.assertTrue(np.all(fp.reshape(6, 30)[[2, 4, 5]] == 0))
+        self.assertAlmostEqual(np.sum(angular_fingerprint(st)), 1.0)
+
+    def test_parallel(self):
+        (serial, _) = structure_fingerprints(self.structures, nproc=1)
+        (parallel, _) = structure_fingerprints(self.structures, nproc=2)
+        self.assertTrue(np.allclose(serial, parallel))
+
+
+class TestFingerprintDistances(unittest.TestCase):
+    def setUp(self):
+        self.fps = np.random.RandomState(0).rand(37, 11)
+
+    def test_blocked(self):
+        fps = self.fps
+        dist = fingerprint_distances(fps, block_size=8)
+        self.assertTrue(np.allclose(dist, cdist(fps, fps, 'cosine') / 2, atol=1e-6))
+        dist = fingerprint_distances(fps, fps[:5], metric='euclidean', block_size=8)
+        self.assertTrue(np.allclose(dist, cdist(fps, fps[:5]), atol=1e-6))
+
+    def test_close_pairs(self):
+        dist = cdist(self.fps, self.fps, 'cosine') / 2
+        ref = [(i, j) for (i, j) in zip(*np.nonzero(dist <= 0.05)) if i < j]
+        pairs = close_pairs(self.fps, 0.05, block_size=8)
+        self.assertEqual([(i, j) for (i, j, _) in pairs], ref)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import sys
+import os
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'core'
+from .context import setUpModule
+from .context import optical_spectra
+from .context import kramers_kronig
+from .context import kramers_kronig_error
+from .context import spectra_table
+
+
+def lorentz(energy, strength=20.0, e0=3.0, gamma=0.5):
+    eps = 1 + strength / (e0**2 - energy**2 - 1j * gamma * energy)
+    real = np.zeros((len(energy), 6))
+    imag = np.zeros((len(energy), 6))
+    real[:, :3] = eps.real[:, None]
+    imag[:, :3] = eps.imag[:, None]
+    return real, imag
+
+
+class TestOpticalSpectra(unittest.TestCase):
+    def setUp(self):
+        self.energy = np.linspace(0, 60, 3001)
+        self.real, self.imag = lorentz(self.energy)
+
+    def test_spectra(self):
+        spectra = optical_spectra(self.energy, self.real, self.imag)
+        n = spectra['refractive']
+        k = spectra['extinction']
+        eps = (n + 1j * k)**2
+        self.assertTrue(np.allclose(eps.real[:, :3], self.real[:, :3]))
+        self.assertTrue(np.allclose(eps.imag[:, :3], self.imag[:, :3]))
+        self.assertTrue(np.all(spectra['reflectivity'][:, :3] >= 0))
+        self.assertTrue(np.all(spectra['reflectivity'][:, :3] < 1))
+        self.assertTrue(np.allclose(spectra['energy_loss'][:, 3:], 0))
+        self.assertTrue(np.allclose(spectra['absorption'][0], 0))
+
+    def test_table(self):
+        spectra = optical_spectra(self.energy, self.real, self.imag)
+        data, labels = spectra_table(self.energy, spectra)
+        self.assertEqual(data.shape, (3001, 31))
+        self.assertEqual(len(labels), 31)
+        self.assertEqual(labels[1], 'absorption_xx')
+        self.assertTrue(np.all(data[:, 7] == spectra['refractive'][:, 0]))
+
+    def test_kramers_kronig(self):
+        offset = np.array([1.0, 1.0, 1.0, 0.0, 0.0, 0.0])
+        real = kramers_kronig(self.energy, self.imag, offset)
+        self.assertTrue(np.allclose(real[:1000], self.real[:1000], atol=1e-4))
+        error = kramers_kronig_error(self.energy, self.real, self.imag)
+        self.assertTrue(np.all(error < 1e-4))
+        error = kramers_kronig_error(self.energy, 2 * self.real, self.imag)
+        self.assertTrue(np.all(error[:3] > 0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'core'
+from .context import setUpModule
+from .context import Trajectory
+from .context import FingerprintIndex
+from .context import fingerprint_distances
+
+
+class TestFingerprintIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        centers = rng.normal(size=(50, 40))
+        self.fps = centers[rng.randint(0, 50, 2000)] + 0.3 * rng.normal(size=(2000, 40))
+        self.names = [str(i) for i in range(2000)]
+        self.queries = self.fps[rng.randint(0, 2000, 20)] + 0.1 * rng.normal(size=(20, 40))
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _reference(self, k):
+        dist = fingerprint_distances(self.queries, self.fps)
+        return [[self.names[i] for i in np.argsort(row, kind='stable')[:k]] for row in dist]
+
+    def test_query(self):
+        index = FingerprintIndex()
+        # incremental, the last entries are not in the tree
+        for (start, stop) in [(0, 1000), (1000, 1850), (1850, 2000)]:
+            index.add(self.fps[start:stop], self.names[start:stop])
+        self.assertEqual(len(index), 2000)
+        self.assertLess(index.nbuilt, 2000)
+        (dists, names) = index.query(self.queries, k=5)
+        self.assertEqual(dists.shape, (20, 5))
+        self.assertTrue(np.all(np.diff(dists, axis=1) >= 0))
+        self.assertEqual(names, self._reference(5))
+        (_, names) = index.query(self.queries, k=5, exact=True)
+        self.assertEqual(names, self._reference(5))
+
+    def test_save_load(self):
+        index = FingerprintIndex()
+        index.add(self.fps[:1500], self.names[:1500])
+        index.save(self.path)
+        index = FingerprintIndex.load(self.path)
+        index.add(self.fps[1500:], self.names[1500:])
+        index.save(self.path)
+        index = FingerprintIndex.load(self.path)
+        self.assertEqual(len(index), 2000)
+        (_, names) = index.query(self.queries, k=3)
+        self.assertEqual(names, self._reference(3))
+
+    def test_stale_projection(self):
+        index = FingerprintIndex()
+        index.add(self.fps, self.names)
+        index.save(self.path)
+        self.assertTrue(os.path.isfile(os.path.join(self.path, 'projection.npy')))
+        # too few entries to build a tree
+        index = FingerprintIndex()
+        index.add(self.fps[:10, :20], self.names[:10])
+        self.assertIsNone(index.tree)
+        index.save(self.path)
+        self.assertFalse(os.path.isfile(os.path.join(self.path, 'projection.npy')))
+        index = FingerprintIndex.load(self.path)
+        self.assertEqual(index.mean.shape, (20,))
+        (_, names) = index.query(self.fps[:1, :20], k=1)
+        self.assertEqual(names, [['0']])
+
+    def test_structures(self):
+        traj = Trajectory.from_xdatcar('test_rdf_XDATCAR.txt', stop=5)
+        structures = [traj.get_structure(i) for i in range(len(traj))]
+        index = FingerprintIndex({'rcut': 5.0})
+        index.add_structures(structures, ['frame%d' % i for i in range(len(traj))], nproc=1)
+        self.assertEqual(index.params['elements'], ['Se', 'V'])
+        index.save(self.path)
+        (dists, names) = FingerprintIndex.load(self.path).query_structures(structures[2:3],
+                                                                            k=2, nproc=1)
+        self.assertEqual(names[0][0], 'frame2')
+        self.assertAlmostEqual(dists[0, 0], 0, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
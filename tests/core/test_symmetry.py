@@ -0,0 +1,58 @@
+import sys
+import os
+import unittest
+import zipfile
+import shutil
+from glob import glob
+import numpy as np
+from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+from pymatgen.analysis.structure_matcher import StructureMatcher
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'core'
+from .context import setUpModule
+from .context import read_structures_from_files
+from .context import batch_symmetry
+from .context import batch_symmetry_files
+from .context import format_symmetry_table
+
+
+class TestBatchSymmetry(unittest.TestCase):
+    def setUp(self):
+        with zipfile.ZipFile('poscars.zip', 'r') as zip_ref:
+            zip_ref.extractall(".")
+        self.files = sorted(glob('poscars/POSCAR*'))[:8]
+        self.structures, self.fnames = read_structures_from_files(self.files)
+
+    def tearDown(self):
+        shutil.rmtree('poscars')
+
+    def test_correctness(self):
+        results = batch_symmetry(self.structures, self.fnames, nproc=1)
+        sm = StructureMatcher(primitive_cell=False, scale=False)
+        for (st, data) in zip(self.structures, results):
+            sa = SpacegroupAnalyzer(st)
+            self.assertEqual(data.status, 'ok')
+            self.assertEqual(data.number, sa.get_space_group_number())
+            self.assertEqual(data.hall, sa.get_hall())
+            self.assertEqual(data.lattice_type, sa.get_lattice_type())
+            prim = sa.find_primitive()
+            self.assertEqual(len(data.primitive), len(prim))
+            self.assertAlmostEqual(data.primitive.volume, prim.volume, places=4)
+            self.assertTrue(sm.fit(data.primitive, prim))
+            conv = sa.get_conventional_standard_structure()
+            self.assertEqual(len(data.conventional), len(conv))
+            self.assertTrue(np.allclose(data.conventional.lattice.abc, conv.lattice.abc))
+            self.assertTrue(sm.fit(data.conventional, conv))
+
+    def test_files(self):
+        serial = batch_symmetry(self.structures, self.fnames, cells=False, nproc=1)
+        results = batch_symmetry_files(self.files + ['no_such_file.cif'], nproc=2)
+        self.assertEqual([x.number for x in results[:-1]], [x.number for x in serial])
+        self.assertEqual(results[-1].status, 'failed')
+        table = format_symmetry_table(results)
+        self.assertEqual(len(table.splitlines()), len(results) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
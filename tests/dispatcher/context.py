@@ -6,8 +6,15 @@ from maptool.dispatcher.LocalContext import LocalSession
 from maptool.dispatcher.LocalContext import LocalContext
 from maptool.dispatcher.LazyLocalContext import LazyLocalContext
 from maptool.dispatcher.SSHContext import SSHSession
+from maptool.dispatcher.SSHContext import SSHSessionPool
 from maptool.dispatcher.SSHContext import SSHContext
 from maptool.dispatcher.Dispatcher import _split_tasks
+from maptool.dispatcher.Dispatcher import Dispatcher
+from maptool.dispatcher.Dispatcher import JobRecord
+from maptool.dispatcher.JobStatus import JobStatus
+from maptool.dispatcher.PBS import PBS
+from maptool.dispatcher.PBS import PBSStatusProvider
+from maptool.dispatcher.PBS import parse_qstat
 
 from maptool.dispatcher.LocalContext import _identical_files
 
@@ -153,6 +153,13 @@ class TestLazyLocalContext(unittest.TestCase):
         self.assertTrue(self.job.check_file_exists('aaa'))
         tmp1 = self.job.read_file('aaa')
         self.assertEqual(tmp, tmp1)
+
+    def test_files(self) :
+        self.job = LazyLocalContext('loc', None)
+        tmp = str(uuid.uuid4())
+        self.job.write_file('aaa', tmp)
+        self.assertEqual(self.job.check_files_exist(['aaa', 'bbb']), [True, False])
+        self.assertEqual(self.job.read_files(['aaa', 'bbb']), [tmp, None])
         
 
     def test_call(self) :
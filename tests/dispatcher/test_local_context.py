@@ -341,6 +341,14 @@ class TestLocalContext(unittest.TestCase):
         self.assertTrue(self.job.check_file_exists('aaa'))
         tmp1 = self.job.read_file('aaa')
         self.assertEqual(tmp, tmp1)
+
+    def test_files(self) :
+        work_profile = LocalSession({'work_path':'rmt'})
+        self.job = LocalContext('loc', work_profile)
+        tmp = str(uuid.uuid4())
+        self.job.write_file('aaa', tmp)
+        self.assertEqual(self.job.check_files_exist(['aaa', 'bbb']), [True, False])
+        self.assertEqual(self.job.read_files(['aaa', 'bbb']), [tmp, None])
         
 
     def test_call(self) :
@@ -0,0 +1,100 @@
+import os,sys,json,shutil,threading,time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'dispatcher'
+from .context import Dispatcher
+from .context import JobRecord
+from .context import JobStatus
+from .context import setUpModule
+
+
+class FakeContext(object):
+    def __init__(self, job_uuid, log):
+        self.job_uuid = job_uuid
+        self.log = log
+
+    def download(self, job_dirs, files, check_exists = False, mark_failure = True):
+        self.log.append(('download', self.job_uuid, time.time()))
+
+    def clean(self):
+        pass
+
+
+class FakeBatch(object):
+    """
+    returns the statuses in order, the last one repeated
+    """
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def __init__(self, statuses, log):
+        self.statuses = list(statuses)
+        self.log = log
+        self.job_id = None
+
+    def check_status(self):
+        with FakeBatch.lock:
+            FakeBatch.active += 1
+            FakeBatch.max_active = max(FakeBatch.max_active, FakeBatch.active)
+        time.sleep(0.01)
+        with FakeBatch.lock:
+            FakeBatch.active -= 1
+        status = self.statuses[0]
+        if len(self.statuses) > 1:
+            self.statuses.pop(0)
+        return status
+
+    def submit(self, job_dirs, cmd, res = None, outlog = 'log', errlog = 'err', restart = False):
+        self.log.append(('submit', job_dirs, time.time()))
+
+
+class TestMonitor(unittest.TestCase):
+    def setUp(self):
+        os.makedirs('monitor', exist_ok = True)
+        FakeBatch.active = 0
+        FakeBatch.max_active = 0
+        self.disp = Dispatcher({'work_path': 'monitor'}, context_type = 'local', batch_type = 'shell')
+        self.log = []
+
+    def tearDown(self):
+        shutil.rmtree('monitor')
+
+    def _handler(self, statuses):
+        task_chunks = [['task%d' % ii] for ii in range(len(statuses))]
+        job_list = [{'context': FakeContext('job%d' % ii, self.log),
+                     'batch': FakeBatch(ss, self.log)} for ii, ss in enumerate(statuses)]
+        return {'task_chunks': task_chunks,
+                'job_list': job_list,
+                'job_record': JobRecord('monitor', task_chunks, fname = 'jr.json'),
+                'command': 'true',
+                'resources': None,
+                'outlog': 'log',
+                'errlog': 'err',
+                'backward_task_files': []}
+
+    def test_finish(self):
+        r, f, t = JobStatus.running, JobStatus.finished, JobStatus.terminated
+        statuses = [[f]] + [[r] * 3 + [f]] * 30 + [[t, r, f]]
+        handler = self._handler(statuses)
+        start = time.time()
+        self.disp.monitor_jobs(handler, max_concurrency = 4, min_interval = 0.02, max_interval = 0.05)
+        self.assertTrue(handler['job_record'].check_all_finished())
+        with open(os.path.join('monitor', 'jr.json')) as fp:
+            record = json.load(fp)
+        self.assertTrue(all([record[ii]['finished'] for ii in record]))
+        downloads = [ii for ii in self.log if ii[0] == 'download']
+        self.assertEqual(sorted([ii[1] for ii in downloads]),
+                         sorted(['job%d' % ii for ii in range(len(statuses))]))
+        # the finished chunk is downloaded before the others
+        self.assertEqual(min(downloads, key = lambda x: x[2])[1], 'job0')
+        self.assertEqual([ii[1] for ii in self.log if ii[0] == 'submit'], [['task31']])
+        self.assertLessEqual(FakeBatch.max_active, 4)
+        self.assertLess(time.time() - start, 5)
+
+    def test_failure(self):
+        handler = self._handler([[JobStatus.finished], [JobStatus.terminated]])
+        with self.assertRaises(RuntimeError):
+            self.disp.monitor_jobs(handler, min_interval = 0.01, max_interval = 0.01)
+        self.assertEqual(len([ii for ii in self.log if ii[0] == 'submit']), 3)
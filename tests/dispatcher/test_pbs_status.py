@@ -0,0 +1,125 @@
+import os,sys,io
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'dispatcher'
+from .context import PBS
+from .context import PBSStatusProvider
+from .context import parse_qstat
+from .context import JobStatus
+from .context import setUpModule
+
+QSTAT_TEXT = """Job Id: 101.pbs01
+    Job_Name = run.sub
+    job_state = R
+    queue = batch
+
+Job Id: 102.pbs01
+    Job_Name = run.sub
+    job_state = Q
+
+Job Id: 103.pbs01
+    job_state = F
+"""
+
+QSTAT_XML = """<?xml version="1.0"?>
+<Data><Job><Job_Id>201.torque.local</Job_Id><job_state>C</job_state></Job>
+<Job><Job_Id>202.torque.local</Job_Id><Job_Name>run.sub</Job_Name><job_state>H</job_state></Job></Data>
+"""
+
+
+class FakeContext(object):
+    def __init__(self, qstat, files = (), ret = 0, err = ''):
+        self.qstat = qstat
+        self.files = dict(files)
+        self.calls = []
+        self.ret = ret
+        self.err = err
+        self.job_uuid = 'uuid'
+
+    def block_call(self, cmd):
+        self.calls.append(cmd)
+        return self.ret, None, io.BytesIO(self.qstat.encode('utf-8')), io.BytesIO(self.err.encode('utf-8'))
+
+    def check_file_exists(self, fname):
+        self.calls.append('stat ' + fname)
+        return fname in self.files
+
+    def read_files(self, fnames):
+        self.calls.append('read ' + ' '.join(fnames))
+        return [self.files.get(ii) for ii in fnames]
+
+
+class TestParseQstat(unittest.TestCase):
+    def test_text(self):
+        self.assertEqual(parse_qstat(QSTAT_TEXT), {'101': 'R', '102': 'Q', '103': 'F'})
+
+    def test_xml(self):
+        self.assertEqual(parse_qstat(QSTAT_XML), {'201': 'C', '202': 'H'})
+        # one document per job
+        self.assertEqual(parse_qstat(QSTAT_XML + QSTAT_XML.replace('20', '30')),
+                         {'201': 'C', '202': 'H', '301': 'C', '302': 'H'})
+
+    def test_large(self):
+        job = ("Job Id: %d.pbs01\n    Job_Name = run.sub\n    job_state = %s\n"
+               + "    Variable_List = " + "PATH=/usr/bin," * 40 + "\n\n")
+        text = "".join([job % (ii, 'RQ'[ii % 2]) for ii in range(5000)])
+        self.assertGreater(len(text), 2 * 1024**2)
+        states = parse_qstat(text)
+        self.assertEqual(len(states), 5000)
+        self.assertEqual((states['0'], states['4999']), ('R', 'Q'))
+
+
+class TestStatusProvider(unittest.TestCase):
+    def test_one_query(self):
+        ctx = FakeContext(QSTAT_TEXT, {'tag_finished': ''})
+        provider = PBSStatusProvider(ttl = 100)
+        # added up front by the dispatcher
+        provider.add_jobs(['101.pbs01', '102.pbs01', '103.pbs01', '104.pbs01'])
+        batches = []
+        for job_id in ['101.pbs01', '102.pbs01', '103.pbs01', '104.pbs01']:
+            batch = PBS(ctx, status_provider = provider)
+            batch.job_id = job_id
+            batches.append(batch)
+        status = [batch.check_status() for batch in batches]
+        self.assertEqual(status, [JobStatus.running, JobStatus.waiting,
+                                  JobStatus.finished, JobStatus.finished])
+        self.assertEqual([ii for ii in ctx.calls if ii.startswith('qstat')],
+                         ['qstat -f -x 101.pbs01 102.pbs01 103.pbs01 104.pbs01'])
+        # only the finished jobs check the tag, no job id is read
+        self.assertEqual(len([ii for ii in ctx.calls if ii.startswith('stat')]), 2)
+        self.assertEqual(len([ii for ii in ctx.calls if ii.startswith('read')]), 0)
+        provider.invalidate()
+        batches[0].check_status()
+        # the job no longer known is not asked again
+        self.assertEqual([ii for ii in ctx.calls if ii.startswith('qstat')][-1],
+                         'qstat -f -x 101.pbs01 102.pbs01 103.pbs01')
+        self.assertEqual(batches[3].check_status(), JobStatus.finished)
+        self.assertEqual(len([ii for ii in ctx.calls if ii.startswith('qstat')]), 2)
+
+    def test_unknown_job(self):
+        ctx = FakeContext(QSTAT_TEXT, ret = 153,
+                          err = 'qstat: Unknown Job Id Error 104.pbs01\n')
+        provider = PBSStatusProvider()
+        provider.add_jobs(['101.pbs01', '104.pbs01'])
+        self.assertEqual(provider.job_state('101.pbs01', ctx), 'R')
+        self.assertIsNone(provider.job_state('104.pbs01', ctx))
+        self.assertEqual(len(ctx.calls), 1)
+        ctx.err = 'qstat: cannot connect to server\n'
+        provider.invalidate()
+        with self.assertRaises(RuntimeError):
+            provider.job_state('101.pbs01', ctx)
+
+    def test_terminated(self):
+        ctx = FakeContext(QSTAT_XML, {'job_id': '201.torque'})
+        batch = PBS(ctx, status_provider = PBSStatusProvider())
+        self.assertEqual(batch.check_status(), JobStatus.terminated)
+        self.assertEqual(batch.job_id, '201.torque')
+        # the job id is read without checking the file first
+        self.assertEqual(ctx.calls[0], 'read job_id')
+        batch = PBS(FakeContext(QSTAT_XML), status_provider = PBSStatusProvider())
+        self.assertEqual(batch.check_status(), JobStatus.unsubmitted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ from pathlib import Path
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 __package__ = 'dispatcher'
-from .context import SSHContext, SSHSession
+from .context import SSHContext, SSHSession, SSHSessionPool
 from .context import setUpModule
 
 class TestSSHContext(unittest.TestCase):
@@ -228,4 +228,66 @@ class TestSSHContext(unittest.TestCase):
         tmp1 = self.job.read_file('aaa')
         self.assertEqual(tmp, tmp1)
 
+    def test_files(self) :
+        tmp = str(uuid.uuid4())
+        self.job.write_file('aaa', tmp)
+        self.job.write_file('b b', '')
+        self.assertEqual(self.job.check_files_exist(['aaa', 'bbb', 'b b']),
+                         [True, False, True])
+        self.assertEqual(self.job.read_files(['aaa', 'bbb', 'b b', 'aaa']),
+                         [tmp, None, '', tmp])
+        self.assertEqual(self.job.read_files([]), [])
+
+    def test_sftp_reuse(self) :
+        self.job.write_file('aaa', 'x')
+        with self.ssh_session.sftp_client() as sftp :
+            pass
+        self.job.read_file('aaa')
+        self.job1.check_file_exists('aaa')
+        with self.ssh_session.sftp_client() as sftp1 :
+            self.assertIs(sftp1, sftp)
+            # a transfer in progress does not block the others or the commands
+            with self.ssh_session.sftp_client() as sftp2 :
+                self.assertIsNot(sftp2, sftp)
+            self.assertTrue(self.job.check_file_exists('aaa'))
+            self.assertEqual(self.job.read_files(['aaa']), ['x'])
+        self.assertEqual(len(self.ssh_session.idle_sftp), 2)
+
+    def test_pool(self) :
+        profile = dict(self.ssh_session.remote_profile)
+        profile['transfer_concurrency'] = 2
+        pool = SSHSessionPool(profile)
+        jobs = [SSHContext('loc', pool) for ii in range(3)]
+        self.assertIsNot(jobs[0].ssh_session, jobs[1].ssh_session)
+        self.assertIs(jobs[0].ssh_session, jobs[2].ssh_session)
+        for job in jobs :
+            job.upload(['task0'], ['test0'])
+            with open(os.path.join('loc', 'task0', 'test0')) as fp:
+                locs = fp.read()
+            with open(os.path.join('rmt', job.job_uuid, 'task0', 'test0')) as fp:
+                rmts = fp.read()
+            self.assertEqual(locs, rmts)
+        pool.close()
 
+    def test_upload_shared(self) :
+        self.job.upload_shared(['.'], ['task0/test0', 'task1'])
+        store = os.path.join('rmt', '.store')
+        nstored = len(os.listdir(store))
+        self.assertEqual(nstored, 4)
+        job2 = SSHContext('loc', self.ssh_session)
+        job2.upload_shared(['.'], ['task0/test0', 'task1'])
+        self.assertEqual(len(os.listdir(store)), nstored)
+        for job in [self.job, job2] :
+            for fname in ['task0/test0', 'task1/test0', 'task1/test1', 'task1/dir0/test2'] :
+                with open(os.path.join('loc', fname)) as fp:
+                    locs = fp.read()
+                with open(os.path.join('rmt', job.job_uuid, fname)) as fp:
+                    rmts = fp.read()
+                self.assertEqual(locs, rmts)
+        self.assertTrue(os.path.samefile(os.path.join('rmt', self.job.job_uuid, 'task0/test0'),
+                                         os.path.join('rmt', job2.job_uuid, 'task0/test0')))
+        # the store is filled again once the session forgets it
+        self.ssh_session.stored.clear()
+        shutil.rmtree(store)
+        job2.upload_shared(['task0'], ['test0'])
+        self.assertEqual(len(os.listdir(store)), 1)
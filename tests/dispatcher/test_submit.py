@@ -0,0 +1,96 @@
+import os,sys,json,shutil,threading,time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'dispatcher'
+from .context import Dispatcher
+from .context import LocalContext
+from .context import JobStatus
+from .context import setUpModule
+
+
+class SlowContext(LocalContext):
+    """
+    local context counting the uploads in flight
+    """
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def upload(self, job_dirs, local_up_files, dereference = True):
+        with SlowContext.lock:
+            SlowContext.active += 1
+            SlowContext.max_active = max(SlowContext.max_active, SlowContext.active)
+        time.sleep(0.05)
+        with SlowContext.lock:
+            SlowContext.active -= 1
+        LocalContext.upload(self, job_dirs, local_up_files, dereference = dereference)
+
+
+class FakeBatch(object):
+    submitted = []
+
+    def __init__(self, context, uuid_names = False, status_provider = None):
+        self.context = context
+        self.job_id = None
+
+    @classmethod
+    def make_status_provider(cls, remote_profile = None):
+        return None
+
+    def submit(self, job_dirs, cmd, res = None, outlog = 'log', errlog = 'err', restart = False):
+        if self.job_id is None:
+            self.job_id = 'id_' + job_dirs[0]
+            FakeBatch.submitted.append((job_dirs, restart))
+
+
+class TestSubmit(unittest.TestCase):
+    def setUp(self):
+        self.tasks = ['task%d' % ii for ii in range(12)]
+        for ii in self.tasks:
+            os.makedirs(os.path.join('submit', ii), exist_ok = True)
+            with open(os.path.join('submit', ii, 'POSCAR'), 'w') as fp:
+                fp.write(ii)
+        os.makedirs('submit_rmt', exist_ok = True)
+        SlowContext.active = 0
+        SlowContext.max_active = 0
+        FakeBatch.submitted = []
+        self.disp = Dispatcher({'work_path': 'submit_rmt', 'transfer_concurrency': 4},
+                               context_type = 'local', batch_type = 'shell', job_record = 'jr.json')
+        self.disp.context = SlowContext
+        self.disp.batch = FakeBatch
+
+    def tearDown(self):
+        shutil.rmtree('submit')
+        shutil.rmtree('submit_rmt')
+
+    def test_parallel(self):
+        handler = self.disp.submit_jobs(None, 'true', 'submit', self.tasks, 1,
+                                        [], ['POSCAR'], [])
+        self.assertTrue(1 < SlowContext.max_active <= 4)
+        # the chunks keep their order
+        self.assertEqual([ii['batch'].job_id for ii in handler['job_list']],
+                         ['id_' + ii[0] for ii in handler['task_chunks']])
+        for ii in handler['job_list']:
+            with open(os.path.join(ii['context'].remote_root, ii['batch'].job_id[3:], 'POSCAR')) as fp:
+                self.assertEqual(fp.read(), ii['batch'].job_id[3:])
+        with open(os.path.join('submit', 'jr.json')) as fp:
+            record = json.load(fp)
+        self.assertEqual(sorted([record[ii]['job_id'] for ii in record]),
+                         sorted(['id_' + ii for ii in self.tasks]))
+        # the restart recovers the uuids and the job ids
+        handler1 = self.disp.submit_jobs(None, 'true', 'submit', self.tasks, 1,
+                                         [], ['POSCAR'], [])
+        self.assertEqual([ii['context'].job_uuid for ii in handler1['job_list']],
+                         [ii['context'].job_uuid for ii in handler['job_list']])
+        self.assertEqual(len(FakeBatch.submitted), len(self.tasks))
+        self.assertFalse(any([ii[1] for ii in FakeBatch.submitted]))
+
+    def test_wait_time(self):
+        self.disp.submit_jobs({'submit_wait_time': 0.01}, 'true', 'submit', self.tasks[:4], 1,
+                              [], ['POSCAR'], [])
+        self.assertEqual(SlowContext.max_active, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
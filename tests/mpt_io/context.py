@@ -7,6 +7,8 @@ from maptool.io.read_structure import   ( ase2pmg, pmg2ase,
 from maptool.core.selection import (parse_range,
                                     parse_index,
                                     parse_label,
-                                    parse_sphere)
+                                    parse_sphere,
+                                    element_groups,
+                                    layer_groups)
 def setUpModule():
     os.chdir(os.path.abspath(os.path.dirname(__file__)))
@@ -7,6 +7,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 __package__ = 'mpt_io'
 from .context import setUpModule
 from .context import parse_range,parse_index,parse_label,parse_sphere
+from .context import element_groups,layer_groups
 
 class Compare:
     def test_length(self):
@@ -57,6 +58,29 @@ class TestLabel(unittest.TestCase,Compare):
         self.system_2 =[3,4,5]
     def tearDown(self):
         pass
+class TestElementGroups(unittest.TestCase,Compare):
+    def setUp(self):
+        st=Structure.from_file("POSCAR")
+        self.system_1 = element_groups(st)
+        self.system_2 =(['Ta','O','Mn'],[[0],[1,2],[3,4,5]])
+    def tearDown(self):
+        pass
+
+class TestLayerGroups1(unittest.TestCase,Compare):
+    def setUp(self):
+        st=Structure.from_file("POSCAR")
+        self.system_1 = layer_groups(st,axis=2,tol=0.5)[1]
+        self.system_2 =[[2],[1],[4],[3],[0,5]]
+    def tearDown(self):
+        pass
+
+class TestLayerGroups2(unittest.TestCase,Compare):
+    def setUp(self):
+        st=Structure.from_file("POSCAR")
+        self.system_1 = layer_groups(st,axis=0,tol=1.0)[1]
+        self.system_2 =[[0,2,3],[4],[5],[1]]
+    def tearDown(self):
+        pass
 
 if __name__ == '__main__':
    unittest.main()
@@ -0,0 +1,21 @@
+import sys,os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from maptool.code.vasp.volumetric import (fortran_float,
+                                          format_grid_lines,
+                                          write_grid,
+                                          read_volumetric,
+                                          load_volumetric,
+                                          clear_cache,
+                                          clean_cache,
+                                          parse_linear_expression,
+                                          combine_volumetric)
+from maptool.code.vasp.vasprun import LazyVasprun, sum_pdos
+from maptool.code.vasp.procar import ProcarData
+from maptool.code.vasp.output_cache import (read_output_cache,
+                                            write_output_cache,
+                                            load_vasprun,
+                                            load_procar)
+from maptool.code.vasp.batch import run_batch, format_summary, diffusion_arrhenius
+from maptool.code.vasp.trajectory import Trajectory, read_trajectory
+def setUpModule():
+    os.chdir(os.path.abspath(os.path.dirname(__file__)))
@@ -0,0 +1,70 @@
+import os,sys
+import shutil
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'vasp'
+from .context import setUpModule
+from .context import run_batch, format_summary, diffusion_arrhenius
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.dirs = ['batch_test_1', 'batch_test_2']
+        for path in self.dirs:
+            os.mkdir(path)
+        shutil.copy('vasprun.xml', self.dirs[0])
+
+    def tearDown(self):
+        for path in self.dirs:
+            shutil.rmtree(path)
+
+    def test_run(self):
+        results = run_batch('batch_test_*', analyses=['tdos', 'pdos'], nproc=1,
+                            pdos_groups='1; 2', use_cache=False)
+        self.assertEqual([ii['directory'] for ii in results], self.dirs)
+        self.assertEqual(results[0]['status'], 'ok')
+        self.assertAlmostEqual(results[0]['tdos:efermi'], 1.5)
+        self.assertEqual(results[0]['pdos:groups'], 2)
+        for fname in ['TDOS.dat', 'IDOS.dat', 'PDOS_G1_Up.dat', 'PDOS_G2_Down.dat']:
+            self.assertTrue(os.path.isfile(os.path.join(self.dirs[0], fname)))
+        data = np.loadtxt(os.path.join(self.dirs[0], 'TDOS.dat'))
+        self.assertEqual(data.shape, (4, 3))
+        # the missing vasprun.xml is reported, not raised
+        self.assertEqual(results[1]['status'], 'failed')
+        self.assertIn('tdos', results[1]['error'])
+        lines = format_summary(results).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('tdos:efermi', lines[0])
+
+    def test_optics(self):
+        results = run_batch(self.dirs[:1], analyses=['optics'], nproc=1, use_cache=False)
+        self.assertEqual(results[0]['status'], 'ok')
+        self.assertIn('optics:kk_error', results[0])
+        data = np.loadtxt(os.path.join(self.dirs[0], 'OPTICS.dat'))
+        self.assertEqual(data.shape, (6, 31))
+
+    def test_diffusion(self):
+        shutil.copy(os.path.join('..', 'core', 'test_rdf_XDATCAR.txt'),
+                    os.path.join(self.dirs[1], 'XDATCAR'))
+        results = run_batch(self.dirs[1:], analyses=['diffusion'], nproc=1, timestep=2.0,
+                            temperature=900.0, nblocks=2, use_cache=False)
+        self.assertEqual(results[0]['status'], 'ok')
+        self.assertEqual(results[0]['diffusion:T'], 900.0)
+        self.assertIn('diffusion:D_Se', results[0])
+        data = np.loadtxt(os.path.join(self.dirs[1], 'MSD.dat'))
+        self.assertEqual(data.shape, (51, 3))
+        self.assertAlmostEqual(data[-1, 0], 100.0)
+        # Arrhenius fit of two temperatures
+        results = [{'diffusion:T': 600.0, 'diffusion:D_Se': '1.0e-6'},
+                   {'diffusion:T': 900.0, 'diffusion:D_Se': '4.0e-6'}]
+        (ea, d0, error) = diffusion_arrhenius(results)['Se']
+        self.assertAlmostEqual(ea, np.log(4) * 8.617333e-5 / (1 / 600.0 - 1 / 900.0), places=3)
+
+    def test_unknown(self):
+        self.assertRaises(RuntimeError, run_batch, self.dirs, analyses=['xxx'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os,sys
+import shutil
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'vasp'
+from .context import setUpModule
+from .context import clear_cache
+from .context import read_output_cache, write_output_cache, load_vasprun
+
+
+class TestOutputCache(unittest.TestCase):
+    def setUp(self):
+        self.fname = 'vasprun_test.xml'
+        shutil.copy('vasprun.xml', self.fname)
+
+    def tearDown(self):
+        os.remove(self.fname)
+        clear_cache(self.fname)
+
+    def test_read_write(self):
+        self.assertIsNone(read_output_cache(self.fname, 'test'))
+        write_output_cache(self.fname, 'test', {'a': 1}, {'b': np.arange(3)})
+        data, arrays = read_output_cache(self.fname, 'test')
+        self.assertEqual(data, {'a': 1})
+        self.assertTrue(np.all(arrays['b'] == np.arange(3)))
+        self.assertIsNone(read_output_cache(self.fname, 'other'))
+        os.utime(self.fname, (0, 0))
+        self.assertIsNone(read_output_cache(self.fname, 'test'))
+
+    def test_vasprun(self):
+        vsr = load_vasprun(self.fname, parse_tdos=True)
+        self.assertTrue(os.path.isfile(self.fname + '.mpt/meta.json'))
+        cached = load_vasprun(self.fname, parse_tdos=True)
+        self.assertTrue(np.all(cached.tdos == vsr.tdos))
+        self.assertEqual(cached.atomic_symbols, vsr.atomic_symbols)
+        self.assertEqual(cached.parameters, vsr.parameters)
+        self.assertAlmostEqual(cached.efermi, vsr.efermi)
+        self.assertIsNone(cached.eigenvalues)
+
+        # missing sections are added to the cache, the projected DOS of
+        # some atoms is not cached
+        vsr = load_vasprun(self.fname, parse_eigen=True, parse_pdos=True, pdos_atoms=[1])
+        self.assertEqual(vsr.eigenvalues.shape, (2, 2, 3))
+        self.assertEqual(vsr.pdos.shape, (2, 1, 3, 4))
+        self.assertEqual(vsr.pdos_atoms, [1])
+        data, arrays = read_output_cache(self.fname, 'vasprun')
+        self.assertTrue(set(['tdos', 'eigenvalues']) <= set(data['sections']))
+        self.assertNotIn('pdos', data['sections'])
+        self.assertNotIn('pdos', arrays)
+
+        full = load_vasprun(self.fname, parse_pdos=True)
+        self.assertTrue(np.all(full.pdos[:, 1] == vsr.pdos[:, 0]))
+        cached = load_vasprun(self.fname, parse_pdos=True, pdos_atoms=[1])
+        self.assertTrue(np.all(cached.pdos == vsr.pdos))
+        self.assertEqual(cached.pdos_atoms, [1])
+        # only the arrays of the requested sections are opened
+        initial = load_vasprun(self.fname, final_structure=False)
+        self.assertIsNone(initial.pdos)
+        self.assertIsNone(initial.eigenvalues)
+        self.assertIsNone(initial.tdos)
+        self.assertIsNone(initial.final_structure)
+        self.assertAlmostEqual(initial.initial_structure.lattice.matrix[2][2], 5.0)
+        final = load_vasprun(self.fname)
+        self.assertAlmostEqual(final.final_structure.lattice.matrix[2][2], 5.02)
+        self.assertIsInstance(load_vasprun(self.fname, parse_tdos=True).tdos, np.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os,sys
+import shutil
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'vasp'
+from .context import setUpModule
+from .context import ProcarData
+from .context import clear_cache, load_procar
+
+
+class TestProcarData(unittest.TestCase):
+
+    def test_read(self):
+        procar = ProcarData('PROCAR')
+        self.assertTrue(procar.has_phase)
+        self.assertEqual(procar.data.shape, (2, 2, 3, 3, 9))
+        self.assertEqual(procar.data.dtype, np.float32)
+        self.assertEqual(procar.orbitals, ['s', 'py', 'pz', 'px', 'dxy', 'dyz',
+                                           'dz2', 'dxz', 'x2-y2'])
+        self.assertTrue(np.allclose(procar.data[0, 0, 0, 0, :3], [0.417, 0.720, 0.000]))
+        self.assertTrue(np.allclose(procar.data[1, 1, 2, 2, -2:], [0.234, 0.102]))
+        self.assertAlmostEqual(procar.eigenvalues[0, 0, 0], 0.15857017)
+        self.assertTrue(np.allclose(procar.kpoints[0], [-0.5, 0.0, 0.1]))
+        self.assertTrue(np.allclose(procar.weights, 0.12345678))
+        # the phase factors are skipped
+        self.assertTrue(np.all(procar.data >= 0))
+
+    def test_selected_ions(self):
+        full = ProcarData('PROCAR')
+        procar = ProcarData('PROCAR', ions=[2, 0])
+        self.assertEqual(procar.ions, [0, 2])
+        self.assertEqual(procar.nions, 2)
+        self.assertTrue(np.all(procar.data == full.data[:, :, :, [0, 2]]))
+
+
+class TestProcarCache(unittest.TestCase):
+    def setUp(self):
+        self.fname = 'PROCAR_test'
+        shutil.copy('PROCAR', self.fname)
+
+    def tearDown(self):
+        os.remove(self.fname)
+        clear_cache(self.fname)
+
+    def test_cache(self):
+        data, orbitals = load_procar(self.fname, ions=[1])
+        self.assertFalse(os.path.exists(self.fname + '.mpt'))
+        full, _ = load_procar(self.fname)
+        self.assertTrue(os.path.isfile(self.fname + '.mpt/meta.json'))
+        cached, cached_orbitals = load_procar(self.fname, ions=[1])
+        self.assertEqual(cached_orbitals, orbitals)
+        self.assertTrue(np.all(cached == data))
+        self.assertTrue(np.all(cached == full[:, :, :, [1]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os,sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'vasp'
+from .context import setUpModule
+from .context import Trajectory, read_trajectory
+
+XDATCAR = os.path.join('..', 'core', 'test_rdf_XDATCAR.txt')
+
+
+class TestXdatcar(unittest.TestCase):
+
+    def test_read(self):
+        traj = Trajectory.from_xdatcar(XDATCAR)
+        self.assertEqual(traj.positions.shape, (51, 108, 3))
+        self.assertEqual(traj.positions.dtype, np.float32)
+        self.assertTrue(traj.constant_cell)
+        self.assertEqual(traj.species[:72], ['Se'] * 72)
+        self.assertEqual(traj.species[72:], ['V'] * 36)
+        self.assertTrue(np.allclose(traj.positions[0, 0], [0.113059, 0.066369, 0.999734]))
+        self.assertTrue(np.allclose(traj.lattices[-1, 1], [-9.987214, 17.298363, 0.0]))
+        struct = traj.get_structure(0)
+        self.assertEqual(len(struct), 108)
+        self.assertTrue(np.allclose(traj.cartesian(0)[0], struct.cart_coords[0], atol=1e-4))
+
+    def test_slice(self):
+        full = Trajectory.from_xdatcar(XDATCAR)
+        traj = Trajectory.from_xdatcar(XDATCAR, start=3, stop=40, step=5)
+        self.assertEqual(traj.frames, list(range(3, 40, 5)))
+        self.assertTrue(np.all(traj.positions == full.positions[3:40:5]))
+        traj = read_trajectory(XDATCAR, start=-2)
+        self.assertEqual(traj.frames, [49, 50])
+        self.assertTrue(np.all(traj.positions == full.positions[-2:]))
+
+    def test_mmap(self):
+        fname = 'traj_test.npy'
+        traj = Trajectory.from_xdatcar(XDATCAR, step=10, mmap_file=fname)
+        self.assertIsInstance(traj.positions, np.memmap)
+        traj.positions.flush()
+        data = np.load(fname, mmap_mode='r')
+        self.assertEqual(data.shape, (6, 108, 3))
+        self.assertTrue(np.all(data == traj.positions))
+        del traj, data
+        os.remove(fname)
+
+    def test_variable_cell(self):
+        traj = Trajectory.from_xdatcar('XDATCAR_NPT', start=1)
+        self.assertFalse(traj.constant_cell)
+        self.assertEqual(traj.species, ['Si', 'O', 'O'])
+        self.assertEqual(traj.frames, [1, 2])
+        self.assertTrue(np.allclose(traj.lattices[:, 2, 2], [4.1, 4.2]))
+        self.assertTrue(np.allclose(traj.positions[1, 2], [0.22, 0.42, 0.62]))
+        self.assertTrue(np.allclose(traj.volumes, [16 * 4.1, 16 * 4.2]))
+
+
+class TestVasprunTrajectory(unittest.TestCase):
+
+    def test_read(self):
+        traj = read_trajectory('vasprun_md.xml', step=2)
+        self.assertEqual(traj.species, ['Si', 'O'])
+        self.assertEqual(traj.frames, [0, 2])
+        self.assertEqual(traj.positions.shape, (2, 2, 3))
+        self.assertTrue(np.allclose(traj.positions[1, 1], [0.5, 0.5, 0.54]))
+        self.assertTrue(np.allclose(traj.lattices[:, 2, 2], [5.0, 5.2]))
+        self.assertFalse(traj.constant_cell)
+        traj = read_trajectory('vasprun_md.xml', stop=1)
+        self.assertTrue(np.allclose(traj.positions[0, 0], [0.0, 0.0, 0.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os,sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'vasp'
+from .context import setUpModule
+from .context import LazyVasprun, sum_pdos
+
+
+class TestLazyVasprun(unittest.TestCase):
+
+    def test_sections(self):
+        vsr = LazyVasprun('vasprun.xml', parse_tdos=True, parse_pdos=True,
+                          parse_eigen=True, parse_dielectric=True)
+        self.assertEqual(vsr.atomic_symbols, ['Si', 'O'])
+        self.assertEqual(vsr.parameters['ISPIN'], 2)
+        self.assertFalse(vsr.parameters['LNONCOLLINEAR'])
+        self.assertTrue(vsr.is_spin)
+        # values of the last ionic step
+        self.assertAlmostEqual(vsr.efermi, 1.5)
+        self.assertEqual(vsr.kpoints.shape, (2, 3))
+        self.assertEqual(vsr.eigenvalues.shape, (2, 2, 3))
+        self.assertEqual(vsr.occupations.shape, (2, 2, 3))
+        self.assertEqual(vsr.tdos.shape, (2, 4))
+        self.assertEqual(vsr.idos.shape, (2, 4))
+        self.assertEqual(vsr.pdos.shape, (2, 2, 3, 4))
+        self.assertEqual(vsr.pdos_orbitals, ['s', 'py', 'pz'])
+        self.assertEqual(vsr.dielectric_real.shape, (6, 6))
+        self.assertEqual(vsr.dielectric_imag.shape, (6, 6))
+        self.assertAlmostEqual(vsr.final_structure.lattice.matrix[2][2], 5.02)
+
+    def test_selected_atoms(self):
+        full = LazyVasprun('vasprun.xml', parse_pdos=True)
+        vsr = LazyVasprun('vasprun.xml', parse_pdos=True, pdos_atoms=[1])
+        self.assertEqual(vsr.pdos_atoms, [1])
+        self.assertTrue(np.allclose(vsr.pdos[:, 0], full.pdos[:, 1]))
+        self.assertIsNone(vsr.tdos)
+        self.assertIsNone(vsr.eigenvalues)
+
+    def test_last_step(self):
+        vsr = LazyVasprun('vasprun.xml', parse_tdos=True, final_structure=False)
+        self.assertAlmostEqual(vsr.efermi, 1.5)
+
+    def test_band_properties(self):
+        eigen = np.array([[[-1.0, 0.5, 2.0], [-0.5, 0.2, 1.5]]])
+        occu = np.array([[[1.0, 1.0, 0.0], [1.0, 1.0, 0.0]]])
+        vsr = LazyVasprun.from_arrays('vasprun.xml', {}, {'eigenvalues': eigen,
+                                                          'occupations': occu})
+        (gap, cbm, vbm, is_direct) = vsr.eigenvalue_band_properties()
+        self.assertAlmostEqual(gap, 1.0)
+        self.assertAlmostEqual(cbm, 1.5)
+        self.assertAlmostEqual(vbm, 0.5)
+        self.assertFalse(is_direct)
+
+    def test_initial_structure(self):
+        vsr = LazyVasprun('vasprun.xml', final_structure=False)
+        self.assertAlmostEqual(vsr.initial_structure.lattice.matrix[2][2], 5.0)
+        self.assertIsNone(vsr.final_structure)
+        self.assertAlmostEqual(vsr.structure.lattice.matrix[2][2], 5.0)
+        self.assertIsNone(vsr.efermi)
+        vsr = LazyVasprun('vasprun.xml')
+        self.assertAlmostEqual(vsr.initial_structure.lattice.matrix[2][2], 5.0)
+        self.assertAlmostEqual(vsr.structure.lattice.matrix[2][2], 5.02)
+
+
+class TestSumPdos(unittest.TestCase):
+
+    def test_groups(self):
+        pdos = np.random.RandomState(0).rand(2, 4, 3, 5)
+        groups = [[3, 1], [0], [1, 2, 3]]
+        ret = sum_pdos(pdos, [0, 1, 2, 3], groups)
+        self.assertEqual(ret.shape, (3, 2, 3, 5))
+        for (i, group) in enumerate(groups):
+            self.assertTrue(np.allclose(ret[i], pdos[:, group].sum(axis=1)))
+
+    def test_selected_atoms(self):
+        pdos = np.random.RandomState(1).rand(1, 2, 3, 5)
+        ret = sum_pdos(pdos, [4, 7], [[7]])
+        self.assertTrue(np.allclose(ret[0, 0], pdos[0, 1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
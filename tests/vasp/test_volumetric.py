@@ -0,0 +1,239 @@
+import os,sys
+import io
+import shutil
+import itertools
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+__package__ = 'vasp'
+from .context import setUpModule
+from .context import fortran_float, format_grid_lines, write_grid
+from .context import read_volumetric
+from .context import load_volumetric, clear_cache, clean_cache
+from .context import write_output_cache
+from .context import parse_linear_expression, combine_volumetric
+
+
+def write_grid_ref(f, data):
+    '''
+    value by value writer, the reference output format
+    '''
+    a = data.shape
+    lines = []
+    count = 0
+    f.write("   {}   {}   {}\n".format(a[0], a[1], a[2]))
+    for (k, j, i) in itertools.product(range(a[2]), range(a[1]), range(a[0])):
+        lines.append(fortran_float(data[i, j, k]))
+        count += 1
+        if count % 5 == 0:
+            f.write(" " + "".join(lines) + "\n")
+            lines = []
+        else:
+            lines.append(" ")
+    f.write(" " + "".join(lines) + " \n")
+
+
+class TestFortranFloat(unittest.TestCase):
+    def test_value(self):
+        self.assertEqual(fortran_float(1.0), '0.10000000000E+01')
+        self.assertEqual(fortran_float(-0.0123), '-.12300000000E-01')
+        self.assertEqual(fortran_float(0.0), '0.00000000000E+01')
+
+    def test_lines(self):
+        ret = format_grid_lines(np.array([1.0, -2.0, 3.0, 0.0, 5.0e-20]))
+        self.assertEqual(ret, ' 0.10000000000E+01 -.20000000000E+01 0.30000000000E+01'
+                              ' 0.00000000000E+01 0.50000000000E-19\n')
+
+
+class TestWriteGrid(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(2020)
+        self.grids = []
+        for shape in [(3, 4, 5), (7, 3, 2), (6, 5, 4), (1, 1, 1)]:
+            data = rng.normal(size=shape) * 10.0**rng.randint(-30, 30, size=shape)
+            self.grids.append(data)
+        # exponents out of the fixed width range
+        self.grids.append(np.array([1e-99, 9.99999999999e98, 1.0, -2.0, 3.0]).reshape(5, 1, 1))
+
+    def test_identical(self):
+        for data in self.grids:
+            for chunk_size in [1, 7, 1048576]:
+                ref = io.StringIO()
+                ret = io.StringIO()
+                write_grid_ref(ref, data)
+                write_grid(ret, data, chunk_size=chunk_size)
+                self.assertEqual(ref.getvalue(), ret.getvalue())
+
+
+header = """unknown system
+   1.00000000000000
+     3.000000    0.000000    0.000000
+     0.000000    3.000000    0.000000
+     0.000000    0.000000    4.000000
+   Si
+     2
+Direct
+  0.000000  0.000000  0.000000
+  0.250000  0.250000  0.250000
+"""
+
+
+class TestReadVolumetric(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(2020)
+        self.total = rng.normal(size=(4, 5, 6))
+        self.diff = rng.normal(size=(4, 5, 6))
+        self.fname = 'CHGCAR_test'
+        with open(self.fname, 'w') as f:
+            f.write(header + ' \n')
+            write_grid(f, self.total)
+            f.write('augmentation occupancies   1  2\n  0.1 0.2\n')
+            f.write('   0.000   0.000\n')
+            write_grid(f, self.diff)
+            f.write('augmentation occupancies   1  2\n  0.3 0.4\n')
+
+    def tearDown(self):
+        os.remove(self.fname)
+        if os.path.exists('scratch'):
+            shutil.rmtree('scratch')
+
+    def test_read(self):
+        for chunk_lines in [1, 7, 65536]:
+            head, data, data_aug = read_volumetric(self.fname, chunk_lines=chunk_lines)
+            self.assertEqual(head, header)
+            self.assertEqual(data_aug, {})
+            self.assertTrue(np.allclose(data['total'], self.total, rtol=1e-10))
+            self.assertTrue(np.allclose(data['diff'], self.diff, rtol=1e-10))
+
+    def test_read_aug(self):
+        _, _, data_aug = read_volumetric(self.fname, read_aug=True)
+        self.assertEqual(data_aug['total'][1], '  0.1 0.2\n')
+        self.assertEqual(len(data_aug['diff']), 2)
+
+    def test_scratch(self):
+        _, data, _ = read_volumetric(self.fname, dtype=np.float32, scratch_dir='scratch')
+        self.assertEqual(data['total'].dtype, np.float32)
+        self.assertTrue(os.path.isfile(os.path.join('scratch', self.fname + '.1.npy')))
+        self.assertTrue(np.allclose(np.load(os.path.join('scratch', self.fname + '.1.npy')),
+                                    self.diff, rtol=1e-6))
+
+
+
+class TestVolumetricCache(unittest.TestCase):
+    def setUp(self):
+        self.total = np.random.RandomState(2020).normal(size=(4, 5, 6))
+        self.fname = 'CHG_test'
+        with open(self.fname, 'w') as f:
+            f.write(header + ' \n')
+            write_grid(f, self.total)
+
+    def tearDown(self):
+        os.remove(self.fname)
+        clear_cache(self.fname)
+
+    def test_cache(self):
+        head, data, _ = load_volumetric(self.fname)
+        self.assertTrue(os.path.isfile(self.fname + '.mpt/meta.json'))
+        head, data, _ = load_volumetric(self.fname)
+        self.assertIsInstance(data['total'], np.memmap)
+        self.assertEqual(head, header)
+        self.assertTrue(np.allclose(data['total'], self.total, rtol=1e-10))
+
+    def test_invalidate(self):
+        load_volumetric(self.fname)
+        with open(self.fname, 'w') as f:
+            f.write(header + ' \n')
+            write_grid(f, 2 * self.total)
+        os.utime(self.fname, (0, 0))
+        _, data, _ = load_volumetric(self.fname)
+        self.assertTrue(np.allclose(data['total'], 2 * self.total, rtol=1e-10))
+
+    def test_size_limit(self):
+        load_volumetric(self.fname, max_size=10)
+        self.assertFalse(os.path.exists(self.fname + '.mpt'))
+        load_volumetric(self.fname)
+        self.assertEqual(clean_cache('.'), [os.path.join('.', self.fname + '.mpt')])
+        self.assertFalse(os.path.exists(self.fname + '.mpt'))
+
+    def test_spin_size(self):
+        # two grids exceed the limit even though one does not
+        with open(self.fname, 'w') as f:
+            f.write(header + ' \n')
+            write_grid(f, self.total)
+            write_grid(f, self.total)
+        load_volumetric(self.fname, max_size=self.total.nbytes + 100)
+        self.assertFalse(os.path.exists(self.fname + '.mpt'))
+        _, data, _ = load_volumetric(self.fname, max_size=2 * self.total.nbytes + 100)
+        self.assertIsInstance(data['diff'], np.memmap)
+
+    def test_lru(self):
+        other = 'CHG_test_other'
+        shutil.copy(self.fname, other)
+        output = 'vasprun_test_lru.xml'
+        with open(output, 'w') as f:
+            f.write('<modeling/>')
+        try:
+            write_output_cache(output, 'vasprun', {}, {'a': np.zeros(1000)})
+            load_volumetric(other)
+            os.utime(other + '.mpt/meta.json', (0, 0))
+            _, data, _ = load_volumetric(self.fname, max_size=self.total.nbytes + 100)
+            # the older volumetric cache is removed, the output cache and
+            # the returned one are kept
+            self.assertFalse(os.path.exists(other + '.mpt'))
+            self.assertTrue(os.path.isfile(output + '.mpt/meta.json'))
+            self.assertTrue(os.path.isfile(self.fname + '.mpt/meta.json'))
+            self.assertTrue(np.allclose(data['total'], self.total, rtol=1e-10))
+        finally:
+            for ii in [other, output]:
+                os.remove(ii)
+                clear_cache(ii)
+
+
+
+class TestCombineVolumetric(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(2020)
+        self.grids = [rng.normal(size=(4, 5, 6)) for ii in range(3)]
+        self.fnames = ['CHG_A', 'CHG_B', 'CHG_C']
+        for fname, grid in zip(self.fnames, self.grids):
+            with open(fname, 'w') as f:
+                f.write(header + ' \n')
+                write_grid(f, grid)
+
+    def tearDown(self):
+        for fname in self.fnames + ['Diff.vasp']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def test_parse(self):
+        self.assertEqual(parse_linear_expression('CHG_A - CHG_B - 0.5 * CHG_C'),
+                         [(1.0, 'CHG_A'), (-1.0, 'CHG_B'), (-0.5, 'CHG_C')])
+        self.assertEqual(parse_linear_expression('-CHG_A + 2*CHG_B'),
+                         [(-1.0, 'CHG_A'), (2.0, 'CHG_B')])
+        with self.assertRaises(RuntimeError):
+            parse_linear_expression('CHG_A CHG_B')
+        with self.assertRaises(RuntimeError):
+            parse_linear_expression('CHG_A - - CHG_B')
+        with self.assertRaises(RuntimeError):
+            parse_linear_expression('CHG_A -')
+
+    def test_combine(self):
+        terms = parse_linear_expression('CHG_A - CHG_B - 0.5*CHG_C')
+        for chunk_lines in [1, 7, 65536]:
+            combine_volumetric(terms, 'Diff.vasp', chunk_lines=chunk_lines)
+            head, data, _ = read_volumetric('Diff.vasp')
+            self.assertEqual(head, header)
+            ref = self.grids[0] - self.grids[1] - 0.5 * self.grids[2]
+            self.assertTrue(np.allclose(data['total'], ref, atol=1e-9))
+
+    def test_mismatch(self):
+        with open('CHG_C', 'w') as f:
+            f.write(header + ' \n')
+            write_grid(f, np.zeros((4, 5, 5)))
+        with self.assertRaises(RuntimeError):
+            combine_volumetric([(1.0, 'CHG_A'), (-1.0, 'CHG_C')], 'Diff.vasp')
+
+
+if '__main__' == __name__:
+    unittest.main()